@@ -0,0 +1,257 @@
+# Offline benchmarks for the Hypixel stats path. Saved plancke and
+# hystats pages are loaded from FIXTURES and every stage (parsing,
+# numbers, the comparison table, embeds, rendering, hystats data) is
+# timed for groups of players, so runs on different hardware or library
+# versions can be compared.
+#
+#     python benchmark.py record <username> [<username> ...]
+#     python benchmark.py run [--sizes 1 4 16 64] [--seconds 1] [--output file.json]
+#
+# record is the only part that goes online. A few made-up players are
+# committed in FIXTURES, so run works without recording anything. Groups
+# bigger than the number of recorded players reuse the fixtures in turn.
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import hypixel
+import matrix
+import metrics
+import mojang
+import throttle
+
+FIXTURES = 'data/fixtures/hypixel'
+RESULTS = 'data/benchmarks'
+
+SIZES = [1, 4, 16, 64]
+
+# Every stage runs at least this many times, and then until it has run
+# for --seconds
+MIN_RUNS = 5
+
+
+def fixture_path(*parts):
+    return os.path.join(FIXTURES, *parts)
+
+
+def record(usernames):
+    '''Save the Mojang profile, plancke page and hystats page of each
+    username to FIXTURES.
+    '''
+    os.makedirs(fixture_path('plancke'), exist_ok=True)
+    os.makedirs(fixture_path('hystats'), exist_ok=True)
+
+    try:
+        with open(fixture_path('players.json')) as file:
+            profiles = {x['id']: x for x in json.load(file)}
+    except FileNotFoundError:
+        profiles = {}
+
+    for i in range(0, len(usernames), mojang.PROFILE_BATCH_SIZE):
+        for profile in mojang.get_uuid_from_player(usernames[i:i + mojang.PROFILE_BATCH_SIZE]):
+            uuid = profile['id']
+            pages = [
+                ('plancke', f'https://plancke.io/hypixel/player/stats/{uuid}'),
+                ('hystats', f'https://hystats.net/player/bedwars/{uuid}')
+            ]
+
+            for folder, url in pages:
+                with open(fixture_path(folder, f'{uuid}.html'), 'w') as file:
+                    file.write(throttle.SCHEDULER.get(url).text)
+
+            profiles[uuid] = {'id': uuid, 'name': profile['name']}
+            print(f'Recorded {profile["name"]}')
+
+    with open(fixture_path('players.json'), 'w') as file:
+        json.dump(list(profiles.values()), file, indent=2)
+
+
+def load_fixtures():
+    '''Returns a list of (profile, plancke page, hystats page or None).
+    '''
+    with open(fixture_path('players.json')) as file:
+        profiles = json.load(file)
+
+    fixtures = []
+    for profile in profiles:
+        with open(fixture_path('plancke', f'{profile["id"]}.html')) as file:
+            plancke_page = file.read()
+
+        try:
+            with open(fixture_path('hystats', f'{profile["id"]}.html')) as file:
+                hystats_page = file.read()
+        except FileNotFoundError:
+            hystats_page = None
+
+        fixtures.append((profile, plancke_page, hystats_page))
+
+    return fixtures
+
+
+def group(fixtures, size):
+    return [fixtures[i % len(fixtures)] for i in range(size)]
+
+
+def bedwars_players(fixtures):
+    # Fresh players with their page already downloaded, so get_stats
+    # does all of the parsing
+    players = []
+    for profile, plancke_page, hystats_page in fixtures:
+        player = hypixel.BedwarsPlayer.from_profile(profile)
+        player.plancke_page = plancke_page
+        players.append(player)
+
+    return players
+
+
+def parsed_players(fixtures):
+    players = bedwars_players(fixtures)
+    for player in players:
+        player.get_numbers()
+
+    return players
+
+
+def hystats_players(fixtures):
+    players = []
+    for profile, plancke_page, hystats_page in fixtures:
+        if hystats_page is None:
+            continue
+
+        player = hypixel.HystatsBedwarsPlayer.from_profile(profile)
+        player.hystats_page = hystats_page
+        players.append(player)
+
+    return players
+
+
+def get_stats(players):
+    for player in players:
+        player.plancke_panels = None
+        player.stats = None
+        player.get_stats()
+
+
+def get_numbers(players):
+    for player in players:
+        player.numbers = None
+        player.get_numbers()
+
+
+def get_monthly_data(players):
+    # Parses each saved hystats page again, without going online
+    for player in players:
+        player.registered = None
+        player.get_monthly_data()
+
+
+# Each stage is (name, setup, function). setup is called once with the
+# group's fixtures and is not timed, function is timed with what setup
+# returned.
+STAGES = [
+    ('get_stats', bedwars_players, get_stats),
+    ('get_numbers', parsed_players, get_numbers),
+    ('stat_table', parsed_players, lambda players: hypixel.stat_table(players, sort_by=0)),
+    ('build_embed', parsed_players, lambda players: [hypixel.build_embed(x) for x in players]),
+    ('Table.__str__', lambda x: hypixel.stat_table(parsed_players(x), sort_by=0), matrix.Table.__str__),
+    ('hystats', hystats_players, get_monthly_data)
+]
+
+
+def measure(setup, function, fixtures, seconds):
+    argument = setup(fixtures)
+
+    times = []
+    while len(times) < MIN_RUNS or sum(times) < seconds:
+        start = time.perf_counter()
+        function(argument)
+        times.append(time.perf_counter() - start)
+
+    # Memory is measured in a separate run, tracemalloc slows everything
+    # down too much to time with it on
+    tracemalloc.start()
+    function(argument)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'runs': len(times),
+        'ops_per_sec': round(len(times) / sum(times), 2),
+        'p50_ms': round(statistics.median(times) * 1000, 3),
+        'p99_ms': round(metrics.percentile(times, 0.99) * 1000, 3),
+        'peak_kib': round(peak / 1024, 1)
+    }
+
+
+def run(sizes, seconds):
+    fixtures = load_fixtures()
+
+    results = {}
+    for name, setup, function in STAGES:
+        results[name] = {}
+        for size in sizes:
+            results[name][str(size)] = measure(setup, function, group(fixtures, size), seconds)
+
+    return {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'fixtures': len(fixtures),
+        'results': results
+    }
+
+
+def summary(report):
+    table = matrix.Table(just='right')
+    table.append(['stage', 'players', 'ops/sec', 'p50 ms', 'p99 ms', 'peak KiB'])
+    for name, sizes in report['results'].items():
+        for size, result in sizes.items():
+            table.append([name, size, result['ops_per_sec'], result['p50_ms'], result['p99_ms'], result['peak_kib']])
+
+    return str(table)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Hypixel stats path offline.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = commands.add_parser('record', help='save fixtures for some players (needs the internet)')
+    record_parser.add_argument('usernames', nargs='+')
+
+    run_parser = commands.add_parser('run', help='time every stage against the saved fixtures')
+    run_parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='group sizes to time')
+    run_parser.add_argument('--seconds', type=float, default=1, help='minimum time spent on each stage and size')
+    run_parser.add_argument('--output', help=f'where to write the JSON results (default: a new file in {RESULTS})')
+
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        record(args.usernames)
+        return
+
+    if not os.path.exists(fixture_path('players.json')):
+        sys.exit(f'No fixtures in {FIXTURES}, save some with: python benchmark.py record <username> ...')
+
+    report = run(args.sizes, args.seconds)
+    print(summary(report))
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS, exist_ok=True)
+        output = os.path.join(RESULTS, f'{report["date"].replace(":", "-")}.json')
+
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+
+    print(f'\nWrote {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+# In-memory cache with a time to live, a size limit and
+# stale-while-revalidate refreshing
+
+import asyncio
+import sys
+import time
+from collections import OrderedDict
+
+import metrics
+
+
+def sizeof(obj):
+    '''Approximate memory used by obj, following dicts, lists and tuples.
+    '''
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(sizeof(key) + sizeof(value) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(map(sizeof, obj))
+
+    return size
+
+
+class TTLCache:
+    '''Least recently used cache limited to max_size bytes (as measured by
+    getsizeof). Entries are fresh for ttl seconds. After that they are
+    stale for stale_ttl more seconds: get still returns them, but starts
+    a refresh in the background. Older entries are dropped.
+
+    Hits, stale hits, misses, evictions and refreshes are counted in
+    metrics under the cache's name.
+    '''
+
+    def __init__(self, name, ttl, stale_ttl=0, max_size=1024 * 1024, getsizeof=sizeof):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_size = max_size
+        self.getsizeof = getsizeof
+
+        self.entries = OrderedDict()
+        self.size = 0
+        self.refreshing = set()
+        self.loading = {}
+
+        metrics.gauge(f'{name}.entries', lambda: len(self.entries))
+        metrics.gauge(f'{name}.bytes', lambda: self.size)
+
+    def count(self, event):
+        metrics.increment(f'{self.name}.{event}')
+
+    def remove(self, key):
+        value, size, stored = self.entries.pop(key)
+        self.size -= size
+
+    def lookup(self, key):
+        '''Returns (value, fresh) for key, or None if it is not cached.
+        '''
+        entry = self.entries.get(key)
+        if entry is None:
+            self.count('misses')
+            return None
+
+        value, size, stored = entry
+        age = time.monotonic() - stored
+        if age > self.ttl + self.stale_ttl:
+            self.remove(key)
+            self.count('misses')
+            return None
+
+        self.entries.move_to_end(key)
+
+        if age <= self.ttl:
+            self.count('hits')
+            return value, True
+
+        self.count('stale_hits')
+        return value, False
+
+    def set(self, key, value):
+        if key in self.entries:
+            self.remove(key)
+
+        size = self.getsizeof(value)
+        if size > self.max_size:
+            return
+
+        self.entries[key] = (value, size, time.monotonic())
+        self.size += size
+
+        while self.size > self.max_size:
+            self.remove(next(iter(self.entries)))
+            self.count('evictions')
+
+    async def get(self, key, loader):
+        '''Returns the value for key. loader is a coroutine function that
+        loads the value; it is awaited on a miss, and run in the
+        background when the cached value is stale. Concurrent misses for
+        the same key share one call to loader.
+        '''
+        found = self.lookup(key)
+        if found is None:
+            future = self.loading.get(key)
+            if future is None:
+                future = asyncio.ensure_future(self.load(key, loader))
+                self.loading[key] = future
+            else:
+                self.count('coalesced')
+
+            return await asyncio.shield(future)
+
+        value, fresh = found
+        if not fresh and key not in self.refreshing:
+            self.refreshing.add(key)
+            asyncio.ensure_future(self.refresh(key, loader))
+
+        return value
+
+    async def load(self, key, loader):
+        try:
+            value = await loader()
+            self.set(key, value)
+            return value
+        finally:
+            del self.loading[key]
+
+    async def refresh(self, key, loader):
+        try:
+            self.set(key, await loader())
+            self.count('refreshes')
+        except Exception as err:
+            self.count('refresh_errors')
+            print(f'Could not refresh {key} in {self.name}: {err!r}')
+        finally:
+            self.refreshing.discard(key)
@@ -1,9 +1,5 @@
 #!/usr/bin/python3
 
-# Workaround to prevent errors with grequests
-from gevent import monkey as curious_george
-curious_george.patch_all(thread=False, select=False)
-
 import asyncio
 import datetime
 import json
@@ -32,7 +28,7 @@ class ChamosBot(discord.Client):
         if message.content.startswith('>bw'):
             parameters = message.content.split()[1:]
             usernames = [x for x in parameters if x[0] != '-']
-            table = hypixel.get_bedwars_table(usernames)
+            table = await hypixel.get_bedwars_table(usernames)
             table_message = await message.channel.send(f'```{table}```')
             
             rxns = ['1️⃣', '2️⃣', '3️⃣', '4️⃣']
@@ -50,7 +46,7 @@ class ChamosBot(discord.Client):
                 pass
             else:
                 gamemode = gamemodes[rxns.index(str(reaction.emoji))]
-                new_table = hypixel.get_bedwars_table(usernames, gamemode=gamemode)
+                new_table = await hypixel.get_bedwars_table(usernames, gamemode=gamemode)
                 await table_message.edit(content=f'```{new_table}```')
 
             log(f'Sent table for {" ".join(usernames)}')
@@ -58,7 +54,7 @@ class ChamosBot(discord.Client):
         elif message.content.startswith('>sw'):
             parameters = message.content.split()[1:]
             usernames = [x for x in parameters if x[0] != '-']
-            table = hypixel.get_bedwars_table(usernames, stat_class=hypixel.SkywarsPlayer)
+            table = await hypixel.get_bedwars_table(usernames, stat_class=hypixel.SkywarsPlayer)
             table_message = await message.channel.send(f'```{table}```')
 
             log(f'Sent SkyWars table for {" ".join(usernames)}')
@@ -66,17 +62,27 @@ class ChamosBot(discord.Client):
         elif message.content.startswith('>fkdr'):
             parameters = message.content.split()[1:]
             usernames = [x for x in parameters if x[0] != '-']
-            players = [hypixel.HystatsBedwarsPlayer(x) for x in usernames]
-            await message.channel.send('\n'.join([x.get_yesterday_fkdr() for x in players]))
+            messages = await hypixel.get_fkdr_messages(usernames)
+            await message.channel.send('\n'.join(messages))
         
         elif message.content.startswith('>skin'):
             parameters = message.content.split()[1:]
             usernames = [x for x in parameters if x[0] != '-']
             players = [minecraft.PlayerSkin(x) for x in usernames]
+            await minecraft.PlayerSkin.resolve_all(tools.get_session(), players)
 
             for player in players:
+                if player.error is not None:
+                    await message.channel.send(hypixel.error_message(player.id, player.error))
+                    continue
+
                 rxn = '📁'
-                current = await message.channel.send(player.get_full())
+                if minecraft.SKIN_ATTACHMENTS:
+                    path = await player.get_full_file(tools.get_session())
+                    current = await message.channel.send(file=discord.File(path, filename=f'{player.username}.png'))
+                else:
+                    current = await message.channel.send(player.get_full())
+
                 await current.add_reaction(rxn)
 
                 def check(reaction, user):
@@ -88,8 +94,14 @@ class ChamosBot(discord.Client):
                 except asyncio.TimeoutError:
                     pass
                 else:
-                    new_link = player.get_download()
-                    await current.edit(content=new_link)
+                    if minecraft.SKIN_ATTACHMENTS:
+                        # Attachments cannot be swapped by editing, so the
+                        # skin file is sent as a reply
+                        path = await player.get_download_file(tools.get_session())
+                        await message.channel.send(file=discord.File(path, filename=f'{player.username}_skin.png'))
+                    else:
+                        new_link = player.get_download()
+                        await current.edit(content=new_link)
             
         elif message.content.startswith('>art'):
             await message.channel.send('https://cdn.discordapp.com/attachments/688748355702095900/717805575395868772/sun_2.png')
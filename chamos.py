@@ -1,7 +1,3 @@
-# Workaround to prevent errors with grequests
-from gevent import monkey as curious_george
-curious_george.patch_all(thread=False, select=False)
-
 import json
 
 import discord
@@ -22,6 +18,7 @@ async def on_ready():
     bot.help_command.cog = cbc.Support()
     activity = discord.Activity(name='>help', type=discord.ActivityType.listening)
     await bot.change_presence(activity=activity)
+    bot.get_cog('Splatoon').start_announcements(bot)
 
 
 @bot.event
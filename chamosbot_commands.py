@@ -1,17 +1,23 @@
+import asyncio
 import datetime
-import json
 import random
 import re
-import statistics
+import time
 import uuid
 
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 
 import chess
 import hypixel
 import iksm
+import match_history
+import metrics
+import rotation_subscriptions
+import salmon_history
+import splatnet_cookies
 import splatoon
+import splatoon_data
 import tools
 
 class Support(commands.Cog):
@@ -29,18 +35,35 @@ class Bedwars(commands.Cog):
     '''Commands for Minecraft Hypixel Bedwars.
     '''
 
+    def __init__(self):
+        self.snapshot_players.start()
+
+    @tasks.loop(minutes=15)
+    async def snapshot_players(self):
+        await hypixel.snapshot_tracked_players()
+
     @commands.command(aliases=['bw'])
     async def bedwars(self, ctx, *usernames):
         '''Get Bedwars table with stats for each username.
         '''
 
         async with ctx.channel.typing():
-            table = hypixel.get_bedwars_table(usernames)
+            table = await hypixel.get_bedwars_table(usernames)
             if isinstance(table, discord.Embed):
                 await ctx.channel.send(embed=table)
                 return
             await ctx.channel.send(f'```{table}```')
 
+    @commands.command()
+    async def fkdr(self, ctx, *usernames):
+        '''Get recent FKDR, KDR and WLR for each username.
+        '''
+
+        async with ctx.channel.typing():
+            messages = await hypixel.get_fkdr_messages(usernames)
+            for chunk in tools.split_message('\n\n'.join(messages)):
+                await ctx.channel.send(chunk)
+
 
 class Splatoon(commands.Cog):
     '''Commands for Splatoon 2
@@ -54,6 +77,111 @@ class Splatoon(commands.Cog):
         'zones': 'splat_zones'
     }
 
+    # Stages and rulesets need this many battles to count as a user's best
+    BEST_MIN_BATTLES = 5
+
+    # New rotations are announced this many seconds after the last one ends
+    ANNOUNCE_DELAY = 1
+
+    def __init__(self):
+        self.refresh_cookies.start()
+
+        # Set by start_announcements once the bot is connected
+        self.bot = None
+        # start_stamp of the last rotation announced
+        self.announced = None
+
+    @tasks.loop(minutes=10)
+    async def refresh_cookies(self):
+        splatnet_cookies.COOKIES.refresh_due(splatoon.get_splatnet_session())
+
+    def start_announcements(self, bot):
+        # Called from on_ready, since announcements need the bot to find
+        # the subscribed channels
+        self.bot = bot
+        if not self.announce_rotations.is_running():
+            self.announce_rotations.start()
+
+    @tasks.loop(seconds=0)
+    async def announce_rotations(self):
+        # Sleeps until the current rotation ends, then posts the new one to
+        # every subscribed channel. The schedule is cached with the coming
+        # rotations in it, so this costs no SplatNet requests of its own.
+        try:
+            await splatoon.SCHEDULE_CACHE.get()
+        except Exception as err:
+            print(f'Could not get the schedule for announcements: {err!r}')
+            await asyncio.sleep(splatoon.REFRESH_RETRY)
+            return
+
+        await asyncio.sleep(max(0, splatoon.SCHEDULE_CACHE.expires - time.time()) + self.ANNOUNCE_DELAY)
+
+        try:
+            await self.announce(await splatoon.SCHEDULE_CACHE.get_index())
+        except Exception as err:
+            print(f'Could not announce the new rotation: {err!r}')
+
+    async def announce(self, index):
+        now = datetime.datetime.now()
+        current = [x for x in index.items if x.start <= now]
+        if len(current) == 0 or current[0].start_stamp == self.announced:
+            return
+
+        self.announced = current[0].start_stamp
+
+        # Each embed is made once and sent to every subscription with the
+        # same filters
+        embeds = {}
+        sends = []
+        for subscription in rotation_subscriptions.get_all():
+            channel = self.bot.get_channel(subscription['channel_id'])
+            if channel is None:
+                metrics.increment('splatoon.announcements.missing_channels')
+                continue
+
+            filters = tuple(subscription[x] for x in rotation_subscriptions.FILTERS)
+            if filters not in embeds:
+                found = set(index.search(*filters))
+                blocks = [x for x in current if x in found]
+                embeds[filters] = None if len(blocks) == 0 else self.rotation_embed('New Rotation', blocks)
+
+            if embeds[filters] is not None:
+                sends.append(channel.send(embed=embeds[filters]))
+
+        results = await asyncio.gather(*sends, return_exceptions=True)
+        errors = [x for x in results if isinstance(x, Exception)]
+        for err in errors:
+            print(f'Could not announce the new rotation: {err!r}')
+
+        metrics.increment('splatoon.announcements.sent', len(results) - len(errors))
+        metrics.increment('splatoon.announcements.errors', len(errors))
+
+    def rotation_embed(self, title, blocks):
+        # An embed with the ruleset and stages of each ScheduleItem in
+        # blocks, which are all in the same rotation
+        stage_formatting = {
+            'include_gamemode': True,
+            'include_ruleset': True,
+            'include_stage': True,
+            'include_time': False,
+            'return_sentence': False
+        }
+
+        stage_strings = splatoon.stages_notification(blocks, **stage_formatting)
+        remaining_time = blocks[0].end - datetime.datetime.now()
+
+        embed = discord.Embed(title=title, description=f'{tools.format_delta(remaining_time, "hm")} remaining', color=random.choice(splatoon.COLORS))
+        [embed.add_field(name=mode, value=details, inline=True) for mode, details in [x.split(': ') for x in stage_strings]]
+        return embed
+
+    def split_filters(self, args):
+        # The game modes and rulesets in args, and the words left over
+        keys = [self.aliases.get(x, x) for x in args]
+        gamemodes = set(x for x in keys if x in splatoon_data.GAMEMODES)
+        rulesets = set(x for x in keys if x in splatoon_data.RULESETS)
+        words = [x for x, key in zip(args, keys) if key not in gamemodes | rulesets]
+        return gamemodes, rulesets, words
+
     @commands.command()
     async def stages(self, ctx, *args):
         '''Get current Splatoon 2 stages.
@@ -70,46 +198,52 @@ class Splatoon(commands.Cog):
         rainmaker: pick out rainmaker
         blitz: pick out clam blitz
         tower: pick out tower control
+
+        STAGES
+        Any other words are the name of a stage, and pick out rotations on
+        that stage. Partial and misspelled names work too.
         '''
 
+        start = time.monotonic()
+        warm = splatoon.SCHEDULE_CACHE.ready()
+
         async with ctx.channel.typing():
-            schedule = splatoon.get_schedule_objects()
+            index = await splatoon.SCHEDULE_CACHE.get_index()
 
             if len(args) == 0:
-                keys = map(lambda x: x['id'], splatoon.GAMEMODES)
-
-                stage_formatting = {
-                    'include_gamemode': True,
-                    'include_ruleset': True,
-                    'include_stage': True,
-                    'include_time': False,
-                    'return_sentence': False
-                }
-
-                current_stage_strings = splatoon.stages_notification([schedule[x][0] for x in keys], **stage_formatting)
-                remaining_time = schedule['regular'][0].end - datetime.datetime.now()
+                keys = splatoon_data.GAMEMODES.ids()
+
+                # A game mode can be missing from the schedule, like
+                # right after a Splatfest or when SplatNet answers oddly
+                schedules = [index.search(gamemodes=[x]) for x in keys]
+                current = [x[0] for x in schedules if len(x) > 0]
+                if len(current) == 0:
+                    await ctx.channel.send('The schedule is empty right now. Please try again later.')
+                    return
 
-                embed = discord.Embed(title='Current Rotation', description=f'{tools.format_delta(remaining_time, "hm")} remaining', color=random.choice(splatoon.COLORS))
-                [embed.add_field(name=mode, value=details, inline=True) for mode, details in [x.split(': ') for x in current_stage_strings]]
-                await ctx.channel.send(embed=embed)
+                await ctx.channel.send(embed=self.rotation_embed('Current Rotation', current))
+                self.observe_stages(start, warm)
 
             else:
-                schedule = splatoon.combine_gamemodes(schedule)
-                keys = [self.aliases.get(x, x) for x in args]
+                gamemodes, rulesets, words = self.split_filters(args)
 
-                stage_formatting = {
-                    'include_gamemode': True,
-                    'include_ruleset': True,
-                    'include_stage': True,
-                    'include_time': True,
-                    'return_sentence': False
-                }
+                # Anything else is the name of a stage
+                stages = []
+                stage_name = ' '.join(words)
+                if len(stage_name) > 0:
+                    stage = index.find_stage(stage_name)
+                    if stage is None:
+                        await ctx.channel.send(f'No stage matches "{stage_name}".')
+                        return
 
-                if len(gamemodes := set(['regular', 'gachi', 'league']) & set(keys)) > 0:
-                    schedule = splatoon.search_schedule(lambda x: x.gamemode[1], *gamemodes, schedule_=schedule)
+                    stages.append(stage)
 
-                if len(rulesets := set(['turf_war', 'splat_zones', 'tower_control', 'rainmaker', 'clam_blitz']) & set(keys)):
-                    schedule = splatoon.search_schedule(lambda x: x.ruleset[1], *rulesets, schedule_=schedule)
+                schedule = index.search(gamemodes, rulesets, stages)
+
+                if len(schedule) == 0 and len(stages) > 0:
+                    name = splatoon_data.STAGES.get(stages[0], {'name': stage_name})['name']
+                    await ctx.channel.send(f'{name} is not in the current schedule with those filters.')
+                    return
 
                 if len(schedule) == 0:
                     await ctx.channel.send('No results found. Please try making your request less specific by removing filters.')
@@ -130,15 +264,64 @@ class Splatoon(commands.Cog):
                 stage_strings = map(make_stage_strings, schedule)
 
                 embed = discord.Embed(title='Upcoming Stages', color=random.choice(splatoon.COLORS))
-                [embed.add_field(name=mode, value=details, inline=True) for mode, details in stage_strings]
+                [embed.add_field(name=mode, value=details, inline=True) for mode, details in list(stage_strings)[:25]]
+
+                if len(stages) > 0 and (upcoming := index.next_rotation(stages[0], rulesets, gamemodes)) is not None:
+                    embed.description = f'Next on {index.stages[stages[0]]}: {upcoming.start_string()}'
 
                 await ctx.channel.send(embed=embed)
+                self.observe_stages(start, warm)
+
+    @commands.command()
+    @commands.guild_only()
+    @commands.has_permissions(manage_channels=True)
+    async def subscribe(self, ctx, *args):
+        '''Post every new Splatoon 2 rotation in this channel.
+        args is optional filters, the same as >stages, so only rotations you care about are posted.
+        Stage names pick out your favourite stages; separate several with commas, e.g. >subscribe ranked moray, inkblot
+        Each server can have one subscribed channel. Subscribing again replaces it.
+        '''
+
+        gamemodes, rulesets, words = self.split_filters(args)
+        index = await splatoon.SCHEDULE_CACHE.get_index()
+
+        stages = set()
+        for name in [x.strip() for x in ' '.join(words).split(',') if x.strip() != '']:
+            stage = index.find_stage(name)
+            if stage is None:
+                await ctx.channel.send(f'No stage matches "{name}".')
+                return
+
+            stages.add(stage)
+
+        rotation_subscriptions.subscribe(ctx.guild.id, ctx.channel.id, gamemodes, rulesets, stages)
+
+        filters = [splatoon_data.GAMEMODES.get(x)['name'] for x in sorted(gamemodes)]
+        filters += [splatoon_data.RULESETS.get(x)['name'] for x in sorted(rulesets)]
+        filters += sorted(splatoon_data.STAGES.get(x, {'name': x})['name'] for x in stages)
+        await ctx.channel.send(f'New rotations will be posted here{"" if len(filters) == 0 else " for " + ", ".join(filters)}.')
+
+    @commands.command()
+    @commands.guild_only()
+    @commands.has_permissions(manage_channels=True)
+    async def unsubscribe(self, ctx):
+        '''Stop posting new Splatoon 2 rotations in this server.
+        '''
+
+        if rotation_subscriptions.unsubscribe(ctx.guild.id):
+            await ctx.channel.send('New rotations will not be posted anymore.')
+        else:
+            await ctx.channel.send('This server is not subscribed to new rotations. See `>help subscribe` for more details.')
+
+    def observe_stages(self, start, warm):
+        # Time taken by >stages, split by whether the schedule was cached
+        metrics.observe(f'splatoon.stages.{"warm" if warm else "cold"}', time.monotonic() - start)
 
     @commands.command(aliases=['sr', 'salmon'])
     async def salmonrun(self, ctx):
         '''Get Salmon Run schedule.
         '''
-        salmon_schedule = splatoon.get_salmon_schedule()
+        salmon_schedule = await splatoon.SALMON_SCHEDULE_CACHE.get()
 
         weapons = {str(x['start_time']): [y['weapon' if 'weapon' in y.keys() else 'coop_special_weapon']['name'] for y in x['weapons']] for x in salmon_schedule['details']}
         schedule = [splatoon.GenericScheduleItem(x) for x in salmon_schedule['schedules']]
@@ -162,6 +345,32 @@ class Splatoon(commands.Cog):
 
         await ctx.channel.send(embed=embed)
 
+    async def fetch_users(self, ctx, user_ids, path, read=None):
+        # Gets path from SplatNet for every user in user_ids, or for the
+        # author if there are none, all at once. Returns the users it
+        # worked for (see splatoon.fetch_for_users), or None after saying
+        # why it worked for nobody.
+        if len(user_ids) == 0:
+            user_ids = [ctx.author.id]
+
+        user_data, unregistered_users, failed = await splatoon.fetch_for_users(path, user_ids, read)
+        for uid, err in failed.items():
+            print(f'Could not get {path} for {uid}: {err!r}')
+
+        if len(user_data) == 0 and len(failed) > 0 and all(isinstance(x, iksm.CookieError) for x in failed.values()):
+            await ctx.channel.send('Could not log in to SplatNet. Please try again later, or link your account again with `>register`.')
+            return None
+
+        if len(user_data) == 0 and len(failed) > 0:
+            await ctx.channel.send('SplatNet did not answer. Please try again later.')
+            return None
+
+        if len(user_data) == 0:
+            await ctx.channel.send('None of the given users have linked their accounts with chamosbot. See `>help register` for more details.')
+            return None
+
+        return user_data
+
     @commands.command()
     async def register(self, ctx):
         '''Receive a Nintendo login link through DM's to link your Nintendo account to your Discord account.
@@ -182,61 +391,65 @@ class Splatoon(commands.Cog):
         args is multiple arguments separated by spaces. Each argument can be a:
         Discord user mention (@user): If the mentioned user has linked their Nintendo account to Discord
         Integer: The amount of games to count. The default is 5 if no number is given.
+        Every battle the bot has seen is kept, so this can be more than the 50 SplatNet keeps.
         '''
         mention_pattern = r'<@!?(\d+)>'
         mention_matches = [x for x in args if re.match(mention_pattern, x) is not None]
         user_ids = [int(re.match(mention_pattern, x).group(1)) for x in mention_matches]
 
         match_args = [x for x in args if x.isnumeric()]
-        match_count = 5 if len(match_args) == 0 else match_args[0]
-
-        if (aid := ctx.author.id) not in user_ids and len(user_ids) == 0:
-            user_ids.append(aid)
-
-        unregistered_users = []
-        user_data = []
-        for uid in user_ids:
-            data = iksm.get_user(uid)
-            if data is None:
-                unregistered_users.append(uid)
-                continue
-
-            user_data.append(dict(uid=uid, **data))
-
-        for i, data in enumerate(user_data):
-            if data.get('cookie', None) is None:
-                del user_data[i]
-                unregistered_users.append(data['uid'])
+        match_count = 5 if len(match_args) == 0 else int(match_args[0])
 
-        if len(user_data) == 0:
-            await ctx.channel.send('None of the given users have linked their accounts with chamosbot. See `>help register` for more details.')
+        user_data = await self.fetch_users(ctx, user_ids, '/api/results', splatoon.read_results)
+        if user_data is None:
             return
 
-        for i, user in enumerate(user_data):
-            results = splatoon.get_results(user)
-            results['matches'] = [splatoon.Match(x) for x in results['results']]
-            user_data[i]['results'] = results
+        for user in user_data:
+            match_history.ingest(user['uid'], user.pop('response'))
 
+        # Users with no battles stored yet get a dash in every cell
         async def get_form(x):
-            symbols = ''.join([x.symbol for x in x['results']['matches']])
-            text = symbols[:5]
-            streak_pattern = f'^{text[0]}+'
-            streak = len(re.search(streak_pattern, symbols).group())
-            return f'{text} ({streak}{text[0]} streak)'
+            history = match_history.get_user(x['uid'])
+            if history is None:
+                return '-'
+
+            text = ''.join(['W' if y == 'victory' else 'L' for y in match_history.recent(x['uid'], 5)])
+            return f'{text} ({history["streak"]}{history["streak_result"][0].upper()} streak)'
 
         async def get_usernames(x):
             return (await ctx.bot.fetch_user(int(x['uid']))).name
 
         async def get_favorite_weapon(x):
-            weapons = [x.weapon for x in x['results']['matches']]
-            mode = statistics.mode(weapons)
-            count = f'{weapons.count(mode)}/{len(weapons)}'
-            return f'{mode} ({count})'
+            history = match_history.get_user(x['uid'])
+            weapons = match_history.totals(x['uid'], 'weapon')
+            if history is None or len(weapons) == 0:
+                return '-'
+
+            weapon, battles, wins = weapons[0]
+            return f'{weapon} ({battles}/{history["battles"]})'
+
+        async def get_win_rate(x):
+            results = match_history.recent(x['uid'], match_count)
+            if len(results) == 0:
+                return '-'
+
+            return f'{results.count("victory") / len(results):.0%} of {len(results)}'
+
+        def get_best(x, kind, names):
+            # The stage or ruleset x has the best win rate on, out of the
+            # ones with at least BEST_MIN_BATTLES battles
+            played = [y for y in match_history.totals(x['uid'], kind) if y[1] >= self.BEST_MIN_BATTLES]
+            if len(played) == 0:
+                return '-'
+
+            key, battles, wins = max(played, key=lambda y: y[2] / y[1])
+            return f'{names.get(key, {"name": key})["name"]} ({wins / battles:.0%} of {battles})'
 
         rows = [
             ('', get_usernames),
             ('Current Form', get_form),
-            ('Favorite Weapon', get_favorite_weapon)
+            ('Favorite Weapon', get_favorite_weapon),
+            (f'Last {match_count} Win Rate', get_win_rate)
         ]
 
         if len(user_data) == 1:
@@ -245,6 +458,9 @@ class Splatoon(commands.Cog):
             for field, func in rows[1:]:
                 embed.add_field(name=field, value=(await func(user)), inline=True)
 
+            embed.add_field(name='Best Ruleset', value=get_best(user, 'ruleset', splatoon_data.RULESETS), inline=True)
+            embed.add_field(name='Best Stage', value=get_best(user, 'stage', splatoon_data.STAGES), inline=True)
+
             await ctx.channel.send(embed=embed)
             return
 
@@ -266,31 +482,12 @@ class Splatoon(commands.Cog):
         mention_matches = [x for x in args if re.match(mention_pattern, x) is not None]
         user_ids = [int(re.match(mention_pattern, x).group(1)) for x in mention_matches]
 
-        if (aid := ctx.author.id) not in user_ids and len(user_ids) == 0:
-            user_ids.append(aid)
-
-        unregistered_users = []
-        user_data = []
-        for uid in user_ids:
-            data = iksm.get_user(uid)
-            if data is None:
-                unregistered_users.append(uid)
-                continue
-
-            user_data.append(dict(uid=uid, **data))
-
-        for i, data in enumerate(user_data):
-            if data.get('cookie', None) is None:
-                del user_data[i]
-                unregistered_users.append(data['uid'])
-
-        if len(user_data) == 0:
-            await ctx.channel.send('None of the given users have linked their accounts with chamosbot. See `>help register` for more details.')
+        user_data = await self.fetch_users(ctx, user_ids, '/api/records', splatoon.read_records)
+        if user_data is None:
             return
 
-        for i, user in enumerate(user_data):
-            records = splatoon.get_records(user)
-            user_data[i]['ranks'] = splatoon.get_ranks(records)
+        for user in user_data:
+            user['ranks'] = splatoon.get_ranks(user.pop('response'))
 
         if len(user_data) == 1:
             # Only one user given, send pretty embed
@@ -323,9 +520,7 @@ class Splatoon(commands.Cog):
 
     @commands.command()
     async def salmonrank(self, ctx, *args):
-        '''IN DEVELOPMENT
-
-        Get Salmon Run ranks for users.
+        '''Get Salmon Run ranks for users.
         args is multiple arguments separated by spaces. Each argument must be a:
         Discord user mention (@user): If the mentioned user has linked their Nintendo account to Discord
         If multiple users are given, the response is formatted in a table with all of their ranks side-by-side.
@@ -336,32 +531,57 @@ class Splatoon(commands.Cog):
         mention_matches = [x for x in args if re.match(mention_pattern, x) is not None]
         user_ids = [int(re.match(mention_pattern, x).group(1)) for x in mention_matches]
 
-        if (aid := ctx.author.id) not in user_ids and len(user_ids) == 0:
-            user_ids.append(aid)
+        # New shifts are added to salmon_history as they are read, and the
+        # ranks come from the totals kept there
+        user_data = await self.fetch_users(ctx, user_ids, '/api/coop_results', splatoon.read_salmon_results)
+        if user_data is None:
+            return
 
-        unregistered_users = []
-        user_data = []
-        for uid in user_ids:
-            data = iksm.get_user(uid)
-            if data is None:
-                unregistered_users.append(uid)
-                continue
+        for user in user_data:
+            user['totals'] = salmon_history.get_user(user['uid'])
+
+        async def get_username(x):
+            return (await ctx.bot.fetch_user(int(x['uid']))).name
 
-            user_data.append(dict(uid=uid, **data))
+        def get_stat(func):
+            # Users with no shifts stored yet get a dash
+            return lambda x: '-' if x['totals'] is None else func(x['totals'])
 
-        for i, data in enumerate(user_data):
-            if data.get('cookie', None) is None:
-                del user_data[i]
-                unregistered_users.append(data['uid'])
+        def get_hazards(x):
+            lines = []
+            for bucket, shifts, cleared in salmon_history.hazards(x['uid']):
+                hazard = f'{bucket}%+' if bucket >= 200 else f'{bucket}-{bucket + salmon_history.HAZARD_BUCKET - 1}%'
+                lines.append(f'{hazard}: {cleared}/{shifts} cleared')
 
-        if len(user_data) == 0:
-            await ctx.channel.send('None of the given users have linked their accounts with chamosbot. See `>help register` for more details.')
+            return '\n'.join(lines) or '-'
+
+        rows = [
+            ('Grade', get_stat(lambda x: f'{x["grade"]} {x["grade_point"]}')),
+            ('Shifts', get_stat(lambda x: x['shifts'])),
+            ('Clear Rate', get_stat(lambda x: f'{x["cleared"] / x["shifts"]:.0%}')),
+            ('Avg Golden Eggs', get_stat(lambda x: f'{x["golden_eggs"] / x["shifts"]:.1f}')),
+            ('Avg Power Eggs', get_stat(lambda x: f'{x["power_eggs"] / x["shifts"]:.0f}')),
+            ('Avg Hazard', get_stat(lambda x: f'{x["hazard"] / x["shifts"]:.1f}%'))
+        ]
+
+        if len(user_data) == 1:
+            # Only one user given, send pretty embed
+            user = user_data[0]
+            embed = discord.Embed(title=(await get_username(user)), description='Salmon Run', color=random.choice(splatoon.COLORS))
+            for field, func in rows:
+                embed.add_field(name=field, value=func(user), inline=True)
+
+            embed.add_field(name='Hazard Levels', value=get_hazards(user), inline=False)
+
+            await ctx.channel.send(embed=embed)
             return
 
-        for i, user in enumerate(user_data):
-            results = splatoon.get_salmon_results(user)
-            with open('data/responses/salmon-results.json', 'w') as f:
-                f.write(json.dumps(results))
+        result = tools.Table(just='right')
+        result.append(['', *[(await get_username(x)) for x in user_data]])
+        for title, func in rows:
+            result.append([title, *[func(x) for x in user_data]])
+
+        await ctx.channel.send(f'```{str(result)}```')
 
 
 class Development(commands.Cog):
@@ -376,6 +596,22 @@ class Development(commands.Cog):
         result = tools.get_ip_address().split('.')[-1]
         await ctx.channel.send(result)
 
+    @commands.command()
+    async def metrics(self, ctx):
+        '''Show cache counters and other internal metrics.
+        '''
+
+        result = tools.Table(just='left')
+        for name, value in metrics.snapshot().items():
+            result.append([name, value])
+
+        if len(result) == 0:
+            await ctx.channel.send('No metrics recorded yet.')
+            return
+
+        for chunk in tools.split_message(str(result)):
+            await ctx.channel.send(f'```{chunk}```')
+
 
 class Chess(commands.Cog):
     '''Commands for chess.com
@@ -5,8 +5,10 @@ import re
 from bs4 import BeautifulSoup
 import requests
 
+import throttle
+
 def get_user_stats(username):
-    request = requests.get(f'https://api.chess.com/pub/player/{username}/stats')
+    request = throttle.SCHEDULER.get(f'https://api.chess.com/pub/player/{username}/stats')
 
     if request.status_code == 404:
         # Invalid user
@@ -0,0 +1,409 @@
+# Parser for the stat row mini-language used by hypixel.stat_table and
+# hypixel.build_embed. A row looks like
+#
+#     ^Overall.Wins$ / (^Overall.Wins$ + ^Overall.Losses$) #Win Rate
+#
+# where ^...$ is a stat (the dots walk into the stats dict), the rest
+# is plain arithmetic, and everything after the # is the label. Rows
+# containing a ! are not arithmetic: the stats are pasted into the
+# text, the !'s are removed, and the text is shown as-is.
+#
+# Rows are parsed once into a tree and evaluated against every player,
+# so no regex or eval runs per cell. For tables, the players' stats are
+# packed into a StatGrid and each row is evaluated for every player in
+# one pass over its columns.
+
+import math
+import operator
+import re
+from array import array
+
+import tools
+
+REFERENCE_PATTERN = r'\^[^^$]+\$'
+TOKEN_PATTERN = re.compile(rf'\s*(?:({REFERENCE_PATTERN})|(\d+\.?\d*|\.\d+)|(\S))')
+
+OPERATORS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv
+}
+
+
+NAN = float('nan')
+
+
+class InvalidStatError(ValueError):
+    pass
+
+
+class Number:
+    def __init__(self, value):
+        self.value = value
+
+    def evaluate(self, numbers):
+        return self.value
+
+    def evaluate_column(self, grid):
+        return array('d', [self.value]) * grid.size, array('b', [isinstance(self.value, int)]) * grid.size
+
+
+class Reference:
+    def __init__(self, name):
+        self.name = name
+        self.path = tuple(name.split('.'))
+
+    def evaluate(self, numbers):
+        data = numbers
+        for key in self.path:
+            data = data[key]
+
+        if data is None:
+            raise InvalidStatError(f'{self.name} is not a number')
+
+        return data
+
+    def evaluate_column(self, grid):
+        return grid.column(self.path)
+
+
+class Negative:
+    def __init__(self, operand):
+        self.operand = operand
+
+    def evaluate(self, numbers):
+        return -self.operand.evaluate(numbers)
+
+    def evaluate_column(self, grid):
+        values, ints = self.operand.evaluate_column(grid)
+        return array('d', [-x for x in values]), ints
+
+
+class BinaryOperation:
+    def __init__(self, symbol, left, right):
+        self.symbol = symbol
+        self.function = OPERATORS[symbol]
+        self.left = left
+        self.right = right
+
+    def evaluate(self, numbers):
+        return self.function(self.left.evaluate(numbers), self.right.evaluate(numbers))
+
+    def evaluate_column(self, grid):
+        # Missing stats are NaN, which carries through the arithmetic.
+        # Dividing by zero gives NaN too, instead of raising.
+        left, left_ints = self.left.evaluate_column(grid)
+        right, right_ints = self.right.evaluate_column(grid)
+
+        if self.symbol == '/':
+            values = array('d', [x / y if y else NAN for x, y in zip(left, right)])
+            return values, array('b', bytes(len(values)))
+
+        values = array('d', map(self.function, left, right))
+        return values, array('b', map(operator.and_, left_ints, right_ints))
+
+
+class Parser:
+    def __init__(self, text):
+        self.text = text
+        self.tokens = []
+        for match in TOKEN_PATTERN.finditer(text):
+            reference, number, symbol = match.groups()
+            if reference is not None:
+                self.tokens.append(('reference', reference[1:-1]))
+            elif number is not None:
+                self.tokens.append(('number', tools.parse_number(number)))
+            elif symbol is not None:
+                self.tokens.append(('symbol', symbol))
+
+        self.position = 0
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+
+        return (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def error(self):
+        return ValueError(f'Could not parse stat expression {self.text!r}')
+
+    def parse(self):
+        tree = self.expression()
+        if self.position != len(self.tokens):
+            raise self.error()
+
+        return tree
+
+    def expression(self):
+        tree = self.term()
+        while self.peek() in [('symbol', '+'), ('symbol', '-')]:
+            symbol = self.take()[1]
+            tree = BinaryOperation(symbol, tree, self.term())
+
+        return tree
+
+    def term(self):
+        tree = self.factor()
+        while self.peek() in [('symbol', '*'), ('symbol', '/')]:
+            symbol = self.take()[1]
+            tree = BinaryOperation(symbol, tree, self.factor())
+
+        return tree
+
+    def factor(self):
+        kind, value = self.take()
+        if kind == 'number':
+            return Number(value)
+        elif kind == 'reference':
+            return Reference(value)
+        elif (kind, value) == ('symbol', '-'):
+            return Negative(self.factor())
+        elif (kind, value) == ('symbol', '+'):
+            return self.factor()
+        elif (kind, value) == ('symbol', '('):
+            tree = self.expression()
+            if self.take() != ('symbol', ')'):
+                raise self.error()
+
+            return tree
+
+        raise self.error()
+
+
+class Row:
+    '''One parsed stat row.
+    label is the text after the #. If literal is True, the row is a !
+    row and evaluates to text, otherwise it evaluates to a number.
+    '''
+
+    def __init__(self, template):
+        expression, self.label = template.split('#')
+        self.literal = '!' in expression
+
+        if self.literal:
+            self.parts = re.split(f'({REFERENCE_PATTERN})', expression)
+            self.parts[1::2] = [Reference(x[1:-1]) for x in self.parts[1::2]]
+        else:
+            self.tree = Parser(expression).parse()
+
+    def evaluate(self, numbers, stats):
+        '''Evaluate the row for one player.
+        numbers is the player's stats passed through to_numbers, stats is
+        the original dict (only ! rows read it). Returns '-' when a stat
+        is not a number or the row divides by zero.
+        '''
+        if self.literal:
+            text = []
+            for part in self.parts:
+                if isinstance(part, Reference):
+                    part = tools.get_stat(stats, part.name)
+
+                text.append(part)
+
+            return ''.join(text).replace('!', '').rstrip()
+
+        try:
+            return self.tree.evaluate(numbers)
+        except (ZeroDivisionError, InvalidStatError):
+            return '-'
+
+    def evaluate_column(self, grid, datasets):
+        '''Evaluate the row for every player in grid at once. Returns a
+        Column, or a list of strings for ! rows (datasets is the list of
+        original stats dicts they read from).
+        '''
+        if self.literal:
+            return [self.evaluate(None, x) for x in datasets]
+
+        return Column(*self.tree.evaluate_column(grid))
+
+    # The Reference nodes in the row's tree. ! rows are read from the
+    # original stats, so they have none.
+    def references(self):
+        if self.literal:
+            return []
+
+        found = []
+        nodes = [self.tree]
+        while len(nodes) > 0:
+            node = nodes.pop()
+            if isinstance(node, Reference):
+                found.append(node)
+            elif isinstance(node, Negative):
+                nodes.append(node.operand)
+            elif isinstance(node, BinaryOperation):
+                nodes.extend([node.right, node.left])
+
+        return found
+
+
+class Column:
+    '''One row evaluated for every player. values holds the numbers (NaN
+    where the row has no value for a player) and ints says which of them
+    would have been ints in Python arithmetic, so they format the same
+    as Row.evaluate's results.
+    '''
+
+    def __init__(self, values, ints):
+        self.values = values
+        self.ints = ints
+
+    def render(self, order):
+        '''The formatted values of the players at the indexes in order.
+        '''
+        values = self.values
+        ints = self.ints
+        result = []
+        for i in order:
+            value = values[i]
+            if value != value:
+                # NaN
+                result.append('-')
+            elif ints[i]:
+                result.append('{:,}'.format(int(value)))
+            else:
+                result.append(tools.format_number(value))
+
+        return result
+
+    def argsort(self, reverse=False):
+        '''Player indexes in order of this row's values. Missing values
+        always go last and ties keep their order.
+        '''
+        sign = -1 if reverse else 1
+        values = self.values
+        return sorted(range(len(values)), key=lambda i: (math.isnan(values[i]), sign * values[i]))
+
+
+class StatGrid:
+    '''The stats read by a list of rows, for a list of players, packed into
+    one players x stats array of floats. numbers is a list of dicts from
+    to_numbers. Stats that are missing or not numbers are stored as NaN.
+    '''
+
+    def __init__(self, numbers, rows):
+        self.size = len(numbers)
+        self.offsets = {}
+        self.values = array('d')
+        self.ints = array('b')
+
+        for row in rows:
+            for reference in row.references():
+                if reference.path not in self.offsets:
+                    self.offsets[reference.path] = len(self.values)
+                    self.add(numbers, reference.path)
+
+    def add(self, numbers, path):
+        for player in numbers:
+            data = player
+            try:
+                for key in path:
+                    data = data[key]
+            except (KeyError, TypeError):
+                data = None
+
+            if data is None:
+                self.values.append(NAN)
+                self.ints.append(0)
+            else:
+                self.values.append(data)
+                self.ints.append(type(data) is int)
+
+    def column(self, path):
+        start = self.offsets[path]
+        end = start + self.size
+        return self.values[start:end], self.ints[start:end]
+
+
+def compile_rows(templates):
+    return [Row(x) for x in templates]
+
+
+def to_numbers(stats):
+    '''Copy of a stats dict with every value parsed into an int or float.
+    Values that are not numbers become None.
+    '''
+    result = {}
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            result[key] = to_numbers(value)
+        elif isinstance(value, (int, float)):
+            result[key] = value
+        else:
+            # Most stats are plain counts, which int reads much faster
+            # than parse_number
+            value = value.replace(',', '')
+            if value.isascii() and value.isdecimal():
+                result[key] = int(value)
+            else:
+                result[key] = tools.parse_number(value)
+
+    return result
+
+
+if __name__ == '__main__':
+    # Micro-benchmark: cells per second for a Bedwars table of a party
+    # and of a guild, comparing the old regex and eval path, the compiled
+    # rows evaluated per cell, and the columnar StatGrid path
+    import random
+    import sys
+    import timeit
+
+    import hypixel
+
+    def random_stats(seed):
+        rand = random.Random(seed)
+        modes = ['Solo', 'Doubles', '3v3v3v3', '4v4v4v4', '4v4', 'Core Modes', 'Overall']
+        keys = ['Kills', 'Deaths', 'K/D', 'Final Kills', 'Final Deaths', 'Final K/D', 'Wins', 'Losses', 'W/L', 'Beds Broken']
+        stats = {mode: {key: '{:,}'.format(rand.randint(0, 50000)) for key in keys} for mode in modes}
+        stats['Overall']['Level'] = '{:,}'.format(rand.randint(0, 1500))
+        return stats
+
+    templates = hypixel.BedwarsPlayer.rows(None)
+    rows = compile_rows(templates)
+
+    for size in [int(x) for x in sys.argv[1:]] or [10, 125]:
+        datasets = [random_stats(x) for x in range(size)]
+        cells = len(datasets) * len(templates)
+
+        def old():
+            table = [[stat.split('#')[1] for stat in templates]]
+            for dataset in datasets:
+                column = []
+                for stat in templates:
+                    plugged = re.sub(r'\^[^^$]+\.[^^$]+\$', lambda x: tools.get_stat(dataset, x[0][1:-1]), stat.split('#')[0])
+                    try:
+                        column.append(tools.format_number(eval(plugged)))
+                    except ZeroDivisionError:
+                        column.append('-')
+
+                table.append(column)
+
+            table[1:] = sorted(table[1:], key=lambda x: float(x[0].replace(',', '')), reverse=True)
+
+        def per_cell():
+            numbers = [to_numbers(x) for x in datasets]
+            table = []
+            for row in rows:
+                table.append([row.evaluate(numbers[i], datasets[i]) for i in range(len(datasets))])
+
+            order = sorted(range(len(datasets)), key=lambda i: table[0][i], reverse=True)
+            [[tools.format_number(x[i]) for i in order] for x in table]
+
+        def columnar():
+            grid = StatGrid([to_numbers(x) for x in datasets], rows)
+            columns = [row.evaluate_column(grid, datasets) for row in rows]
+            order = columns[0].argsort(reverse=True)
+            [x.render(order) for x in columns]
+
+        print(f'{size} players:')
+        for name, function in [('regex + eval', old), ('compiled', per_cell), ('columnar', columnar)]:
+            runs = max(1, 500 // size)
+            seconds = min(timeit.repeat(function, number=runs, repeat=3))
+            print(f'  {name}: {cells * runs / seconds:,.0f} cells/sec')
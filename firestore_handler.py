@@ -50,6 +50,15 @@ def update_document(collection, document, fields):
     return req.json()
 
 
+async def update_document_async(session, collection, document, fields):
+    path = f'projects/{PID}/databases/(default)/documents/{collection}/{document}'
+    update_mask = '&'.join([f'updateMask.fieldPaths={x}' for x in fields.keys()])
+    url = f'{BASE_PATH}/{path}?key={GKEY}&{update_mask}'
+
+    async with session.patch(url, json={'fields': fields}) as res:
+        return await res.json(content_type=None)
+
+
 def get_document(collection, document):
     path = f'projects/{PID}/databases/(default)/documents/{collection}/{document}'
     url = f'{BASE_PATH}/{path}?key={GKEY}'
@@ -58,6 +67,14 @@ def get_document(collection, document):
     return req.json()
 
 
+async def get_document_async(session, collection, document):
+    path = f'projects/{PID}/databases/(default)/documents/{collection}/{document}'
+    url = f'{BASE_PATH}/{path}?key={GKEY}'
+
+    async with session.get(url) as res:
+        return await res.json(content_type=None)
+
+
 def add_user_cookies(aid, data):
     fields = {key: {'stringValue': value} for key, value in data.items()}
     document = create_document('users', str(aid), fields)
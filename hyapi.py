@@ -1,19 +1,138 @@
-from gevent import monkey as curious_george
-curious_george.patch_all(thread=False, select=False)
-
+import asyncio
 import json
-import requests
+import time
+
+import metrics
+
+CONFIG = json.loads(open('credentials.json').read())
+API_KEY = CONFIG['apikey']
+
+# Extra keys can be listed under "apikeys" in credentials.json, requests
+# are spread across all of them
+API_KEYS = CONFIG.get('apikeys', [API_KEY])
+
+API_URL = 'https://api.hypixel.net'
+
+# How long to wait on a 429 that says neither when the quota resets nor
+# when to retry
+DEFAULT_RESET = 60
+
+
+class HypixelAPIError(Exception):
+    pass
+
+
+class KeyScheduler:
+    '''Chooses which API key each request uses, from the RateLimit-Remaining
+    and RateLimit-Reset headers of earlier responses. The key with the most
+    requests left is used first, ties go to the key with the fewest
+    requests in flight. When every key is used up, acquire waits for the
+    first one to reset instead of failing.
+    '''
+
+    def __init__(self, keys):
+        # remaining is None until a response has told us the quota
+        self.remaining = {key: None for key in keys}
+        self.resets = {key: 0 for key in keys}
+        self.in_flight = {key: 0 for key in keys}
+        self.waiting = 0
+
+    def pick(self):
+        now = time.monotonic()
+        best = None
+        best_score = (0, 0)
+        for key, remaining in self.remaining.items():
+            if remaining == 0 and self.resets[key] <= now:
+                remaining = self.remaining[key] = None
+
+            if remaining is None:
+                remaining = float('inf')
+
+            score = (remaining, -self.in_flight[key])
+            if remaining > 0 and (best is None or score > best_score):
+                best = key
+                best_score = score
+
+        return best
+
+    async def acquire(self):
+        while True:
+            key = self.pick()
+            if key is not None:
+                if self.remaining[key] is not None:
+                    self.remaining[key] -= 1
+
+                self.in_flight[key] += 1
+                return key
+
+            metrics.increment('hyapi.queued')
+            self.waiting += 1
+            try:
+                delay = min(self.resets.values()) - time.monotonic()
+                await asyncio.sleep(max(delay, 0.05))
+            finally:
+                self.waiting -= 1
+
+    def release(self, key):
+        self.in_flight[key] -= 1
+
+    def update(self, key, headers, status):
+        remaining = headers.get('RateLimit-Remaining')
+        reset = headers.get('RateLimit-Reset')
+
+        if remaining is not None:
+            self.remaining[key] = int(remaining)
+
+        if reset is not None:
+            self.resets[key] = time.monotonic() + int(reset)
+
+        if status == 429:
+            self.remaining[key] = 0
+            if reset is None:
+                retry_after = headers.get('Retry-After')
+                wait = int(retry_after) if retry_after is not None and retry_after.isdigit() else DEFAULT_RESET
+                self.resets[key] = time.monotonic() + wait
+
+
+SCHEDULER = KeyScheduler(API_KEYS)
+metrics.gauge('hyapi.waiting', lambda: SCHEDULER.waiting)
+
+
+async def get_player(session, uuid):
+    '''Returns the 'player' object from /player for uuid, or None if the
+    player has never joined Hypixel.
+    '''
+    while True:
+        key = await SCHEDULER.acquire()
+        try:
+            async with session.get(f'{API_URL}/player', params={'key': key, 'uuid': uuid}) as res:
+                SCHEDULER.update(key, res.headers, res.status)
+                metrics.increment(f'hyapi.status.{res.status}')
+                if res.status == 429:
+                    continue
+
+                data = await res.json(content_type=None)
+        finally:
+            SCHEDULER.release(key)
 
-import mojang
+        if not data.get('success', False):
+            raise HypixelAPIError(data.get('cause', f'Request failed with status {res.status}'))
 
-API_KEY = json.loads(open('credentials.json').read())['apikey']
+        return data['player']
 
 
-if __name__ == '__main__':
-    player = mojang.Player(input('Enter player name\n> '))
-    uuid = player.uuid
+def format_stats(counts, ratios):
+    '''Turns a dict of raw counts into strings formatted like plancke's
+    tables. ratios is a list of (name, numerator, denominator) tuples and
+    each ratio is added after its denominator.
+    '''
+    result = {}
+    for key, value in counts.items():
+        result[key] = '{:,}'.format(value)
+        for name, top, bottom in ratios:
+            if bottom == key:
+                ratio = counts[top] / counts[bottom] if counts[bottom] else counts[top]
+                result[name] = '{:,.2f}'.format(ratio)
 
-    url = f'https://api.hypixel.net/recentGames?key={API_KEY}&uuid={uuid}'
-    req = requests.get(url)
+    return result
 
-    print(req.text)
\ No newline at end of file
@@ -1,104 +1,132 @@
-from gevent import monkey as curious_george
-curious_george.patch_all(thread=False, select=False)
-
 import asyncio
 import datetime
 import json
 import re
 import sys
+import time
+import traceback
 from abc import ABC, abstractmethod
 
-import grequests
+import aiohttp
 import requests
-from bs4 import BeautifulSoup, SoupStrainer
 from discord import Embed as DiscordEmbed
+import cache
+import expressions
+import hyapi
 import matrix
 import mojang
+import name_history
+import plancke
+import snapshots
+import throttle
 import tools
 
-curious_george.patch_all(thread=False, select=False)
-
 API_KEY = json.loads(open('credentials.json').read())['apikey']
 
+# Where stats come from: 'plancke' scrapes plancke.io, 'api' reads the
+# official Hypixel API with the keys in hyapi. Set "stats-source" in
+# credentials.json to change it.
+STATS_SOURCE = hyapi.CONFIG.get('stats-source', 'plancke')
+
+# (stats, numbers) from get_stats and get_numbers, keyed by (uuid, game).
+# Fresh entries are used as-is, stale ones are shown while a new copy is
+# fetched.
+STATS_TTL = 5 * 60
+STATS_STALE_TTL = 30 * 60
+STATS_CACHE_SIZE = 4 * 1024 * 1024
+STATS_CACHE = cache.TTLCache('hypixel.stats', ttl=STATS_TTL, stale_ttl=STATS_STALE_TTL, max_size=STATS_CACHE_SIZE)
+
+# How many players the snapshot job fetches at once
+SNAPSHOT_CONCURRENCY = 4
+
+# How many players a command resolves and fetches at once
+FETCH_CONCURRENCY = 10
+
+# Errors that only stop the player they happened for (see error_message)
+PLAYER_ERRORS = (mojang.MinecraftUUIDError, mojang.MinecraftUsernameError, throttle.ThrottleTimeout,
+                 hyapi.HypixelAPIError, aiohttp.ClientError, asyncio.TimeoutError, ValueError)
+
+# What HystatsBedwarsPlayer.set_page reads from a hystats page, keyed by
+# uuid. Hystats only updates once a day.
+HYSTATS_TTL = 60 * 60
+HYSTATS_CACHE = cache.TTLCache('hystats.records', ttl=HYSTATS_TTL)
+
+HYSTATS_DATA_PATTERN = re.compile(r'monthlypvpdata = \[[^;]+;')
+HYSTATS_WAIT_PATTERN = re.compile(r'Note: We will first fetch your data in <b>(\d)min\(s\)')
+
 class HypixelUsernameError(mojang.MinecraftUsernameError):
     pass
 
 
+EMBED_MODES = [
+    'Core Modes', 'Solo', 'Doubles', '3v3v3v3', '4v4v4v4', 'Overall'
+]
+
+EMBED_FIELDS = expressions.compile_rows([
+    '^Wins$ #Wins', '^W/L$ #W/L', '^Kills$ #Kills', '^K/D$ #K/D',
+    '^Final Kills$ #Final Kills', '^Final K/D$ #Final K/D', '^Kills$ + ^Final Kills$ #Total Kills',
+    '^Beds Broken$ # Beds Broken'
+])
+
+
 def build_embed(player):
     stats = player.get_stats()
+    numbers = player.get_numbers()
 
     embed=DiscordEmbed(title=player.username, url=f"https://plancke.io/hypixel/player/stats/{player.uuid}", description=f"{stats['Overall']['Level']} stars")
 
-    modes = [
-        'Core Modes', 'Solo', 'Doubles', '3v3v3v3', '4v4v4v4', 'Overall'
-    ]
-
-    fields = [
-        '^Wins$ #Wins', '^W/L$ #W/L', '^Kills$ #Kills', '^K/D$ #K/D',
-        '^Final Kills$ #Final Kills', '^Final K/D$ #Final K/D', '^Kills$ + ^Final Kills$ #Total Kills',
-        '^Beds Broken$ # Beds Broken'
-    ]
-
-    for mode in modes:
-        current = stats[mode]
+    for mode in EMBED_MODES:
         rows = []
-        for field in fields:
-            stat, key = field.split('#')
-            plugged = re.sub(r'\^[^^$]+\$', lambda x: current[x.group()[1:-1]], stat)
-            evaluated = eval(plugged.replace(',', ''))
-            rows.append(f'{evaluated} {key}')
+        for field in EMBED_FIELDS:
+            evaluated = field.evaluate(numbers[mode], stats[mode])
+            rows.append(f'{evaluated} {field.label}')
 
         embed.add_field(name=mode, value='\n'.join(rows), inline=True)
 
     return embed
 
 
-def stat_table(players):
+def stat_table(players, sort_by=None):
+    # Builds the comparison table: one row per stat, one column per
+    # player. Every row is worked out for all players in one pass over a
+    # StatGrid, and numbers are only formatted once the table is built.
+    # If sort_by is the index of a row, players are sorted by it, highest
+    # first, with players missing that stat at the end.
     if issubclass(type(players), HypixelPlayer):
         players = [players]
     elif type(players) == type([]):
         pass
     else:
-        print(type(players))
         raise ValueError(f'players must be a HypixelPlayer or a list of HypixelPlayers. Got a {type(players)} instead')
 
     datasets = [x.get_stats() for x in players]
+    rows = players[0].compiled_rows()
 
-    result = matrix.Table(just='right')
-    result.append([''] + [x.username for x in players])
-
-    rows = players[0].rows()
-
-    for stat in rows:
-        row = []
+    grid = expressions.StatGrid([x.get_numbers() for x in players], rows)
+    columns = [row.evaluate_column(grid, datasets) for row in rows]
 
-        stat_name = stat.split('#')[1]
-        row.append(stat_name)
+    order = range(len(players))
+    if sort_by is not None and not rows[sort_by].literal:
+        order = columns[sort_by].argsort(reverse=True)
 
-        for i in range(len(players)):
-            dataset = datasets[i]
-
-            plugged = re.sub(r'\^[^^$]+\.[^^$]+\$', lambda x: tools.get_stat(dataset, x[0][1:-1]), stat.split('#')[0])
-
-            try:
-                value = tools.format_number(eval(plugged))
-            except ZeroDivisionError:
-                value = '-'
-            except SyntaxError:
-                if '!' in plugged:
-                    value = plugged.replace('!', '').rstrip()
-                else:
-                    value = '-'
-
-            row.append(value)
+    result = matrix.Table(just='right')
+    result.append([''] + [players[i].username for i in order])
 
-        result.append(row)
+    for row, column in zip(rows, columns):
+        if row.literal:
+            result.append([row.label] + [column[i] for i in order])
+        else:
+            result.append([row.label] + column.render(order))
 
     return result
 
 
 class HypixelPlayer(mojang.Player, ABC):
     plancke_page = None
+    plancke_panels = None
+    api_data = None
+    stats = None
+    numbers = None
 
     # All subclasses must have this method defined. It should return
     # the name of the game as it appears in the DOM of a plancke stat
@@ -107,6 +135,15 @@ class HypixelPlayer(mojang.Player, ABC):
     def game(self):
         return None
 
+    # self.rows() parsed by expressions.compile_rows. The result is kept
+    # on the class, so each subclass only parses its rows once.
+    def compiled_rows(self):
+        cls = type(self)
+        if '_compiled_rows' not in cls.__dict__:
+            cls._compiled_rows = expressions.compile_rows(self.rows())
+
+        return cls._compiled_rows
+
     # Called in self.get_stats. Some gamemodes have an extra table
     # row or something that needs to be adjusted, so this function
     # cleans up data later on. By default, it does not do anything.
@@ -114,15 +151,54 @@ class HypixelPlayer(mojang.Player, ABC):
         return table
 
     # Like self.clean_table, this method is called in self.get_stats
-    # to handle minigame-specific things. By default, it does nothing.
-    def add_stats(self, stats, soup, domid):
+    # to handle minigame-specific things. panel is the game's
+    # plancke.Panel. By default, it does nothing.
+    def add_stats(self, stats, panel):
         return stats
 
+    # Where a game's stats are in the Hypixel API: the name of its
+    # section of player.stats, plancke's mode names with the affix of
+    # their fields, (stat, field) pairs read for every mode, and the
+    # ratios worked out from them
+    api_game = None
+    api_modes = []
+    api_fields = []
+    api_ratios = []
+
+    # The name of field in the mode with the given affix
+    def api_field(self, affix, field):
+        return f'{field}{affix}'
+
+    # The raw count of each stat in each mode. source is the game's
+    # section of player.stats.
+    def api_counts(self, source):
+        counts = {}
+        for mode, affix in self.api_modes:
+            counts[mode] = {key: source.get(self.api_field(affix, field), 0) for key, field in self.api_fields}
+
+        return counts
+
+    # Used by self.get_stats instead of clean_table and add_stats when
+    # the stats come from the Hypixel API. data is the 'player' object
+    # from /player, and the result looks like the dict get_stats builds
+    # from plancke.
+    def api_stats(self, data):
+        if data is None:
+            raise HypixelUsernameError(f'{self.username} has never joined Hypixel')
+
+        source = data.get('stats', {}).get(self.api_game, {})
+        counts = self.api_counts(source)
+
+        return {mode: hyapi.format_stats(values, self.api_ratios) for mode, values in counts.items()}
+
     # Updates self.plancke_page
     def update_page(self):
         url = f'https://plancke.io/hypixel/player/stats/{self.uuid}'
-        req = requests.get(url)
+        req = throttle.SCHEDULER.get(url)
         self.plancke_page = req.text
+        self.plancke_panels = None
+        self.stats = None
+        self.numbers = None
     
     # Gets the user's plancke page if it is still None, then returns
     # the plancke page
@@ -132,22 +208,31 @@ class HypixelPlayer(mojang.Player, ABC):
         
         return self.plancke_page
 
+    # Gets the stat panels from the user's plancke page. Only this
+    # player's game is parsed, and parsing stops once it is found.
+    def get_panels(self):
+        if self.plancke_panels is None:
+            self.plancke_panels = plancke.parse_panels(self.get_page(), [self.game()])
+
+        return self.plancke_panels
+
+    # Parses the stats the first time it is called, later calls return
+    # the same dict until the page is updated. If self.api_data has been
+    # set, the stats come from there instead of plancke.
     def get_stats(self):
+        if self.stats is not None:
+            return self.stats
+
+        if self.api_data is not None:
+            self.stats = self.api_stats(self.api_data)
+            return self.stats
+
         game = self.game()
-        domid = f'stat_panel_{game}'
-
-        strainer = SoupStrainer('div', {'id': domid})
-        soup = BeautifulSoup(self.get_page(), 'html.parser', parse_only=strainer)
-        stat_div = soup.find('div', {'id': domid})
-        stat_table = stat_div.findChild('table')
-
-        table = []
-        for row in [x for x in stat_table.descendants if x.name == 'tr']:
-            cells = [x for x in row.strings if x != '\n']
-            if len(cells) == 0:
-                continue
-            
-            table.append(cells)
+        panel = self.get_panels().get(game)
+        if panel is None:
+            raise HypixelUsernameError(f'{self.username} does not have {game} stats on plancke')
+
+        table = [list(x) for x in panel.table if len(x) > 0]
         
         table = self.clean_table(table)
 
@@ -165,9 +250,18 @@ class HypixelPlayer(mojang.Player, ABC):
             
             stats[gamemode] = current
         
-        stats = self.add_stats(stats, soup, domid)
+        stats = self.add_stats(stats, panel)
+        self.stats = stats
 
         return stats
+
+    # self.get_stats() with every value parsed into a number, see
+    # expressions.to_numbers. Parsed once, like the stats.
+    def get_numbers(self):
+        if self.numbers is None:
+            self.numbers = expressions.to_numbers(self.get_stats())
+
+        return self.numbers
     
     def get_recent_games(self):
         url = f'https://api.hypixel.net/recentGames?key={API_KEY}&uuid={self.uuid}'
@@ -178,8 +272,25 @@ class HypixelPlayer(mojang.Player, ABC):
 
 
 class SkywarsPlayer(HypixelPlayer):
+    # Plancke's mode names and the suffix of their Hypixel API fields
+    api_game = 'SkyWars'
+    api_modes = [
+        ('Solo Normal', '_solo_normal'), ('Solo Insane', '_solo_insane'),
+        ('Team Normal', '_team_normal'), ('Team Insane', '_team_insane'),
+        ('Overall', '')
+    ]
+
+    api_fields = [
+        ('Kills', 'kills'), ('Deaths', 'deaths'), ('Wins', 'wins'), ('Losses', 'losses')
+    ]
+
+    api_ratios = [
+        ('K/D', 'Kills', 'Deaths'), ('W/L', 'Wins', 'Losses')
+    ]
+
     def game(self):
         return 'SkyWars'
+
     
     def rows(self):
         return ['^Solo Normal.Wins$ + ^Solo Insane.Wins$ #Solo Wins',
@@ -187,6 +298,25 @@ class SkywarsPlayer(HypixelPlayer):
 
 
 class BedwarsPlayer(HypixelPlayer):
+    # Plancke's mode names and the prefix of their Hypixel API fields
+    api_game = 'Bedwars'
+    api_modes = [
+        ('Solo', 'eight_one_'), ('Doubles', 'eight_two_'),
+        ('3v3v3v3', 'four_three_'), ('4v4v4v4', 'four_four_'),
+        ('4v4', 'two_four_'), ('Overall', '')
+    ]
+
+    api_fields = [
+        ('Kills', 'kills'), ('Deaths', 'deaths'),
+        ('Final Kills', 'final_kills'), ('Final Deaths', 'final_deaths'),
+        ('Wins', 'wins'), ('Losses', 'losses'), ('Beds Broken', 'beds_broken')
+    ]
+
+    api_ratios = [
+        ('K/D', 'Kills', 'Deaths'), ('Final K/D', 'Final Kills', 'Final Deaths'),
+        ('W/L', 'Wins', 'Losses')
+    ]
+
     def game(self):
         return 'BedWars'
     
@@ -204,18 +334,33 @@ class BedwarsPlayer(HypixelPlayer):
     def clean_table(self, table):
         return table[1:]
     
-    def add_stats(self, stats, soup, domid):
-        stat_div = soup.find('div', {'id': domid})
-        bw_list = stat_div.find('ul', class_='list-unstyled')
+    def add_stats(self, stats, panel):
         bw_level = 0
-        for li in bw_list.children:
-            if re.match('<li><b>Level:</b> [0-9,]+</li>', str(li)):
-                bw_level = re.search('[0-9,]+', str(li)).group()
+        for li in panel.list_items:
+            if re.match('<li><b>Level:</b> [0-9,]+</li>', li):
+                bw_level = re.search('[0-9,]+', li).group()
         
         stats['Overall']['Level'] = bw_level
 
         return stats
 
+    def api_field(self, affix, field):
+        return f'{affix}{field}_bedwars'
+
+    def api_counts(self, source):
+        counts = super().api_counts(source)
+
+        core = ['Solo', 'Doubles', '3v3v3v3', '4v4v4v4']
+        counts['Core Modes'] = {key: sum(counts[x][key] for x in core) for key, field in self.api_fields}
+
+        return counts
+
+    def api_stats(self, data):
+        stats = super().api_stats(data)
+        stats['Overall']['Level'] = '{:,}'.format(data.get('achievements', {}).get('bedwars_level', 0))
+
+        return stats
+
 
 class SoloBedwarsPlayer(BedwarsPlayer):
     def rows(self):
@@ -256,17 +401,38 @@ class FoursBedwarsPlayer(BedwarsPlayer):
 class HystatsBedwarsPlayer(mojang.Player):
     hystats_page = None
     registered = None
+    wait = None
+    monthly_data = None
+
+    # Parses everything get_yesterday_fkdr needs from a hystats page in
+    # one go: whether the player is registered, how many minutes until
+    # their first update if not, and the monthly data
+    def set_page(self, page):
+        self.hystats_page = page
+
+        search = HYSTATS_DATA_PATTERN.search(page)
+        self.registered = search is not None
+        self.monthly_data = None
+        self.wait = None
+
+        if search is not None:
+            self.monthly_data = tools.parse_monthly_data(search.group())
+        else:
+            wait = HYSTATS_WAIT_PATTERN.search(page)
+            if wait is not None:
+                self.wait = wait.group(1)
+
+    # What set_page found, as kept in HYSTATS_CACHE
+    def get_record(self):
+        return (self.registered, self.wait, self.monthly_data)
+
+    def set_record(self, record):
+        self.registered, self.wait, self.monthly_data = record
 
     def update_page(self):
         url = f'https://hystats.net/player/bedwars/{self.uuid}'
-        req = requests.get(url)
-        self.hystats_page = req.text
-
-        stat_search = re.search(r'monthlypvpdata = \[[^;]+;', self.hystats_page)
-        if stat_search is not None:
-            self.registered = True
-        else:
-            self.registered = False
+        req = throttle.SCHEDULER.get(url)
+        self.set_page(req.text)
     
     def get_page(self):
         if self.hystats_page is None:
@@ -274,35 +440,29 @@ class HystatsBedwarsPlayer(mojang.Player):
         
         return self.hystats_page
 
+    # Parses hystats_page if it is already set, otherwise downloads it
     def get_monthly_data(self):
-        page = self.get_page()
-        data_pattern = r'monthlypvpdata = \[[^;]+;'
-        if re.search(data_pattern, page) is not None:
-            data = re.search(data_pattern, page).group()
-            return tools.parse_monthly_data(data)
+        if self.registered is None and self.hystats_page is not None:
+            self.set_page(self.hystats_page)
+        elif self.registered is None:
+            self.update_page()
+
+        return self.monthly_data
     
     def get_yesterday_fkdr(self):
         # Returns a two-item tuple, index 0 being the datetime for the day
         # during which the FKDR was taken, index 1 being the fkdr of the day
 
-        page = self.get_page()
+        data = self.get_monthly_data()
 
         if not self.registered:
-            page = self.get_page()
-            wait_pattern = r'Note: We will first fetch your data in <b>\dmin\(s\)'
-            wait_message = re.search(wait_pattern, page)
-            wait_string = None
-
-            if wait_message is not None:
-                wait_time = re.search(r'\d+', wait_message.group())
-                wait = wait_time.group()
-                wait_string = f' {self.username}\'s HyStats page will be updated in {wait} minutes. From there, it will be updated every 24 hours.'
+            if self.wait is not None:
+                wait_string = f' {self.username}\'s HyStats page will be updated in {self.wait} minutes. From there, it will be updated every 24 hours.'
             else:
                 wait_string = ''
 
             return f'{self.username} does not have data available on HyStats.{wait_string}'
 
-        data = self.get_monthly_data()
         try:
             date, fkdr = data[1][:2]
         except IndexError:
@@ -313,44 +473,167 @@ class HystatsBedwarsPlayer(mojang.Player):
         return f'On {date_string}, {self.username} had a {fkdr} FKDR.'
 
 
-def get_bedwars_table(usernames, gamemode=None, stat_class=None):
-    players = []
-    errors  = []
-    for username in usernames:
+def get_player_class(gamemode=None, stat_class=None):
+    if stat_class is not None:
+        return stat_class
+
+    classes = {
+        'eight_one': SoloBedwarsPlayer,
+        'eight_two': DoublesBedwarsPlayer,
+        'four_three': ThreesBedwarsPlayer,
+        'four_four': FoursBedwarsPlayer
+    }
+
+    return classes.get(gamemode, BedwarsPlayer)
+
+
+async def fetch_plancke_stats(session, player):
+    # Streams the player's plancke page through the panel parser while it
+    # downloads, stopping once the player's game has been read.
+    url = f'https://plancke.io/hypixel/player/stats/{player.uuid}'
+    game = player.game()
+
+    async def request():
+        async with session.get(url) as res:
+            return await plancke.parse_response(res, [game])
+
+    player.plancke_panels = await throttle.SCHEDULER.fetch(('GET', url, game), url, request)
+
+    player.stats = None
+    player.numbers = None
+    return player.get_stats()
+
+
+async def fetch_api_stats(session, player):
+    player.api_data = await hyapi.get_player(session, player.uuid)
+    player.stats = None
+    player.numbers = None
+    return player.get_stats()
+
+
+STATS_SOURCES = {
+    'plancke': fetch_plancke_stats,
+    'api': fetch_api_stats
+}
+
+
+async def fetch_stats(session, player):
+    # Returns (stats, numbers), the way STATS_CACHE keeps them
+    stats = await STATS_SOURCES[STATS_SOURCE](session, player)
+    numbers = player.get_numbers()
+    if player.game() == 'BedWars':
+        snapshots.record(player.uuid, player.username, numbers)
+
+    return stats, numbers
+
+
+async def load_player(session, player):
+    # Gives an already resolved player its stats, from STATS_CACHE if
+    # possible
+    key = (player.uuid, player.game())
+    player.stats, player.numbers = await STATS_CACHE.get(key, lambda: fetch_stats(session, player))
+
+    if player.game() == 'BedWars':
+        snapshots.seen(player.uuid, player.username)
+
+    return player
+
+
+async def fetch_hystats(session, player):
+    # Gives a HystatsBedwarsPlayer its parsed hystats page, from
+    # HYSTATS_CACHE if possible
+    url = f'https://hystats.net/player/bedwars/{player.uuid}'
+
+    async def request():
+        async with session.get(url) as res:
+            player.set_page(await res.text())
+            return player.get_record()
+
+    async def load():
+        return await throttle.SCHEDULER.fetch(('GET', url), url, request)
+
+    player.set_record(await HYSTATS_CACHE.get(player.uuid, load))
+    return player
+
+
+def error_message(username, err):
+    # What to tell the user when username could not be looked up
+    if isinstance(err, mojang.MinecraftUUIDError):
+        return f'{username} is too long to be a username, and it is not a valid UUID.'
+    elif isinstance(err, HypixelUsernameError):
+        # The username is real, there are just no stats to show
+        return f'{err}.'
+    elif isinstance(err, mojang.MinecraftUsernameError):
+        # Old and mistyped names can often be matched to someone the bot
+        # has seen before
+        suggestion = name_history.suggest(username)
+        if suggestion is not None:
+            return f'{username} is not a valid Minecraft username. Did you mean {suggestion}?'
+
+        return f'{username} is not a valid Minecraft username.'
+    elif isinstance(err, throttle.ThrottleTimeout):
+        return f'Too many requests right now, skipped {username}.'
+    elif isinstance(err, hyapi.HypixelAPIError):
+        return f'The Hypixel API turned down the request for {username}: {err}'
+    elif isinstance(err, (aiohttp.ClientError, asyncio.TimeoutError)):
+        return f'Could not reach the stats site for {username}, please try again later.'
+    elif isinstance(err, ValueError):
+        # json.JSONDecodeError and json_stream's errors, from a truncated
+        # or garbled response
+        return f'The stats site sent back an unreadable response for {username}, please try again later.'
+    else:
+        return f'Could not look up {username}.'
+
+
+async def for_each_player(session, players, function, limit=FETCH_CONCURRENCY):
+    # Resolves every player at once with mojang.Player.resolve_all, then
+    # calls function (a coroutine function) with each player that
+    # resolved, at most limit at a time. Returns a list of (result, error
+    # message) tuples in the order of players, where one of the two is
+    # None.
+    await mojang.Player.resolve_all(session, players)
+
+    semaphore = asyncio.Semaphore(limit)
+
+    async def load(player):
+        if player.error is not None:
+            return None, error_message(player.id, player.error)
+
         try:
-            if stat_class is not None:
-                players.append(stat_class(username))
-                continue
-
-            if gamemode == 'eight_one':
-                players.append(SoloBedwarsPlayer(username))
-            elif gamemode == 'eight_two':
-                players.append(DoublesBedwarsPlayer(username))
-            elif gamemode == 'four_three':
-                players.append(ThreesBedwarsPlayer(username))
-            elif gamemode == 'four_four':
-                players.append(FoursBedwarsPlayer(username))
-            else:
-                players.append(BedwarsPlayer(username))
+            async with semaphore:
+                return await function(player), None
+        except PLAYER_ERRORS as err:
+            return None, error_message(player.id, err)
+
+    return await asyncio.gather(*map(load, players))
+
+
+async def load_players(usernames, player_class):
+    # Creates every player, resolves them all in one step, then fetches
+    # their stats at the same time. Returns a list of players and a list
+    # of error messages, both in the order of usernames.
+    session = tools.get_session()
+    players = [player_class(x) for x in usernames]
+    results = await for_each_player(session, players, lambda x: load_player(session, x))
+    snapshots.flush()
 
-        except mojang.MinecraftUUIDError:
-            errors.append(f'{username} is too long to be a username, and it is not a valid UUID.')
-        except mojang.MinecraftUsernameError:
-            errors.append(f'{username} is not a valid Minecraft username.')
+    players = [player for player, error in results if player is not None]
+    errors = [error for player, error in results if error is not None]
 
+    return players, errors
 
-    urls = [f'https://plancke.io/hypixel/player/stats/{player.uuid}' for player in players]
-    reqs = (grequests.get(u) for u in urls)
-    ress = grequests.map(reqs)
 
-    for i in range(len(players)):
-        players[i].plancke_page = ress[i].text
+async def get_bedwars_table(usernames, gamemode=None, stat_class=None):
+    player_class = get_player_class(gamemode, stat_class)
+    players, errors = await load_players(usernames, player_class)
+
+    if len(players) == 0:
+        return '\n'.join(errors)
 
     if len(players) == 1:
         return build_embed(players[0])
 
-    table = stat_table(players)
-    table = tools.sort_table(table, 1)
+    table = stat_table(players, sort_by=0)
 
     result = str(table)
 
@@ -360,6 +643,83 @@ def get_bedwars_table(usernames, gamemode=None, stat_class=None):
     return result
 
 
+async def snapshot_tracked_players():
+    # Background job: fetches fresh Bedwars stats for every tracked
+    # player that is due a snapshot. fetch_stats records the snapshots,
+    # which are saved together at the end along with deleting the ones
+    # too old to be used.
+    session = tools.get_session()
+    semaphore = asyncio.Semaphore(SNAPSHOT_CONCURRENCY)
+
+    async def snapshot(uuid, username):
+        async with semaphore:
+            player = BedwarsPlayer.from_profile({'id': uuid, 'name': username})
+            try:
+                STATS_CACHE.set((uuid, player.game()), await fetch_stats(session, player))
+            except PLAYER_ERRORS as err:
+                print(f'Could not snapshot {username}: {err!r}')
+            except Exception:
+                # A bug, but it should not stop the other snapshots or
+                # the job
+                print(f'Unexpected error while snapshotting {username}:')
+                traceback.print_exc()
+
+    await asyncio.gather(*[snapshot(uuid, username) for uuid, username in snapshots.due_players()])
+    snapshots.flush()
+    snapshots.prune()
+
+
+def describe_changes(username, changes, now=None):
+    now = time.time() if now is None else now
+    periods = dict(snapshots.PERIODS)
+
+    lines = []
+    described = set()
+    for change in changes:
+        # A player tracked for less than a week has the same starting
+        # snapshot for the week and the month
+        if change['since'] in described:
+            continue
+
+        described.add(change['since'])
+
+        if change['since'] <= now - periods[change['period']]:
+            start = f'In the last {change["period"]}'
+        else:
+            since = datetime.datetime.fromtimestamp(change['since'])
+            start = f'Since {since.strftime("%B %-d, %-I:%M %p")}'
+
+        names = [('fkdr', 'FKDR'), ('kdr', 'KDR'), ('wlr', 'WLR')]
+        ratios = [f'{change[key]:,.2f} {name}' for key, name in names if change[key] is not None]
+        lines.append(f'{start}, {username} had a {tools.english_list(ratios)}.')
+
+    return '\n'.join(lines)
+
+
+async def get_fkdr_message(session, player):
+    # Answers from the local snapshot history. A player without enough
+    # history yet gets a snapshot now so they have some next time, and
+    # HyStats is asked instead.
+    profile = player.get_profile()
+    changes = snapshots.changes(profile['id'])
+    if len(changes) > 0:
+        snapshots.seen(profile['id'], profile['name'])
+        return describe_changes(profile['name'], changes)
+
+    hystats_player = HystatsBedwarsPlayer.from_profile(profile)
+    await asyncio.gather(load_player(session, BedwarsPlayer.from_profile(profile)), fetch_hystats(session, hystats_player))
+
+    return hystats_player.get_yesterday_fkdr()
+
+
+async def get_fkdr_messages(usernames):
+    session = tools.get_session()
+    players = [mojang.Player(x) for x in usernames]
+    results = await for_each_player(session, players, lambda x: get_fkdr_message(session, x))
+    snapshots.flush()
+    return [message if error is None else error for message, error in results]
+
+
 if __name__ == '__main__':
     while True:
         players = [BedwarsPlayer(x) for x in input('> ').split(' ')]
@@ -22,7 +22,6 @@ import firestore_handler as firestore
 
 session = requests.Session()
 version = "unknown"
-data_file = 'data/users/nintendo_keys.json'
 
 # place config.txt in same directory as script (bundled or not)
 if getattr(sys, 'frozen', False):
@@ -52,6 +51,15 @@ def save_user(aid, **kwargs):
 
 def get_user(aid):
     document = firestore.get_document('users', str(aid))
+    return parse_user(document)
+
+
+async def get_user_async(session, aid):
+    document = await firestore.get_document_async(session, 'users', str(aid))
+    return parse_user(document)
+
+
+def parse_user(document):
     result = {}
     try:
         for key, pair in document['fields'].items():
@@ -64,19 +72,17 @@ def get_user(aid):
     return result
 
 
-def update_users(new_data):
-    old_data = json.loads(open(data_file).read())
+def save_cookie(aid, cookie, issued):
+    # Saves a new iksm_session cookie and when it was issued (a unix time)
+    # where get_user reads it
+    fields = firestore.make_fields({'cookie': cookie, 'cookie_time': str(int(issued))})
+    return firestore.update_document('users', str(aid), fields)
 
-    for user, data in new_data.items():
-        for key, value in data.items():
-            try:
-                old_data[user][key] = value
-            except KeyError:
-                # Create new dict for user
-                old_data[user] = data
 
-    with open(data_file, 'w') as file_:
-        file_.write(json.dumps(old_data))
+async def save_cookie_async(http, aid, cookie, issued):
+    fields = firestore.make_fields({'cookie': cookie, 'cookie_time': str(int(issued))})
+    return await firestore.update_document_async(http, 'users', str(aid), fields)
+
 
 def log_in(ctx, ver='1.5.7'):
     '''Logs in to a Nintendo Account and returns a session_token.'''
@@ -157,6 +163,7 @@ def check_link(ctx, url):
 
     nickname, cookie = get_cookie(session_token)
     user_data['cookie'] = cookie
+    user_data['cookie_time'] = str(int(time.time()))
     user_data['nickname'] = nickname
 
     save_user(ctx.author.id, **user_data)
@@ -422,6 +429,140 @@ def call_flapg_api(id_token, guid, timestamp, type):
             pass
         sys.exit(1)
 
+class CookieError(Exception):
+    '''One of the steps of get_cookie_async failed.'''
+    pass
+
+
+async def get_cookie_async(http, session_token, userLang='en_US'):
+    '''Async version of get_cookie, using the aiohttp session http. Raises
+    CookieError instead of exiting when a step fails. http should not
+    keep cookies, or the last step can reuse another user's session.'''
+
+    timestamp = int(time.time())
+    guid = str(uuid.uuid4())
+
+    async def send(step, method, url, **kwargs):
+        async with http.request(method, url, **kwargs) as res:
+            text = await res.text()
+            try:
+                return json.loads(text), res
+            except ValueError:
+                raise CookieError(f'{step} answered {res.status}: {text[:200]}')
+
+    def get(response, step, *keys):
+        try:
+            for key in keys:
+                response = response[key]
+            return response
+        except (KeyError, TypeError):
+            raise CookieError(f'Unexpected answer from {step}: {json.dumps(response)[:200]}')
+
+    app_head = {
+        'Accept-Language': userLang,
+        'Accept':          'application/json',
+        'User-Agent':      'OnlineLounge/1.10.0 NASDKAPI Android'
+    }
+
+    body = {
+        'client_id':     '71b963c1b7b6d119', # Splatoon 2 service
+        'session_token': session_token,
+        'grant_type':    'urn:ietf:params:oauth:grant-type:jwt-bearer-session-token'
+    }
+
+    id_response, res = await send('api/token', 'POST', 'https://accounts.nintendo.com/connect/1.0.0/api/token', headers=app_head, json=body)
+    id_token = get(id_response, 'api/token', 'access_token')
+
+    # get user info
+    app_head = dict(app_head, Authorization=f'Bearer {id_token}')
+    user_info, res = await send('users/me', 'GET', 'https://api.accounts.nintendo.com/2.0.0/users/me', headers=app_head)
+    nickname = get(user_info, 'users/me', 'nickname')
+
+    # get access token
+    app_head = {
+        'Accept-Language':  userLang,
+        'User-Agent':       'com.nintendo.znca/1.10.0 (Android/7.1.2)',
+        'Accept':           'application/json',
+        'X-ProductVersion': '1.10.0',
+        'Authorization':    'Bearer',
+        'X-Platform':       'Android'
+    }
+
+    flapg_nso = await call_flapg_api_async(http, id_token, guid, timestamp, 'nso')
+    body = {
+        'parameter': {
+            'f':          get(flapg_nso, 'flapg', 'f'),
+            'naIdToken':  get(flapg_nso, 'flapg', 'p1'),
+            'timestamp':  get(flapg_nso, 'flapg', 'p2'),
+            'requestId':  get(flapg_nso, 'flapg', 'p3'),
+            'naCountry':  get(user_info, 'users/me', 'country'),
+            'naBirthday': get(user_info, 'users/me', 'birthday'),
+            'language':   get(user_info, 'users/me', 'language')
+        }
+    }
+
+    splatoon_token, res = await send('Account/Login', 'POST', 'https://api-lp1.znc.srv.nintendo.net/v1/Account/Login', headers=app_head, json=body)
+    access_token = get(splatoon_token, 'Account/Login', 'result', 'webApiServerCredential', 'accessToken')
+
+    # get splatoon access token
+    flapg_app = await call_flapg_api_async(http, access_token, guid, timestamp, 'app')
+    app_head = dict(app_head, Authorization=f'Bearer {access_token}')
+    body = {
+        'parameter': {
+            'id':                5741031244955648,
+            'f':                 get(flapg_app, 'flapg', 'f'),
+            'registrationToken': get(flapg_app, 'flapg', 'p1'),
+            'timestamp':         get(flapg_app, 'flapg', 'p2'),
+            'requestId':         get(flapg_app, 'flapg', 'p3')
+        }
+    }
+
+    splatoon_access_token, res = await send('Game/GetWebServiceToken', 'POST', 'https://api-lp1.znc.srv.nintendo.net/v2/Game/GetWebServiceToken', headers=app_head, json=body)
+
+    # get cookie
+    app_head = {
+        'X-IsAppAnalyticsOptedIn': 'false',
+        'Accept':                  'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+        'X-GameWebToken':          get(splatoon_access_token, 'Game/GetWebServiceToken', 'result', 'accessToken'),
+        'Accept-Language':         userLang,
+        'X-IsAnalyticsOptedIn':    'false',
+        'DNT':                     '0',
+        'User-Agent':              'Mozilla/5.0 (Linux; Android 7.1.2; Pixel Build/NJH47D; wv) AppleWebKit/537.36 (KHTML, like Gecko) Version/4.0 Chrome/59.0.3071.125 Mobile Safari/537.36',
+        'X-Requested-With':        'com.nintendo.znca'
+    }
+
+    async with http.get(f'https://app.splatoon2.nintendo.net/?lang={userLang}', headers=app_head) as res:
+        cookie = res.cookies.get('iksm_session')
+        if cookie is None:
+            raise CookieError(f'SplatNet answered {res.status} without a cookie')
+
+        return nickname, cookie.value
+
+async def call_flapg_api_async(http, id_token, guid, timestamp, type):
+    '''Async versions of get_hash_from_s2s_api and call_flapg_api.'''
+
+    api_app_head = {'User-Agent': 'splatnet2statink/{}'.format(version)}
+    api_body = {'naIdToken': id_token, 'timestamp': str(timestamp)}
+    async with http.post('https://elifessler.com/s2s/api/gen2', headers=api_app_head, data=api_body) as res:
+        try:
+            hash_ = json.loads(await res.text())['hash']
+        except (ValueError, KeyError):
+            raise CookieError(f'The s2s API answered {res.status}')
+
+    api_app_head = {
+        'x-token': id_token,
+        'x-time':  str(timestamp),
+        'x-guid':  guid,
+        'x-hash':  hash_,
+        'x-ver':   '3',
+        'x-iid':   type
+    }
+    async with http.get('https://flapg.com/ika2/api/login?public', headers=api_app_head) as res:
+        try:
+            return json.loads(await res.text())['result']
+        except (ValueError, KeyError):
+            raise CookieError(f'The flapg API answered {res.status}')
+
 def enter_cookie():
     '''Prompts the user to enter their iksm_session cookie'''
 
@@ -0,0 +1,374 @@
+# Incremental decoding of large JSON objects from SplatNet. Instead of
+# reading a whole response and decoding it in one go, the top-level
+# object is decoded as the body arrives, and each element of the arrays
+# asked for is handed over on its own, so the caller can keep the fields
+# it needs and let the rest go. Callers can also name the fields they
+# need (see fields), and everything else is dropped as soon as each
+# field or element is decoded.
+
+import codecs
+import json
+import re
+
+DECODER = json.JSONDecoder()
+WHITESPACE = ' \t\n\r'
+
+# What can come right after a complete value (or key)
+DELIMITERS = ',:]}' + WHITESPACE
+
+# Objects and arrays longer than this that are not all there yet are
+# scanned for their end instead of being decoded again every feed
+SCAN_AFTER = 64 * 1024
+
+# A whole string, a bracket, or a quote that starts a string that has not
+# ended yet
+TOKEN_PATTERN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[\[\]{}"]')
+
+
+def fields(*paths):
+    '''The fields to keep, from dotted paths like 'stage.id'. Paths go
+    through arrays as if they were not there, so 'results.stage.id' is the
+    stage id of every element of results. The result is a dict of field
+    names to True, for the whole value, or to a dict like this one.
+    '''
+    result = {}
+    for path in paths:
+        *parents, name = path.split('.')
+        node = result
+        for parent in parents:
+            if node.get(parent) is True:
+                break
+
+            node = node.setdefault(parent, {})
+        else:
+            node[name] = True
+
+    return result
+
+
+def select(value, spec):
+    '''The parts of the decoded JSON value named in spec (see fields).
+    '''
+    if spec is True:
+        return value
+
+    if isinstance(value, list):
+        return [select(x, spec) for x in value]
+
+    if isinstance(value, dict):
+        return {key: select(value[key], spec[key]) for key in spec if key in value}
+
+    return value
+
+
+class ObjectStream:
+    '''Feed it the text of a JSON object in pieces with feed. Every
+    top-level field comes out of feed as a (key, value) pair, except the
+    fields named in arrays, whose elements come out as (key, element)
+    pairs one at a time, as soon as each one is complete.
+
+    If fields is given (see fields), only the fields in it come out, with
+    only the parts of them it names, and the rest are dropped.
+    '''
+
+    def __init__(self, arrays=(), fields=None):
+        self.arrays = set(arrays)
+        self.fields = fields
+        self.buffer = ''
+        self.position = 0
+
+        # What comes next: 'start' ({), 'key', 'colon', 'value',
+        # 'element', 'element_end' (, or ]), 'field_end' (, or }) or 'done'
+        self.state = 'start'
+        self.key = None
+
+        # How far past position an object or array that did not fit in
+        # the buffer has been scanned, and how deep the scan is in it
+        self.scanned = 0
+        self.depth = 0
+
+    def skip_whitespace(self):
+        while self.position < len(self.buffer) and self.buffer[self.position] in WHITESPACE:
+            self.position += 1
+
+        return self.position < len(self.buffer)
+
+    def expect(self, characters):
+        character = self.buffer[self.position]
+        if character not in characters:
+            raise ValueError(f'Expected one of {characters!r} at {self.position}, got {character!r}')
+
+        self.position += 1
+        return character
+
+    def scan(self):
+        # Scans the text added to an unfinished object or array at
+        # position for its closing bracket, without decoding it. Returns
+        # True once it has arrived.
+        for match in TOKEN_PATTERN.finditer(self.buffer, self.position + self.scanned):
+            token = match.group()
+            if token == '"':
+                # Scanned again once the string has ended
+                self.scanned = match.start() - self.position
+                return False
+
+            if token == '[' or token == '{':
+                self.depth += 1
+            elif token == ']' or token == '}':
+                self.depth -= 1
+                if self.depth == 0:
+                    return True
+
+        self.scanned = len(self.buffer) - self.position
+        return False
+
+    def decode(self, spec=True):
+        # The JSON value at position, with only the fields in spec, or
+        # None if it is not complete yet. A value must be followed by a
+        # delimiter, so a number cut off in the buffer (1. before 5, or
+        # 1.5 before e3) is not taken for a shorter one.
+        #
+        # An object or array longer than SCAN_AFTER that is not all there
+        # is scanned as more text arrives and only decoded again once it
+        # has ended, so a large one is not decoded over and over. Smaller
+        # ones are quicker to just decode again.
+        if self.scanned > 0 and not self.scan():
+            return None
+
+        try:
+            value, end = DECODER.raw_decode(self.buffer, self.position)
+        except json.JSONDecodeError:
+            if self.scanned > 0:
+                raise
+
+            if self.buffer[self.position] in '[{' and len(self.buffer) - self.position > SCAN_AFTER:
+                self.depth = 0
+                if self.scan():
+                    raise
+
+            return None
+
+        self.scanned = 0
+
+        if end >= len(self.buffer) or self.buffer[end] not in DELIMITERS:
+            return None
+
+        self.position = end
+        return (select(value, spec),)
+
+    def spec(self):
+        # What to keep of the current field: True for all of it, a dict
+        # for some of it, or None to drop it
+        if self.fields is None:
+            return True
+
+        return self.fields.get(self.key)
+
+    def feed(self, text):
+        '''Adds text to what has been read so far. Returns the (key, value)
+        pairs it completed.
+        '''
+        self.buffer = self.buffer[self.position:] + text
+        self.position = 0
+
+        result = []
+        while self.skip_whitespace():
+            if self.state == 'start':
+                self.expect('{')
+                self.state = 'key'
+
+            elif self.state == 'key':
+                if self.buffer[self.position] == '}':
+                    self.position += 1
+                    self.state = 'done'
+                    continue
+
+                found = self.decode()
+                if found is None:
+                    break
+
+                self.key = found[0]
+                self.state = 'colon'
+
+            elif self.state == 'colon':
+                self.expect(':')
+                self.state = 'value'
+
+            elif self.state == 'value':
+                spec = self.spec()
+                if spec is None:
+                    # Decoded to find where it ends, then dropped
+                    if self.decode() is None:
+                        break
+
+                    self.state = 'field_end'
+                    continue
+
+                if self.key in self.arrays and self.buffer[self.position] == '[':
+                    self.position += 1
+                    self.state = 'element'
+                    continue
+
+                found = self.decode(spec)
+                if found is None:
+                    break
+
+                result.append((self.key, found[0]))
+                self.state = 'field_end'
+
+            elif self.state == 'element':
+                if self.buffer[self.position] == ']':
+                    self.position += 1
+                    self.state = 'field_end'
+                    continue
+
+                found = self.decode(self.spec())
+                if found is None:
+                    break
+
+                result.append((self.key, found[0]))
+                self.state = 'element_end'
+
+            elif self.state == 'element_end':
+                self.state = 'element' if self.expect(',]') == ',' else 'field_end'
+
+            elif self.state == 'field_end':
+                self.state = 'key' if self.expect(',}') == ',' else 'done'
+
+            else:
+                raise ValueError(f'Unexpected data after the end of the object at {self.position}')
+
+        return result
+
+    def close(self):
+        if self.state != 'done' or self.buffer[self.position:].strip() != '':
+            raise ValueError('The JSON object ended early')
+
+
+async def iter_object(response, arrays=(), fields=None, chunk_size=16 * 1024):
+    '''Yields the (key, value) pairs of an ObjectStream fed with the body
+    of the aiohttp response.
+    '''
+    stream = ObjectStream(arrays, fields)
+
+    # Characters split between chunks are decoded once the rest arrives
+    decoder = codecs.getincrementaldecoder(response.charset or 'utf-8')()
+    async for chunk in response.content.iter_chunked(chunk_size):
+        for pair in stream.feed(decoder.decode(chunk)):
+            yield pair
+
+    for pair in stream.feed(decoder.decode(b'', final=True)):
+        yield pair
+
+    stream.close()
+
+
+async def load(response, fields, arrays=()):
+    '''Like response.json(), but only decodes fields (see fields). The
+    arrays named are read one element at a time as the body arrives, so
+    their text is never all in memory at once. Other fields are held
+    whole until they end. The arrays are always in the result, empty if
+    the response has none.
+    '''
+    result = {x: [] for x in arrays}
+    async for key, value in iter_object(response, arrays, fields):
+        if key in arrays:
+            result[key].append(value)
+        else:
+            result[key] = value
+
+    return result
+
+
+if __name__ == '__main__':
+    # Benchmark: time and peak memory to get what >results keeps from an
+    # /api/results response, decoding all of it with json.loads versus
+    # streaming only the fields match_history reads. The response is made
+    # up, with the same shape and about the same size as SplatNet's.
+    import random
+    import time
+    import tracemalloc
+
+    import match_history
+
+    rand = random.Random(0)
+
+    def gear(kind):
+        skill = {'id': str(rand.randint(0, 14)), 'name': 'Ink Saver (Main)', 'image': '/images/skill/' + 'a' * 40 + '.png'}
+        return {
+            kind: {'id': str(rand.randint(0, 9999)), 'name': 'Squid Hairclip', 'kind': kind, 'rarity': 2,
+                   'image': '/images/gear/' + 'b' * 40 + '.png', 'thumbnail': '/images/gear/' + 'c' * 40 + '.png',
+                   'brand': {'id': '1', 'name': 'Zink', 'image': '/images/brand/' + 'd' * 40 + '.png'}},
+            f'{kind}_skills': {'main': skill, 'subs': [skill, skill, None]}
+        }
+
+    def player():
+        result = {
+            'nickname': 'player', 'principal_id': '%016x' % rand.getrandbits(64), 'player_rank': rand.randint(1, 99),
+            'star_rank': 0, 'udemae': {'name': 'S+', 'number': 11, 's_plus_number': rand.randint(0, 9), 'is_x': False},
+            'weapon': {'id': str(rand.randint(0, 5000)), 'name': rand.choice(['Splattershot', 'N-ZAP \'85', 'Splat Roller']),
+                       'image': '/images/weapon/' + 'e' * 40 + '.png', 'thumbnail': '/images/weapon/' + 'f' * 40 + '.png',
+                       'sub': {'id': '1', 'name': 'Suction Bomb', 'image_a': 'g' * 50, 'image_b': 'h' * 50},
+                       'special': {'id': '2', 'name': 'Ink Armor', 'image_a': 'i' * 50, 'image_b': 'j' * 50}},
+            'player_type': {'style': 'girl', 'species': 'inklings'}
+        }
+        for kind in ['head', 'clothes', 'shoes']:
+            result.update(gear(kind))
+
+        return result
+
+    def member():
+        return {'kill_count': rand.randint(0, 20), 'assist_count': rand.randint(0, 5), 'death_count': rand.randint(0, 15),
+                'special_count': rand.randint(0, 6), 'game_paint_point': rand.randint(100, 1500), 'sort_score': 0, 'player': player()}
+
+    results = []
+    for battle_number in range(5000, 4950, -1):
+        rule = rand.choice([('rainmaker', 'Rainmaker'), ('splat_zones', 'Splat Zones'), ('tower_control', 'Tower Control')])
+        results.append({
+            'battle_number': str(battle_number), 'start_time': 1600000000 + battle_number * 200, 'elapsed_time': 300,
+            'type': 'gachi', 'my_team_result': {'key': rand.choice(['victory', 'defeat']), 'name': 'VICTORY!'},
+            'other_team_result': {'key': 'defeat', 'name': 'DEFEAT'}, 'game_mode': {'key': 'gachi', 'name': 'Ranked Battle'},
+            'rule': {'key': rule[0], 'name': rule[1], 'multiline_name': rule[1]}, 'udemae': {'name': 'S+', 'number': 11},
+            'stage': {'id': str(rand.randint(0, 22)), 'name': 'The Reef', 'image': '/images/stage/' + 'k' * 40 + '.png'},
+            'player_result': member(), 'my_team_members': [member() for i in range(3)],
+            'other_team_members': [member() for i in range(4)], 'my_team_count': 100, 'other_team_count': 40,
+            'estimate_gachi_power': 2100, 'weapon_paint_point': 99999, 'x_power': None
+        })
+
+    body = json.dumps({'unique_id': '%016x' % rand.getrandbits(64), 'results': results,
+                       'summary': {'victory_count': 30, 'defeat_count': 20, 'count': 50}}).encode()
+    chunks = [body[i:i + 16 * 1024] for i in range(0, len(body), 16 * 1024)]
+    fields_ = fields(*[f'results.{x}' for x in match_history.BATTLE_FIELDS])
+
+    def full():
+        # What res.json() does with the whole body
+        data = json.loads(body.decode())
+        return [match_history.parse_battle(0, x) for x in data['results']]
+
+    def streamed():
+        stream = ObjectStream(['results'], fields_)
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        rows = []
+        for chunk in chunks:
+            rows += [match_history.parse_battle(0, value) for key, value in stream.feed(decoder.decode(chunk))]
+
+        rows += [match_history.parse_battle(0, value) for key, value in stream.feed(decoder.decode(b'', final=True))]
+        stream.close()
+        return rows
+
+    assert full() == streamed()
+    print(f'/api/results: {len(body) / 1024:.0f}KiB, {len(results)} battles')
+
+    for name, function in [('json.loads', full), ('ObjectStream', streamed)]:
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        times = []
+        for i in range(20):
+            begin = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - begin)
+
+        print(f'{name}: {min(times) * 1000:.1f}ms, peak {peak / 1024:.0f}KiB')
@@ -0,0 +1,147 @@
+# Local history of each linked user's Splatoon 2 battles. SplatNet only
+# keeps the last 50, so every /api/results response is added here and
+# older battles are kept. Streaks and per weapon, stage and ruleset
+# counts are updated as battles come in, so commands read them instead
+# of going through every battle.
+
+import os
+import sqlite3
+
+DATABASE = 'data/matches.sqlite'
+
+COLUMNS = ['uid', 'battle_number', 'start_time', 'result', 'gamemode', 'ruleset', 'stage', 'weapon']
+
+# The battle columns that have their battles and wins counted in totals
+KINDS = ['weapon', 'stage', 'ruleset']
+
+# The fields of an /api/results entry that parse_battle reads
+BATTLE_FIELDS = ['battle_number', 'start_time', 'my_team_result.key', 'game_mode.key', 'rule.key', 'stage.id',
+                 'player_result.player.weapon.name']
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS battles (
+    uid TEXT NOT NULL,
+    battle_number INTEGER NOT NULL,
+    start_time INTEGER NOT NULL,
+    result TEXT NOT NULL,
+    gamemode TEXT NOT NULL,
+    ruleset TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    weapon TEXT NOT NULL,
+    PRIMARY KEY (uid, battle_number)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS users (
+    uid TEXT PRIMARY KEY,
+    last_battle INTEGER NOT NULL,
+    battles INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    streak_result TEXT NOT NULL,
+    streak INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS totals (
+    uid TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    battles INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    PRIMARY KEY (uid, kind, key)
+) WITHOUT ROWID;
+'''
+
+CONNECTION = None
+
+
+def connect():
+    global CONNECTION
+    if CONNECTION is None:
+        os.makedirs(os.path.dirname(DATABASE), exist_ok=True)
+        CONNECTION = sqlite3.connect(DATABASE)
+        CONNECTION.executescript(SCHEMA)
+
+    return CONNECTION
+
+
+def parse_battle(uid, entry):
+    # A battles row (see COLUMNS) from one entry of /api/results
+    return (
+        str(uid),
+        int(entry['battle_number']),
+        int(entry['start_time']),
+        entry['my_team_result']['key'],
+        entry['game_mode']['key'],
+        entry['rule']['key'],
+        entry['stage']['id'],
+        entry['player_result']['player']['weapon']['name']
+    )
+
+
+def ingest(uid, results):
+    '''Add the battles in an /api/results response that are newer than the
+    newest one stored for the Discord user uid, and update their totals.
+    Returns how many battles were added.
+    '''
+    uid = str(uid)
+    db = connect()
+
+    user = db.execute('SELECT last_battle, battles, wins, streak_result, streak FROM users WHERE uid = ?', (uid,)).fetchone()
+    last_battle, battles, wins, streak_result, streak = user or (0, 0, 0, '', 0)
+
+    rows = sorted(parse_battle(uid, x) for x in results['results'])
+    rows = [x for x in rows if x[1] > last_battle]
+    if len(rows) == 0:
+        return 0
+
+    totals = {}
+    for row in rows:
+        won = row[3] == 'victory'
+        battles += 1
+        wins += won
+
+        # Oldest first, so the streak ends on the newest battle
+        if row[3] == streak_result:
+            streak += 1
+        else:
+            streak_result, streak = row[3], 1
+
+        for kind in KINDS:
+            key = (kind, row[COLUMNS.index(kind)])
+            count = totals.get(key, (0, 0))
+            totals[key] = (count[0] + 1, count[1] + won)
+
+    with db:
+        db.executemany(f'INSERT OR IGNORE INTO battles VALUES ({", ".join("?" * len(COLUMNS))})', rows)
+        db.execute('INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?, ?, ?)',
+                   (uid, rows[-1][1], battles, wins, streak_result, streak))
+        db.executemany('''INSERT INTO totals VALUES (?, ?, ?, ?, ?)
+                          ON CONFLICT (uid, kind, key) DO UPDATE SET
+                          battles = battles + excluded.battles, wins = wins + excluded.wins''',
+                       [(uid, kind, key, count[0], count[1]) for (kind, key), count in totals.items()])
+
+    return len(rows)
+
+
+def get_user(uid):
+    '''The stored totals of uid as a dict with battles, wins,
+    streak_result and streak, or None if they have no battles stored.
+    '''
+    row = connect().execute('SELECT battles, wins, streak_result, streak FROM users WHERE uid = ?', (str(uid),)).fetchone()
+    return None if row is None else dict(zip(['battles', 'wins', 'streak_result', 'streak'], row))
+
+
+def recent(uid, count):
+    '''The results ('victory' or 'defeat') of uid's newest count battles,
+    newest first.
+    '''
+    rows = connect().execute('SELECT result FROM battles WHERE uid = ? ORDER BY battle_number DESC LIMIT ?', (str(uid), count))
+    return [x[0] for x in rows]
+
+
+def totals(uid, kind):
+    '''(key, battles, wins) for each weapon, stage or ruleset (see KINDS)
+    uid has played, most played first.
+    '''
+    rows = connect().execute('SELECT key, battles, wins FROM totals WHERE uid = ? AND kind = ? ORDER BY battles DESC, key',
+                             (str(uid), kind))
+    return rows.fetchall()
@@ -0,0 +1,51 @@
+# Counters, gauges and timings for the bot. Everything is kept in
+# memory and shown with the >metrics command.
+
+import statistics
+from collections import Counter, defaultdict, deque
+
+COUNTERS = Counter()
+GAUGES = {}
+TIMINGS = defaultdict(lambda: deque(maxlen=200))
+
+
+def increment(name, amount=1):
+    COUNTERS[name] += amount
+
+
+def gauge(name, function):
+    '''Register a gauge. function is called with no arguments whenever
+    the metrics are read and should return the current value.
+    '''
+    GAUGES[name] = function
+
+
+def observe(name, seconds):
+    TIMINGS[name].append(seconds)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(fraction * len(ordered)))
+    return ordered[index]
+
+
+def snapshot():
+    '''Returns a dict of every metric name to its current value. Timings
+    are summarized as a count plus p50 and p99 in milliseconds over the
+    most recent observations.
+    '''
+    result = dict(COUNTERS)
+
+    for name, function in GAUGES.items():
+        result[name] = function()
+
+    for name, values in TIMINGS.items():
+        if len(values) == 0:
+            continue
+
+        result[f'{name}.count'] = len(values)
+        result[f'{name}.p50_ms'] = round(statistics.median(values) * 1000, 1)
+        result[f'{name}.p99_ms'] = round(percentile(values, 0.99) * 1000, 1)
+
+    return dict(sorted(result.items()))
@@ -1,13 +1,236 @@
+import asyncio
+import base64
+import binascii
+import json
+import os
+import time
+from collections import OrderedDict
+
 import requests
 
+import metrics
 import mojang
+import profile_cache
+import throttle
+
+CONFIG = json.loads(open('credentials.json').read())
+
+# When "skin-attachments" is true in credentials.json, >skin uploads
+# renders from SKIN_CACHE instead of linking to visage
+SKIN_ATTACHMENTS = CONFIG.get('skin-attachments', False)
+
+VISAGE_URL = 'https://visage.surgeplay.com'
+SESSION_URL = 'https://sessionserver.mojang.com/session/minecraft/profile'
+
+# Renders are saved as <uuid>-<kind>-<size>-<skin hash>.png. Renders
+# older than SKIN_TTL are still used, but the player's skin hash is
+# checked again in the background and a new render downloaded if the
+# skin changed. The least recently used renders are deleted once the
+# folder is over SKIN_CACHE_SIZE bytes.
+SKIN_CACHE_DIR = 'data/skins'
+SKIN_CACHE_SIZE = 64 * 1024 * 1024
+SKIN_TTL = 6 * 60 * 60
+
+
+class SkinCache:
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+
+        # filename -> size, least recently used first
+        self.files = OrderedDict()
+        self.size = 0
+        # (uuid, kind, size) -> newest filename
+        self.renders = {}
+        self.refreshing = {}
+
+        self.scanned = False
+
+        metrics.gauge('skins.files', lambda: len(self.files))
+        metrics.gauge('skins.bytes', lambda: self.size)
+
+    def path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def scan(self):
+        # Rebuilds the index from the files already on disk, the first
+        # time the cache is used
+        if self.scanned:
+            return
+
+        self.scanned = True
+        os.makedirs(self.directory, exist_ok=True)
+
+        entries = [x for x in os.scandir(self.directory) if x.name.endswith('.png')]
+        entries.sort(key=lambda x: x.stat().st_atime)
+        for entry in entries:
+            self.add(entry.name, entry.stat().st_size, entry.stat().st_mtime)
+
+    def key(self, filename):
+        uuid, kind, size, skin = filename[:-len('.png')].split('-')
+        return (uuid, kind, size)
+
+    def add(self, filename, size, created):
+        key = self.key(filename)
+
+        newest = self.renders.get(key)
+        if newest is not None and os.path.getmtime(self.path(newest)) > created:
+            # An older render of a skin the player has since changed
+            self.remove(filename)
+            return
+
+        if newest is not None:
+            self.remove(newest)
+
+        self.renders[key] = filename
+        self.files[filename] = size
+        self.size += size
+
+    def remove(self, filename):
+        size = self.files.pop(filename, None)
+        if size is not None:
+            self.size -= size
+
+        try:
+            os.remove(self.path(filename))
+        except FileNotFoundError:
+            pass
+
+    def touch(self, filename):
+        # Marks a render as just used. Only the access time changes, the
+        # modification time is when the render was checked against the
+        # player's skin.
+        self.files.move_to_end(filename)
+        path = self.path(filename)
+        os.utime(path, (time.time(), os.path.getmtime(path)))
+
+    def save(self, filename, data):
+        temporary = self.path(f'.{filename}.tmp')
+        with open(temporary, 'wb') as file:
+            file.write(data)
+
+        os.replace(temporary, self.path(filename))
+        self.add(filename, len(data), time.time())
+
+        while self.size > self.max_size and len(self.files) > 1:
+            oldest = next(iter(self.files))
+            del self.renders[self.key(oldest)]
+            self.remove(oldest)
+            metrics.increment('skins.evictions')
+
+    async def get(self, session, uuid, kind, size):
+        '''Returns the path of a render of uuid's skin from visage.
+        kind is 'full' or 'skin'.
+        '''
+        self.scan()
+        key = (profile_cache.normalize_uuid(uuid), kind, str(size))
+
+        filename = self.renders.get(key)
+        if filename is None:
+            metrics.increment('skins.misses')
+            return self.path(await self.refresh(session, key))
+
+        self.touch(filename)
+        if time.time() - os.path.getmtime(self.path(filename)) <= SKIN_TTL:
+            metrics.increment('skins.hits')
+        else:
+            metrics.increment('skins.stale_hits')
+            asyncio.ensure_future(self.refresh_in_background(session, key))
+
+        return self.path(filename)
+
+    async def refresh(self, session, key):
+        # Concurrent refreshes of the same render share one
+        future = self.refreshing.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self.download(session, *key))
+            self.refreshing[key] = future
+            future.add_done_callback(lambda x: self.refreshing.pop(key, None))
+
+        return await asyncio.shield(future)
+
+    async def refresh_in_background(self, session, key):
+        try:
+            await self.refresh(session, key)
+        except Exception as err:
+            print(f'Could not refresh the {key} skin render: {err!r}')
+
+    async def download(self, session, uuid, kind, size):
+        skin = await get_skin_hash(session, uuid)
+        filename = f'{uuid}-{kind}-{size}-{skin}.png'
+
+        if filename in self.files:
+            # Same skin as before, so the render is still good
+            self.files.move_to_end(filename)
+            os.utime(self.path(filename), None)
+            return filename
+
+        url = f'{VISAGE_URL}/{kind}/{size}/{uuid}'
+
+        async def request():
+            async with session.get(url) as res:
+                if res.status != 200:
+                    raise mojang.MojangAPIError(f'visage answered {res.status} for {uuid}')
+
+                return await res.read()
+
+        data = await throttle.SCHEDULER.fetch(('GET', url, skin), url, request)
+        metrics.increment('skins.downloads')
+        self.save(filename, data)
+        return filename
+
+
+SKIN_CACHE = SkinCache(SKIN_CACHE_DIR, SKIN_CACHE_SIZE)
+
+
+async def get_skin_hash(session, uuid):
+    # The id of the player's current skin texture, from their profile's
+    # textures property, or 'default' if they have none
+    url = f'{SESSION_URL}/{uuid}'
+
+    async def request():
+        async with session.get(url) as res:
+            if res.status != 200:
+                raise mojang.MinecraftUUIDError(f'{uuid} is not a valid UUID')
+
+            return await res.json(content_type=None)
+
+    # Not ('GET', url): mojang.get_player_from_uuid_async fetches the same
+    # url, and its requests return something else
+    profile = await throttle.SCHEDULER.fetch(('GET', url, 'textures'), url, request)
+    if profile is None:
+        raise mojang.MinecraftUUIDError(f'{uuid} is not a valid UUID')
+
+    mojang.remember([profile])
+
+    for item in profile.get('properties', []):
+        if item.get('name') != 'textures':
+            continue
+
+        try:
+            textures = json.loads(base64.b64decode(item['value']))['textures']
+        except (binascii.Error, ValueError, KeyError):
+            break
+
+        if 'SKIN' in textures:
+            return textures['SKIN']['url'].rstrip('/').rsplit('/', 1)[-1]
+
+    return 'default'
+
 
 class PlayerSkin(mojang.Player):
     def get_full(self):
-        url = f'https://visage.surgeplay.com/full/256/{self.uuid}'
+        url = f'{VISAGE_URL}/full/256/{self.uuid}'
         return url
-    
+
     def get_download(self):
-        url = f'https://visage.surgeplay.com/skin/512/{self.uuid}'
+        url = f'{VISAGE_URL}/skin/512/{self.uuid}'
         return url
 
+    # Paths of the same renders in SKIN_CACHE, downloaded if needed
+    async def get_full_file(self, session):
+        return await SKIN_CACHE.get(session, self.uuid, 'full', 256)
+
+    async def get_download_file(self, session):
+        return await SKIN_CACHE.get(session, self.uuid, 'skin', 512)
+
@@ -1,11 +1,30 @@
 # Some functions for the Mojang API
 
-# import grequests and requests
-import grequests
 import requests
 
+import aiohttp
+import asyncio
 import datetime
 import json
+import random
+
+import metrics
+import name_history
+import profile_cache
+import throttle
+
+# The /profiles/minecraft endpoint only accepts this many names at once
+PROFILE_BATCH_SIZE = 10
+
+# How many uuids get_players_from_uuids looks up at once
+UUID_CONCURRENCY = 8
+
+# Responses worth trying again, and how often. The wait before retry n
+# is RETRY_DELAY * 2 ** n seconds, give or take half, unless Mojang sends
+# a Retry-After header.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRIES = 3
+RETRY_DELAY = 0.5
 
 class MinecraftUUIDError(ValueError):
     pass
@@ -15,43 +34,148 @@ class MinecraftUsernameError(ValueError):
     pass
 
 
-class Player:
-    # Essential variables
-    username = None
-    uuid = None
+class MojangAPIError(Exception):
+    pass
 
+
+class UnresolvedPlayerError(RuntimeError):
+    pass
+
+
+class Player:
     # Vars to be used in called methods
     names = None
 
+    # What the player was created with, a username or a uuid
+    id = None
+
+    # Set by resolve or resolve_all. resolved is True once uuid and
+    # username are known, error is the exception resolve_all got if they
+    # could not be found.
+    resolved = False
+    error = None
+    _uuid = None
+    _username = None
+
+    # Nothing is looked up here. uuid and username are resolved the first
+    # time either is read, or for many players at once with resolve_all.
     def __init__(self, id):
+        self.id = id
         if len(id) > 16:
-            # It is a uuid, get the username as well
-            self.uuid = id
-            try:
-                self.username = get_player_from_uuid(id)['name']
-            except MinecraftUUIDError as err:
-                raise err
+            self._uuid = id
+        else:
+            self._username = id
+
+    @classmethod
+    def from_profile(cls, profile):
+        # Builds a player from a profile that has already been fetched
+        # (a dict with 'id' and 'name')
+        player = cls.__new__(cls)
+        player.id = profile['id']
+        player.set_profile(profile)
+        return player
+
+    def set_profile(self, profile):
+        self._uuid = profile['id']
+        self._username = profile['name']
+        self.resolved = True
+
+    def get_profile(self):
+        return {'id': self.uuid, 'name': self.username}
+
+    @property
+    def uuid(self):
+        if self._uuid is None:
+            self.resolve()
+
+        return self._uuid
+
+    @property
+    def username(self):
+        if not self.resolved:
+            self.resolve()
+
+        return self._username
 
+    # Looks the player up with blocking requests. Coroutines must use
+    # resolve_all instead, so reading uuid or username of a player that
+    # has not been resolved raises UnresolvedPlayerError there rather than
+    # stalling the event loop.
+    def resolve(self):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
         else:
-            # It is a username, get the uuid
-            self.username = id
-            try:
-                req = get_uuid_from_player(id)
-                self.uuid = req[0]['id']
-                self.username = req[0]['name']
-            except IndexError:
-                raise MinecraftUsernameError(f'{id} is not a valid username')
+            raise UnresolvedPlayerError(f'{self.id} must be resolved with Player.resolve_all before it is used in a coroutine')
+
+        if len(self.id) > 16:
+            self.set_profile(get_player_from_uuid(self.id))
+        else:
+            profiles = get_uuid_from_player(self.id)
+            if len(profiles) == 0:
+                raise MinecraftUsernameError(f'{self.id} is not a valid username')
+
+            self.set_profile(profiles[0])
+
+    @classmethod
+    async def resolve_all(cls, session, players):
+        # Resolves every player that has not been resolved yet at once.
+        # Usernames are sent in batches of PROFILE_BATCH_SIZE, uuids are
+        # looked up concurrently. A failed lookup only affects the players
+        # it was for: returns a list with, for each player, None if it
+        # resolved, or the exception that stopped it (also kept in
+        # player.error).
+        pending = [x for x in players if not x.resolved]
+        names = [x.id for x in pending if len(x.id) <= 16]
+        uuids = [x.id for x in pending if len(x.id) > 16]
+
+        batches = [names[i:i + PROFILE_BATCH_SIZE] for i in range(0, len(names), PROFILE_BATCH_SIZE)]
+        batch_results, uuid_results = await asyncio.gather(
+            asyncio.gather(*[get_uuid_from_player_async(session, x) for x in batches], return_exceptions=True),
+            asyncio.gather(*[get_player_from_uuid_async(session, x) for x in uuids], return_exceptions=True)
+        )
+
+        for result in [*batch_results, *uuid_results]:
+            # Cancellation is not a per-player error
+            if isinstance(result, BaseException) and not isinstance(result, Exception):
+                raise result
+
+        found = dict(zip(uuids, uuid_results))
+        for batch, result in zip(batches, batch_results):
+            if isinstance(result, Exception):
+                found.update((name, result) for name in batch)
+                continue
+
+            profiles = {x['name'].lower(): x for x in result}
+            for name in batch:
+                found[name] = profiles.get(name.lower(), MinecraftUsernameError(f'{name} is not a valid username'))
+
+        for player in pending:
+            result = found[player.id]
+            if isinstance(result, Exception):
+                player.error = result
+            else:
+                player.error = None
+                player.set_profile(result)
+
+        return [x.error for x in players]
 
     def name_history(self):
+        if self.names is None:
+            self.names = name_history.get_history(self.uuid)
+
         if self.names is None:
             req_url = f'https://api.mojang.com/user/profiles/{self.uuid}/names'
-            req = requests.get(req_url)
+            req = throttle.SCHEDULER.get(req_url)
             res = req.json()
 
             self.names = [(res[0]['name'], None)]
             for name in res[1:]:
                 self.names.append((name['name'], name['changedToAt'] // 1000))
 
+            name_history.store_history(self.uuid, self.names)
+
         return self.names
 
     def __str__(self):
@@ -59,35 +183,185 @@ class Player:
 
 
 def get_uuid_from_player(names):
+    # Returns the profiles of the names that exist. Names are answered
+    # from profile_cache when possible, the rest are looked up in batches
+    # and saved there.
     # If names is just a string of one name, convert it to a list
     if type(names) == ''.__class__:
         names = [names]
 
+    profiles, invalid, missing = profile_cache.split(names)
+
     url = 'https://api.mojang.com/profiles/minecraft'
-    req = requests.post(url, json=names)
-    return req.json()
+    for i in range(0, len(missing), PROFILE_BATCH_SIZE):
+        batch = missing[i:i + PROFILE_BATCH_SIZE]
+        req = throttle.SCHEDULER.post(url, json=batch)
+        profiles += save_batch(batch, req.json())
+
+    return profiles
+
+
+def save_batch(batch, result):
+    # Saves what /profiles/minecraft said about batch to profile_cache.
+    # Anything but a list is an error (e.g. a malformed name), and is not
+    # cached.
+    if not isinstance(result, list):
+        return []
+
+    remember(result, profile_cache.unmatched(batch, result))
+    return result
+
+
+def remember(profiles, invalid=()):
+    # Saves profiles fetched from Mojang, and names it said do not exist,
+    # to profile_cache and name_history
+    profile_cache.store(profiles, invalid)
+    name_history.add_profiles(profiles)
 
 
 def get_players_from_uuids(uuids):
-    # Gets the usernames for each uuid provided
+    # Gets the profile for each uuid provided. Returns a list of
+    # (profile, error) tuples in the order of uuids, where one of the two
+    # is None. Runs its own event loop, so it cannot be called from a
+    # coroutine; use get_players_from_uuids_async there.
     if type(uuids) == ''.__class__:
         uuids = [uuids]
 
-    urls = [f'https://sessionserver.mojang.com/session/minecraft/profile/{uuid}' for uuid in uuids]
-    reqs = (grequests.get(u) for u in urls)
-    ress = grequests.map(reqs)
-    return [x.json() for x in ress]
+    async def main():
+        async with aiohttp.ClientSession() as session:
+            return await get_players_from_uuids_async(session, uuids)
+
+    return asyncio.run(main())
+
+
+async def get_players_from_uuids_async(session, uuids, limit=UUID_CONCURRENCY):
+    # Looks up every uuid, at most limit at a time. Returns a list of
+    # (profile, error) tuples in the order of uuids.
+    results = {}
+    async for uuid, profile, error in iter_players_from_uuids(session, uuids, limit):
+        results[uuid] = (profile, error)
+
+    return [results[x] for x in uuids]
+
+
+async def iter_players_from_uuids(session, uuids, limit=UUID_CONCURRENCY):
+    # Looks up every uuid, at most limit at a time, and yields
+    # (uuid, profile, error) tuples as the lookups finish. A failed lookup
+    # yields its exception as error instead of stopping the rest.
+    semaphore = asyncio.Semaphore(limit)
+
+    async def lookup(uuid):
+        async with semaphore:
+            try:
+                return uuid, await get_player_from_uuid_async(session, uuid), None
+            except (MinecraftUUIDError, MojangAPIError, throttle.ThrottleTimeout) as err:
+                return uuid, None, err
+
+    for future in asyncio.as_completed([lookup(x) for x in dict.fromkeys(uuids)]):
+        yield await future
+
+
+def retry_delay(attempt, retry_after=None):
+    if retry_after is not None and retry_after.isdigit():
+        return int(retry_after)
+
+    return RETRY_DELAY * 2 ** attempt * random.uniform(0.5, 1.5)
+
+
+async def get_uuid_from_player_async(session, names):
+    # Async version of get_uuid_from_player. The batches are sent
+    # concurrently.
+    if type(names) == ''.__class__:
+        names = [names]
+
+    profiles, invalid, missing = profile_cache.split(names)
+
+    url = 'https://api.mojang.com/profiles/minecraft'
+
+    async def post(batch):
+        async def request():
+            async with session.post(url, json=batch) as res:
+                return await res.json()
+
+        result = await throttle.SCHEDULER.fetch(('POST', url, tuple(batch)), url, request)
+        return save_batch(batch, result)
+
+    batches = [missing[i:i + PROFILE_BATCH_SIZE] for i in range(0, len(missing), PROFILE_BATCH_SIZE)]
+    results = await asyncio.gather(*map(post, batches))
+
+    return profiles + [profile for batch in results for profile in batch]
+
+
+async def get_player_from_uuid_async(session, uuid, retries=RETRIES):
+    # Async version of get_player_from_uuid. Rate limits, server errors
+    # and dropped connections are retried with backoff, and raise
+    # MojangAPIError once the retries run out.
+    cached = profile_cache.lookup_uuid(uuid)
+    if cached is not None:
+        return cached
+
+    url = f'https://sessionserver.mojang.com/session/minecraft/profile/{uuid}'
+
+    async def request():
+        # Returns (profile, None, None), or (None, status, Retry-After)
+        # for a response worth trying again
+        async with session.get(url) as res:
+            if res.status in RETRY_STATUSES:
+                return None, res.status, res.headers.get('Retry-After')
+
+            # Unknown UUIDs come back with an empty body, malformed ones
+            # with an error object
+            if res.status != 200:
+                raise MinecraftUUIDError(f'{uuid} is not a valid UUID')
+
+            try:
+                profile = await res.json(content_type=None)
+            except json.decoder.JSONDecodeError:
+                profile = None
+
+            if profile is None:
+                raise MinecraftUUIDError(f'{uuid} is not a valid UUID')
+
+            remember([profile])
+            return profile, None, None
+
+    for attempt in range(retries + 1):
+        try:
+            profile, status, retry_after = await throttle.SCHEDULER.fetch(('GET', url), url, request)
+            failure = f'status {status}'
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            profile, retry_after = None, None
+            failure = repr(err)
+
+        if profile is not None:
+            return profile
+
+        metrics.increment('mojang.retries')
+        if attempt < retries:
+            await asyncio.sleep(retry_delay(attempt, retry_after))
+
+    raise MojangAPIError(f'Could not look up {uuid} after {retries + 1} tries ({failure})')
 
 
 def get_player_from_uuid(uuid):
-    # Gets the player data for a uuid
+    # Gets the player data for a uuid. Profiles from profile_cache only
+    # have 'id' and 'name'.
+    cached = profile_cache.lookup_uuid(uuid)
+    if cached is not None:
+        return cached
+
     url = f'https://sessionserver.mojang.com/session/minecraft/profile/{uuid}'
-    req = requests.get(url)
+    req = throttle.SCHEDULER.get(url)
     try:
-        return req.json()
+        profile = req.json()
     except json.decoder.JSONDecodeError:
         raise MinecraftUUIDError(f'{uuid} is not a valid UUID')
 
+    if 'id' in profile and 'name' in profile:
+        remember([profile])
+
+    return profile
+
 
 if __name__ == '__main__':
     # youtubers = ['gamerboy80', 'Purpled', 'RaguSpaghetti', 'FishermanGamer']
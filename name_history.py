@@ -0,0 +1,279 @@
+# Every name the bot has seen a player use, from Mojang's name history
+# endpoint and from every profile it resolves, kept next to
+# profile_cache's tables. NameIndex searches them in memory, so old and
+# mistyped names can be matched to players without asking Mojang.
+
+import bisect
+import time
+from difflib import SequenceMatcher
+
+import profile_cache
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS name_history (
+    uuid TEXT NOT NULL,
+    name TEXT NOT NULL,
+    changed_at INTEGER NOT NULL,
+    PRIMARY KEY (uuid, name, changed_at)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS name_history_fetched (
+    uuid TEXT PRIMARY KEY,
+    fetched_at INTEGER NOT NULL
+) WITHOUT ROWID;
+'''
+
+# A stored history is used instead of asking Mojang for this long
+HISTORY_TTL = profile_cache.UUID_TTL
+
+# fuzzy looks at no more than this many names sharing the start or the
+# end of the name being searched for
+FUZZY_CANDIDATES = 2000
+
+CONNECTION = None
+INDEX = None
+
+
+def connect():
+    global CONNECTION
+    if CONNECTION is None:
+        CONNECTION = profile_cache.connect()
+        CONNECTION.executescript(SCHEMA)
+
+    return CONNECTION
+
+
+class NameIndex:
+    '''Names in two sorted lists, one of the lowercased names and one of
+    them reversed, so names starting or ending with some text are found
+    with a binary search.
+    '''
+
+    def __init__(self):
+        # Sorted (lowercased name, uuid) and (reversed lowercased name, uuid)
+        self.names = []
+        self.reversed = []
+
+        # (lowercased name, uuid) -> (name, when the player changed to it)
+        self.entries = {}
+
+        # uuid -> the player's current name
+        self.current = {}
+
+    def build(self, rows):
+        '''Fill the index from (uuid, name, changed_at) rows. Sorts once at
+        the end, so it is much faster than calling add for each row.
+        '''
+        for uuid, name, changed_at in rows:
+            self.remember(uuid, name, changed_at)
+
+        self.names = sorted(self.entries)
+        self.reversed = sorted((name[::-1], uuid) for name, uuid in self.entries)
+
+    def remember(self, uuid, name, changed_at):
+        key = (name.lower(), uuid)
+        old = self.entries.get(key)
+        self.entries[key] = (name, changed_at if old is None else max(old[1], changed_at))
+        return old is None
+
+    def add(self, uuid, name, changed_at=0):
+        if self.remember(uuid, name, changed_at):
+            bisect.insort(self.names, (name.lower(), uuid))
+            bisect.insort(self.reversed, (name.lower()[::-1], uuid))
+
+    def set_current(self, uuid, name):
+        self.current[uuid] = name
+
+    def match(self, key):
+        name, changed_at = self.entries[key]
+        uuid = key[1]
+        return {'uuid': uuid, 'name': name, 'changed_at': changed_at, 'current': self.current.get(uuid, name)}
+
+    def range(self, keys, start):
+        # Every key in the sorted list keys that begins with start
+        i = bisect.bisect_left(keys, (start,))
+        while i < len(keys) and keys[i][0].startswith(start):
+            yield keys[i]
+            i += 1
+
+    def prefix(self, text, limit=25):
+        '''Names starting with text, in alphabetical order.
+        '''
+        result = []
+        for key in self.range(self.names, text.lower()):
+            if len(result) >= limit:
+                break
+
+            result.append(self.match(key))
+
+        return result
+
+    def who_was(self, name):
+        '''Players who have used exactly this name.
+        '''
+        return [self.match(key) for key in self.range(self.names, name.lower()) if key[0] == name.lower()]
+
+    def fuzzy(self, text, limit=5, cutoff=0.75):
+        '''Names that look like text, best match first. Only names sharing
+        the first or last two letters with text are considered.
+        '''
+        text = text.lower()
+        candidates = set()
+        for keys, start in [(self.names, text[:2]), (self.reversed, text[::-1][:2])]:
+            for key in self.range(keys, start):
+                if len(candidates) >= FUZZY_CANDIDATES:
+                    break
+
+                candidates.add(key if keys is self.names else (key[0][::-1], key[1]))
+
+        matcher = SequenceMatcher()
+        matcher.set_seq2(text)
+
+        scored = []
+        for key in candidates:
+            matcher.set_seq1(key[0])
+            if matcher.real_quick_ratio() >= cutoff and matcher.quick_ratio() >= cutoff:
+                score = matcher.ratio()
+                if score >= cutoff:
+                    scored.append((-score, key))
+
+        scored.sort()
+        return [self.match(key) for score, key in scored[:limit]]
+
+
+def get_index():
+    # Builds the index from the database the first time it is needed
+    global INDEX
+    if INDEX is None:
+        db = connect()
+        rows = db.execute('SELECT uuid, name, changed_at FROM name_history').fetchall()
+        profiles = db.execute('SELECT uuid, username FROM uuids').fetchall()
+
+        INDEX = NameIndex()
+        INDEX.build(rows + [(uuid, name, 0) for uuid, name in profiles])
+
+        # The newest name in each history, unless profile_cache has
+        # resolved the player more recently
+        for uuid, name, changed_at in sorted(rows, key=lambda x: x[2]):
+            INDEX.set_current(uuid, name)
+
+        for uuid, name in profiles:
+            INDEX.set_current(uuid, name)
+
+    return INDEX
+
+
+def add_profiles(profiles):
+    '''Index the current names of profiles from Mojang. They are already
+    saved by profile_cache, so only a loaded index is updated.
+    '''
+    if INDEX is None:
+        return
+
+    for profile in profiles:
+        uuid = profile_cache.normalize_uuid(profile['id'])
+        INDEX.add(uuid, profile['name'])
+        INDEX.set_current(uuid, profile['name'])
+
+
+def store_history(uuid, names, now=None):
+    '''Save a name history in the format of mojang.Player.name_history:
+    (name, when it was changed to) tuples, oldest first, where the
+    original name has None.
+    '''
+    now = int(time.time()) if now is None else now
+    uuid = profile_cache.normalize_uuid(uuid)
+    rows = [(uuid, name, changed_at or 0) for name, changed_at in names]
+
+    with connect() as db:
+        db.executemany('INSERT OR IGNORE INTO name_history VALUES (?, ?, ?)', rows)
+        db.execute('INSERT OR REPLACE INTO name_history_fetched VALUES (?, ?)', (uuid, now))
+
+    if INDEX is not None:
+        for row in rows:
+            INDEX.add(*row)
+
+        if len(names) > 0:
+            INDEX.set_current(uuid, names[-1][0])
+
+
+def get_history(uuid, now=None):
+    '''The stored name history of uuid, or None if it has not been fetched
+    within HISTORY_TTL.
+    '''
+    now = int(time.time()) if now is None else now
+    uuid = profile_cache.normalize_uuid(uuid)
+    db = connect()
+
+    fetched = db.execute('SELECT fetched_at FROM name_history_fetched WHERE uuid = ?', (uuid,)).fetchone()
+    if fetched is None or fetched[0] < now - HISTORY_TTL:
+        return None
+
+    rows = db.execute('SELECT name, changed_at FROM name_history WHERE uuid = ? ORDER BY changed_at', (uuid,))
+    return [(name, changed_at or None) for name, changed_at in rows]
+
+
+def suggest(name):
+    '''The current name of the player most likely meant by name: someone
+    who used to be called that, or else the closest name. None if
+    nothing is close.
+    '''
+    index = get_index()
+
+    # Several players can have used the same old name, the one who had
+    # it last is the best guess
+    matches = [x for x in index.who_was(name) if x['current'].lower() != name.lower()]
+    if len(matches) > 0:
+        return max(matches, key=lambda x: x['changed_at'])['current']
+
+    matches = index.fuzzy(name, limit=1)
+    if len(matches) > 0:
+        return matches[0]['current']
+
+    return None
+
+
+if __name__ == '__main__':
+    # Benchmark: building the index and searching it with 100,000 names
+    import random
+    import statistics
+    import string
+
+    import metrics
+
+    rand = random.Random(0)
+    alphabet = string.ascii_letters + string.digits + '_'
+    rows = []
+    for i in range(100000):
+        name = ''.join(rand.choice(alphabet) for _ in range(rand.randint(3, 16)))
+        rows.append((f'{i // 3:032x}', name, i))
+
+    start = time.perf_counter()
+    index = NameIndex()
+    index.build(rows)
+    print(f'build: {(time.perf_counter() - start) * 1000:.0f}ms for {len(rows):,} names')
+
+    def timed(function, queries):
+        times = []
+        for query in queries:
+            start = time.perf_counter()
+            function(query)
+            times.append(time.perf_counter() - start)
+
+        return f'p50 {statistics.median(times) * 1e6:.0f}us, p99 {metrics.percentile(times, 0.99) * 1e6:.0f}us'
+
+    names = [x[1] for x in rand.sample(rows, 1000)]
+    typos = [x[:2] + x[3:] if len(x) > 4 else x for x in names]
+
+    print(f'prefix: {timed(lambda x: index.prefix(x[:3]), names)}')
+    print(f'who_was: {timed(index.who_was, names)}')
+    print(f'fuzzy: {timed(index.fuzzy, typos)}')
+
+    found = sum(1 for x, y in zip(names, typos) if any(m['name'] == x for m in index.fuzzy(y)))
+    print(f'fuzzy found {found} of {len(typos)} names with a letter missing')
+
+    start = time.perf_counter()
+    for i in range(1000):
+        index.add(f'{i:032x}', f'added{i}')
+
+    print(f'add: {(time.perf_counter() - start) * 1000 / 1000:.3f}ms per name')
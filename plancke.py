@@ -0,0 +1,263 @@
+# Streaming parser for plancke.io player stat pages. It reads the page
+# once, keeps only the parts of each stat_panel_<game> div that the bot
+# uses, and stops reading as soon as it has every panel it was asked for.
+
+import codecs
+import html
+from html.parser import HTMLParser
+
+CHUNK_SIZE = 16 * 1024
+
+PANEL_PREFIX = 'stat_panel_'
+
+# BeautifulSoup collapses strings made only of these characters, see
+# Panel below
+ASCII_SPACES = {ord(x): None for x in '\x20\x0a\x09\x0c\x0d'}
+
+
+class StopParsing(Exception):
+    pass
+
+
+class Panel:
+    '''The parts of one stat_panel_<game> div that the bot reads.
+
+    table is the first table in the div as a list of rows, one per <tr>,
+    each holding the row's text the way BeautifulSoup's tr.strings would:
+    whitespace-only strings become ' ' or '\\n' and the '\\n's are left
+    out. list_items holds the direct <li> children of the div's first
+    ul.list-unstyled as HTML strings.
+    '''
+
+    def __init__(self):
+        self.table = []
+        self.list_items = []
+
+
+class PanelParser(HTMLParser):
+    '''Collects a Panel for every game in games (every game on the page if
+    games is None). Once all of them have been read, done is True and
+    further input is ignored.
+    '''
+
+    def __init__(self, games=None):
+        super().__init__(convert_charrefs=True)
+        self.games = None if games is None else set(games)
+        self.panels = {}
+        self.done = False
+
+        self.panel = None
+        self.text = []
+
+    def feed(self, data):
+        if self.done:
+            return
+
+        try:
+            super().feed(data)
+        except StopParsing:
+            self.done = True
+
+    def close(self):
+        if self.done:
+            return
+
+        try:
+            super().close()
+        except StopParsing:
+            self.done = True
+
+    def open_panel(self, game):
+        self.panel = Panel()
+        self.panels[game] = self.panel
+
+        self.div_depth = 1
+        self.table_depth = 0
+        self.table_seen = False
+        self.rows = []
+        self.list_depth = 0
+        self.list_seen = False
+        self.item = None
+        self.skip_text = False
+
+    def close_panel(self):
+        self.panel = None
+
+        if self.games is not None and self.games.issubset(self.panels.keys()):
+            raise StopParsing()
+
+    def flush_text(self):
+        # Text arrives in pieces, so it is only handed out when the next
+        # tag or comment starts, just like BeautifulSoup does
+        if len(self.text) == 0:
+            return
+
+        data = ''.join(self.text)
+        self.text = []
+
+        if data.translate(ASCII_SPACES) == '':
+            data = '\n' if '\n' in data else ' '
+
+        if data != '\n':
+            for row in self.rows:
+                row.append(data)
+
+        if self.item is not None:
+            self.item.append(html.escape(data, quote=False))
+
+    def handle_starttag(self, tag, attrs):
+        if self.panel is None:
+            if tag != 'div':
+                return
+
+            domid = dict(attrs).get('id') or ''
+            game = domid[len(PANEL_PREFIX):]
+            if not domid.startswith(PANEL_PREFIX) or game in self.panels:
+                return
+
+            if self.games is None or game in self.games:
+                self.open_panel(game)
+
+            return
+
+        self.flush_text()
+
+        if tag == 'div':
+            self.div_depth += 1
+        elif tag in ['script', 'style']:
+            self.skip_text = True
+
+        if tag == 'table' and self.table_depth > 0:
+            self.table_depth += 1
+        elif tag == 'table' and not self.table_seen:
+            self.table_depth = 1
+            self.table_seen = True
+        elif tag == 'tr' and self.table_depth > 0:
+            row = []
+            self.panel.table.append(row)
+            self.rows.append(row)
+
+        if self.item is not None:
+            attr_string = ''.join(f' {key}="{value}"' for key, value in attrs)
+            self.item.append(f'<{tag}{attr_string}>')
+
+        if tag == 'ul' and self.list_depth > 0:
+            self.list_depth += 1
+        elif tag == 'ul' and not self.list_seen and 'list-unstyled' in (dict(attrs).get('class') or '').split():
+            self.list_depth = 1
+            self.list_seen = True
+        elif tag == 'li' and self.list_depth == 1 and self.item is None:
+            attr_string = ''.join(f' {key}="{value}"' for key, value in attrs)
+            self.item = [f'<li{attr_string}>']
+
+    def handle_endtag(self, tag):
+        if self.panel is None:
+            return
+
+        self.flush_text()
+
+        if tag in ['script', 'style']:
+            self.skip_text = False
+        elif tag == 'tr' and len(self.rows) > 0:
+            self.rows.pop()
+        elif tag == 'table' and self.table_depth > 0:
+            self.table_depth -= 1
+            if self.table_depth == 0:
+                self.rows = []
+
+        if self.item is not None:
+            self.item.append(f'</{tag}>')
+            if tag == 'li' and self.list_depth == 1:
+                self.panel.list_items.append(''.join(self.item))
+                self.item = None
+
+        if tag == 'ul' and self.list_depth > 0:
+            self.list_depth -= 1
+        elif tag == 'div':
+            self.div_depth -= 1
+            if self.div_depth == 0:
+                self.close_panel()
+
+    def handle_data(self, data):
+        if self.panel is not None and not self.skip_text:
+            self.text.append(data)
+
+    def handle_comment(self, data):
+        if self.panel is not None:
+            self.flush_text()
+
+
+def parse_panels(page, games=None):
+    '''Parse a whole plancke page held in a string. Returns a dict of game
+    name to Panel.
+    '''
+    parser = PanelParser(games)
+    for i in range(0, len(page), CHUNK_SIZE):
+        parser.feed(page[i:i + CHUNK_SIZE])
+        if parser.done:
+            break
+
+    parser.close()
+    return parser.panels
+
+
+async def parse_response(res, games=None):
+    '''Like parse_panels, but reads an aiohttp response as it downloads
+    and stops downloading once the panels have been found.
+    '''
+    decoder = codecs.getincrementaldecoder(res.charset or 'utf-8')(errors='replace')
+    parser = PanelParser(games)
+
+    async for chunk in res.content.iter_chunked(CHUNK_SIZE):
+        parser.feed(decoder.decode(chunk))
+        if parser.done:
+            break
+
+    parser.feed(decoder.decode(b'', final=True))
+    parser.close()
+    return parser.panels
+
+
+if __name__ == '__main__':
+    # Benchmark against the BeautifulSoup parser used before. Pass saved
+    # plancke pages as arguments, e.g. python plancke.py pages/*.html
+    import sys
+    import time
+    import tracemalloc
+
+    from bs4 import BeautifulSoup, SoupStrainer
+
+    def soup_table(page, game):
+        domid = f'{PANEL_PREFIX}{game}'
+        strainer = SoupStrainer('div', {'id': domid})
+        soup = BeautifulSoup(page, 'html.parser', parse_only=strainer)
+        stat_table = soup.find('div', {'id': domid}).findChild('table')
+        rows = [[x for x in row.strings if x != '\n'] for row in stat_table.descendants if row.name == 'tr']
+        return [x for x in rows if len(x) > 0]
+
+    def stream_table(page, game):
+        panel = parse_panels(page, [game])[game]
+        return [x for x in panel.table if len(x) > 0]
+
+    def measure(function, pages, game):
+        tracemalloc.start()
+        start = time.perf_counter()
+        results = [function(page, game) for page in pages]
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return results, seconds, peak
+
+    pages = []
+    for path in sys.argv[1:]:
+        with open(path) as file_:
+            pages.append(file_.read())
+
+    for game in ['BedWars', 'SkyWars']:
+        old, old_seconds, old_peak = measure(soup_table, pages, game)
+        new, new_seconds, new_peak = measure(stream_table, pages, game)
+        assert old == new, f'{game} tables differ'
+
+        print(f'{game} ({len(pages)} pages)')
+        print(f'  BeautifulSoup: {old_seconds / len(pages) * 1000:.1f} ms/page, peak {old_peak / 1024:,.0f} KiB')
+        print(f'  PanelParser:   {new_seconds / len(pages) * 1000:.1f} ms/page, peak {new_peak / 1024:,.0f} KiB')
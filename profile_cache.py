@@ -0,0 +1,154 @@
+# Disk cache of Mojang profiles, shared by everything that turns
+# usernames into UUIDs or back (mojang.Player and its subclasses, and the
+# async lookups used by hypixel). It survives restarts, so the names
+# people look up every day stop costing a Mojang request each time.
+#
+# Three tables, each with its own time to live:
+#   names   lowercased username -> uuid and the name as Mojang spells it
+#   uuids   uuid -> current name
+#   invalid lowercased usernames Mojang said do not exist
+
+import os
+import sqlite3
+import time
+
+import metrics
+
+DATABASE = 'data/profiles.sqlite'
+
+# Names can be changed at most every 30 days, and a freed name can be
+# claimed by someone else, so lookups in both directions expire
+NAME_TTL = 24 * 60 * 60
+UUID_TTL = 24 * 60 * 60
+
+# Names that did not exist may be registered at any time
+INVALID_TTL = 60 * 60
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS names (
+    name TEXT PRIMARY KEY,
+    uuid TEXT NOT NULL,
+    username TEXT NOT NULL,
+    stored_at INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS uuids (
+    uuid TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    stored_at INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS invalid (
+    name TEXT PRIMARY KEY,
+    stored_at INTEGER NOT NULL
+) WITHOUT ROWID;
+'''
+
+# Returned by lookup_name for names known not to exist
+INVALID = object()
+
+CONNECTION = None
+
+
+def connect():
+    global CONNECTION
+    if CONNECTION is None:
+        os.makedirs(os.path.dirname(DATABASE), exist_ok=True)
+        CONNECTION = sqlite3.connect(DATABASE)
+        CONNECTION.executescript(SCHEMA)
+        prune()
+
+    return CONNECTION
+
+
+def prune(now=None):
+    '''Delete every expired row.
+    '''
+    now = int(time.time()) if now is None else now
+    with connect() as db:
+        db.execute('DELETE FROM names WHERE stored_at < ?', (now - NAME_TTL,))
+        db.execute('DELETE FROM uuids WHERE stored_at < ?', (now - UUID_TTL,))
+        db.execute('DELETE FROM invalid WHERE stored_at < ?', (now - INVALID_TTL,))
+
+
+def normalize_uuid(uuid):
+    return uuid.replace('-', '').lower()
+
+
+def lookup_name(name, now=None):
+    '''Returns the cached profile ({'id': ..., 'name': ...}) for a
+    username, INVALID if the name is known not to exist, or None if
+    Mojang has to be asked.
+    '''
+    now = int(time.time()) if now is None else now
+    db = connect()
+
+    row = db.execute('SELECT uuid, username FROM names WHERE name = ? AND stored_at >= ?',
+                     (name.lower(), now - NAME_TTL)).fetchone()
+    if row is not None:
+        metrics.increment('profiles.name_hits')
+        return {'id': row[0], 'name': row[1]}
+
+    row = db.execute('SELECT 1 FROM invalid WHERE name = ? AND stored_at >= ?',
+                     (name.lower(), now - INVALID_TTL)).fetchone()
+    if row is not None:
+        metrics.increment('profiles.invalid_hits')
+        return INVALID
+
+    metrics.increment('profiles.misses')
+    return None
+
+
+def lookup_uuid(uuid, now=None):
+    '''Returns the cached profile for a uuid, or None.
+    '''
+    now = int(time.time()) if now is None else now
+    row = connect().execute('SELECT uuid, username FROM uuids WHERE uuid = ? AND stored_at >= ?',
+                            (normalize_uuid(uuid), now - UUID_TTL)).fetchone()
+    if row is None:
+        metrics.increment('profiles.misses')
+        return None
+
+    metrics.increment('profiles.uuid_hits')
+    return {'id': row[0], 'name': row[1]}
+
+
+def store(profiles, invalid=(), now=None):
+    '''Save profiles from Mojang (dicts with 'id' and 'name') in both
+    directions, and the usernames in invalid as not existing.
+    '''
+    now = int(time.time()) if now is None else now
+    with connect() as db:
+        db.executemany('INSERT OR REPLACE INTO names VALUES (?, ?, ?, ?)',
+                       [(x['name'].lower(), normalize_uuid(x['id']), x['name'], now) for x in profiles])
+        db.executemany('INSERT OR REPLACE INTO uuids VALUES (?, ?, ?)',
+                       [(normalize_uuid(x['id']), x['name'], now) for x in profiles])
+        db.executemany('INSERT OR REPLACE INTO invalid VALUES (?, ?)',
+                       [(x.lower(), now) for x in invalid])
+
+
+def split(names, now=None):
+    '''Sorts names into cached profiles, names known to be invalid, and
+    names that have to be looked up. Returns the three lists.
+    '''
+    profiles = []
+    invalid = []
+    missing = []
+    for name in names:
+        found = lookup_name(name, now)
+        if found is None:
+            missing.append(name)
+        elif found is INVALID:
+            invalid.append(name)
+        else:
+            profiles.append(found)
+
+    return profiles, invalid, missing
+
+
+def unmatched(names, profiles):
+    '''The names that none of profiles belongs to. Mojang leaves names
+    that do not exist out of its response.
+    '''
+    found = {x['name'].lower() for x in profiles}
+    return [x for x in names if x.lower() not in found]
@@ -0,0 +1,76 @@
+# Channels that have new Splatoon 2 rotations posted to them. Each guild
+# has at most one subscribed channel, with optional filters: game modes,
+# rulesets and favourite stages. Kept in data/subscriptions.sqlite so
+# subscriptions last across restarts.
+
+import os
+import sqlite3
+
+DATABASE = 'data/subscriptions.sqlite'
+
+# The filters of a subscription, each stored as a comma separated list
+FILTERS = ['gamemodes', 'rulesets', 'stages']
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS subscriptions (
+    guild_id TEXT PRIMARY KEY,
+    channel_id TEXT NOT NULL,
+    gamemodes TEXT NOT NULL,
+    rulesets TEXT NOT NULL,
+    stages TEXT NOT NULL
+) WITHOUT ROWID;
+'''
+
+CONNECTION = None
+
+
+def connect():
+    global CONNECTION
+    if CONNECTION is None:
+        os.makedirs(os.path.dirname(DATABASE), exist_ok=True)
+        CONNECTION = sqlite3.connect(DATABASE)
+        CONNECTION.executescript(SCHEMA)
+
+    return CONNECTION
+
+
+def parse(row):
+    # A subscription dict from a subscriptions row. Filters are sorted
+    # tuples, so subscriptions with the same filters compare equal.
+    subscription = {'guild_id': int(row[0]), 'channel_id': int(row[1])}
+    for name, value in zip(FILTERS, row[2:]):
+        subscription[name] = tuple(sorted(x for x in value.split(',') if x != ''))
+
+    return subscription
+
+
+def subscribe(guild_id, channel_id, gamemodes=(), rulesets=(), stages=()):
+    '''Posts rotations in the guild to channel_id from now on, replacing
+    the guild's subscription if it has one. Empty filters allow
+    everything.
+    '''
+    with connect() as db:
+        db.execute('INSERT OR REPLACE INTO subscriptions VALUES (?, ?, ?, ?, ?)',
+                   (str(guild_id), str(channel_id), *[','.join(sorted(x)) for x in [gamemodes, rulesets, stages]]))
+
+
+def unsubscribe(guild_id):
+    '''Stops posting rotations in the guild. Returns False if it was not
+    subscribed.
+    '''
+    with connect() as db:
+        return db.execute('DELETE FROM subscriptions WHERE guild_id = ?', (str(guild_id),)).rowcount > 0
+
+
+def get(guild_id):
+    '''The guild's subscription (see parse), or None.
+    '''
+    row = connect().execute('SELECT * FROM subscriptions WHERE guild_id = ?', (str(guild_id),)).fetchone()
+    return None if row is None else parse(row)
+
+
+def get_all():
+    '''Every subscription, as dicts with guild_id, channel_id and a tuple
+    for each of FILTERS.
+    '''
+    return [parse(x) for x in connect().execute('SELECT * FROM subscriptions')]
@@ -0,0 +1,159 @@
+# Local history of each linked user's Salmon Run shifts, fed from
+# /api/coop_results as the response streams in (see json_stream). Only
+# the few fields >salmonrank shows are kept, and each user's totals are
+# updated as shifts are added, so comparisons are read straight from
+# the users table.
+
+import os
+import sqlite3
+
+DATABASE = 'data/salmon.sqlite'
+
+COLUMNS = ['uid', 'job_id', 'start_time', 'stage', 'grade', 'grade_point', 'hazard', 'cleared',
+           'failure_wave', 'golden_eggs', 'power_eggs', 'deaths', 'rescues']
+
+# The fields of an /api/coop_results entry that parse_shift reads
+SHIFT_FIELDS = ['job_id', 'start_time', 'schedule.stage.name', 'grade.name', 'grade_point', 'danger_rate',
+                'job_result.is_clear', 'job_result.failure_wave', 'my_result.golden_ikura_num', 'my_result.ikura_num',
+                'my_result.dead_count', 'my_result.help_count']
+
+# Hazard levels are counted in buckets this many percent wide
+HAZARD_BUCKET = 20
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS shifts (
+    uid TEXT NOT NULL,
+    job_id INTEGER NOT NULL,
+    start_time INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    grade TEXT NOT NULL,
+    grade_point INTEGER NOT NULL,
+    hazard REAL NOT NULL,
+    cleared INTEGER NOT NULL,
+    failure_wave INTEGER,
+    golden_eggs INTEGER NOT NULL,
+    power_eggs INTEGER NOT NULL,
+    deaths INTEGER NOT NULL,
+    rescues INTEGER NOT NULL,
+    PRIMARY KEY (uid, job_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS users (
+    uid TEXT PRIMARY KEY,
+    last_job INTEGER NOT NULL,
+    grade TEXT NOT NULL,
+    grade_point INTEGER NOT NULL,
+    shifts INTEGER NOT NULL,
+    cleared INTEGER NOT NULL,
+    golden_eggs INTEGER NOT NULL,
+    power_eggs INTEGER NOT NULL,
+    hazard REAL NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS hazards (
+    uid TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    shifts INTEGER NOT NULL,
+    cleared INTEGER NOT NULL,
+    PRIMARY KEY (uid, bucket)
+) WITHOUT ROWID;
+'''
+
+USER_FIELDS = ['grade', 'grade_point', 'shifts', 'cleared', 'golden_eggs', 'power_eggs', 'hazard']
+
+CONNECTION = None
+
+
+def connect():
+    global CONNECTION
+    if CONNECTION is None:
+        os.makedirs(os.path.dirname(DATABASE), exist_ok=True)
+        CONNECTION = sqlite3.connect(DATABASE)
+        CONNECTION.executescript(SCHEMA)
+
+    return CONNECTION
+
+
+def parse_shift(uid, entry):
+    # A shifts row (see COLUMNS) from one entry of /api/coop_results
+    job_result = entry['job_result']
+    my_result = entry['my_result']
+    return (
+        str(uid),
+        int(entry['job_id']),
+        int(entry['start_time']),
+        entry['schedule']['stage']['name'],
+        entry['grade']['name'],
+        int(entry['grade_point']),
+        float(entry['danger_rate']),
+        int(job_result['is_clear']),
+        job_result.get('failure_wave'),
+        int(my_result['golden_ikura_num']),
+        int(my_result['ikura_num']),
+        int(my_result['dead_count']),
+        int(my_result['help_count'])
+    )
+
+
+def last_job(uid):
+    # The newest job_id stored for uid, or 0
+    row = connect().execute('SELECT last_job FROM users WHERE uid = ?', (str(uid),)).fetchone()
+    return 0 if row is None else row[0]
+
+
+def add(uid, rows):
+    '''Add shifts rows newer than the newest one stored for uid and update
+    their totals. Returns how many were added.
+    '''
+    uid = str(uid)
+    db = connect()
+
+    user = db.execute(f'SELECT last_job, {", ".join(USER_FIELDS)} FROM users WHERE uid = ?', (uid,)).fetchone()
+    last, grade, grade_point, shifts, cleared, golden_eggs, power_eggs, hazard = user or (0, '', 0, 0, 0, 0, 0, 0.0)
+
+    rows = sorted(x for x in rows if x[1] > last)
+    if len(rows) == 0:
+        return 0
+
+    buckets = {}
+    for row in rows:
+        shift = dict(zip(COLUMNS, row))
+        shifts += 1
+        cleared += shift['cleared']
+        golden_eggs += shift['golden_eggs']
+        power_eggs += shift['power_eggs']
+        hazard += shift['hazard']
+
+        bucket = int(shift['hazard'] // HAZARD_BUCKET * HAZARD_BUCKET)
+        count = buckets.get(bucket, (0, 0))
+        buckets[bucket] = (count[0] + 1, count[1] + shift['cleared'])
+
+    # The grade after the newest shift
+    grade, grade_point = shift['grade'], shift['grade_point']
+
+    with db:
+        db.executemany(f'INSERT OR IGNORE INTO shifts VALUES ({", ".join("?" * len(COLUMNS))})', rows)
+        db.execute(f'INSERT OR REPLACE INTO users VALUES ({", ".join("?" * (len(USER_FIELDS) + 2))})',
+                   (uid, rows[-1][1], grade, grade_point, shifts, cleared, golden_eggs, power_eggs, hazard))
+        db.executemany('''INSERT INTO hazards VALUES (?, ?, ?, ?)
+                          ON CONFLICT (uid, bucket) DO UPDATE SET
+                          shifts = shifts + excluded.shifts, cleared = cleared + excluded.cleared''',
+                       [(uid, bucket, count[0], count[1]) for bucket, count in buckets.items()])
+
+    return len(rows)
+
+
+def get_user(uid):
+    '''The totals of uid as a dict of USER_FIELDS, or None if they have no
+    shifts stored. hazard is the sum of every shift's hazard level.
+    '''
+    row = connect().execute(f'SELECT {", ".join(USER_FIELDS)} FROM users WHERE uid = ?', (str(uid),)).fetchone()
+    return None if row is None else dict(zip(USER_FIELDS, row))
+
+
+def hazards(uid):
+    '''(lowest hazard level of the bucket, shifts, cleared) for each bucket
+    of HAZARD_BUCKET percent uid has played, lowest first.
+    '''
+    rows = connect().execute('SELECT bucket, shifts, cleared FROM hazards WHERE uid = ? ORDER BY bucket', (str(uid),))
+    return rows.fetchall()
@@ -0,0 +1,214 @@
+# Local history of Bedwars stats. Every time the bot fetches a player's
+# Bedwars stats, the numbers for each mode are saved here, so FKDR, KDR
+# and WLR over the last day, week or month can be worked out without
+# asking hystats.net.
+
+import os
+import sqlite3
+import time
+
+DATABASE = 'data/snapshots.sqlite'
+
+# At most one snapshot per player per interval
+SNAPSHOT_INTERVAL = 60 * 60
+
+# The background job re-snapshots players seen within this window
+TRACK_FOR = 30 * 24 * 60 * 60
+
+PERIODS = [
+    ('day', 24 * 60 * 60),
+    ('week', 7 * 24 * 60 * 60),
+    ('month', 30 * 24 * 60 * 60)
+]
+
+# Plancke's stat names and their columns
+FIELDS = [
+    ('Kills', 'kills'), ('Deaths', 'deaths'),
+    ('Final Kills', 'final_kills'), ('Final Deaths', 'final_deaths'),
+    ('Wins', 'wins'), ('Losses', 'losses')
+]
+
+COLUMNS = [column for stat, column in FIELDS]
+
+SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS players (
+    uuid TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    last_seen INTEGER NOT NULL,
+    last_snapshot INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS snapshots (
+    uuid TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    taken_at INTEGER NOT NULL,
+    {', '.join(f'{x} INTEGER' for x in COLUMNS)},
+    PRIMARY KEY (uuid, mode, taken_at)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS players_last_seen ON players (last_seen);
+'''
+
+CONNECTION = None
+
+# seen and record are called from the event loop for every player in a
+# table, so their writes wait here as (sql, rows) and are saved in one
+# transaction by flush. Reads flush first.
+PENDING = []
+# uuid -> when a snapshot still in PENDING was taken
+PENDING_SNAPSHOTS = {}
+
+
+def connect():
+    global CONNECTION
+    if CONNECTION is None:
+        os.makedirs(os.path.dirname(DATABASE), exist_ok=True)
+        CONNECTION = sqlite3.connect(DATABASE)
+        CONNECTION.executescript(SCHEMA)
+
+    return CONNECTION
+
+
+def flush():
+    '''Saves the writes waiting in PENDING.
+    '''
+    if len(PENDING) == 0:
+        return
+
+    with connect() as db:
+        for sql, rows in PENDING:
+            db.executemany(sql, rows)
+
+    PENDING.clear()
+    PENDING_SNAPSHOTS.clear()
+
+
+def seen(uuid, username, now=None):
+    '''Mark a player as seen so the background job keeps snapshotting
+    them.
+    '''
+    now = int(time.time()) if now is None else now
+    PENDING.append(('''INSERT INTO players (uuid, username, last_seen) VALUES (?, ?, ?)
+                       ON CONFLICT (uuid) DO UPDATE SET username = excluded.username, last_seen = excluded.last_seen''',
+                    [(uuid, username, now)]))
+
+
+def record(uuid, username, numbers, now=None):
+    '''Save a snapshot of a dict from BedwarsPlayer.get_numbers. Returns
+    False if the player already has a snapshot from the last
+    SNAPSHOT_INTERVAL seconds.
+    '''
+    now = int(time.time()) if now is None else now
+
+    last_snapshot = PENDING_SNAPSHOTS.get(uuid)
+    if last_snapshot is None:
+        row = connect().execute('SELECT last_snapshot FROM players WHERE uuid = ?', (uuid,)).fetchone()
+        last_snapshot = None if row is None else row[0]
+
+    if last_snapshot is not None and now - last_snapshot < SNAPSHOT_INTERVAL:
+        return False
+
+    rows = []
+    for mode, values in numbers.items():
+        counts = [values.get(stat) for stat, column in FIELDS]
+        if any(x is not None for x in counts):
+            rows.append((uuid, mode, now, *counts))
+
+    PENDING.append((f'INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, {", ".join("?" * len(COLUMNS))})', rows))
+    PENDING.append(('''INSERT INTO players (uuid, username, last_seen, last_snapshot) VALUES (?, ?, ?, ?)
+                       ON CONFLICT (uuid) DO UPDATE SET username = excluded.username,
+                       last_seen = MAX(last_seen, excluded.last_seen), last_snapshot = excluded.last_snapshot''',
+                    [(uuid, username, now, now)]))
+    PENDING_SNAPSHOTS[uuid] = now
+
+    return True
+
+
+def due_players(now=None):
+    '''Players seen within TRACK_FOR whose last snapshot is older than
+    SNAPSHOT_INTERVAL, as (uuid, username) tuples.
+    '''
+    now = int(time.time()) if now is None else now
+    flush()
+    rows = connect().execute('''SELECT uuid, username FROM players
+                                WHERE last_seen >= ? AND last_snapshot <= ?
+                                ORDER BY last_snapshot''',
+                             (now - TRACK_FOR, now - SNAPSHOT_INTERVAL))
+    return rows.fetchall()
+
+
+def snapshot_at(uuid, mode, before):
+    '''The newest snapshot taken at or before the timestamp before, as a
+    dict, or None.
+    '''
+    flush()
+    row = connect().execute(f'''SELECT taken_at, {', '.join(COLUMNS)} FROM snapshots
+                                WHERE uuid = ? AND mode = ? AND taken_at <= ?
+                                ORDER BY taken_at DESC LIMIT 1''',
+                            (uuid, mode, before)).fetchone()
+    return None if row is None else dict(zip(['taken_at', *COLUMNS], row))
+
+
+def first_snapshot(uuid, mode):
+    flush()
+    row = connect().execute(f'''SELECT taken_at, {', '.join(COLUMNS)} FROM snapshots
+                                WHERE uuid = ? AND mode = ?
+                                ORDER BY taken_at LIMIT 1''',
+                            (uuid, mode)).fetchone()
+    return None if row is None else dict(zip(['taken_at', *COLUMNS], row))
+
+
+def prune(now=None):
+    '''Deletes snapshots that changes can no longer use: for each player
+    and mode, the ones older than the newest snapshot from before the
+    longest of PERIODS. Returns how many were deleted.
+    '''
+    now = int(time.time()) if now is None else now
+    cutoff = now - max(seconds for period, seconds in PERIODS)
+    flush()
+    with connect() as db:
+        return db.execute('''DELETE FROM snapshots WHERE taken_at < (
+                                 SELECT MAX(base.taken_at) FROM snapshots AS base
+                                 WHERE base.uuid = snapshots.uuid AND base.mode = snapshots.mode AND base.taken_at <= ?
+                             )''', (cutoff,)).rowcount
+
+
+def ratio(top, bottom):
+    if top is None or bottom is None:
+        return None
+
+    return top / bottom if bottom else top
+
+
+def changes(uuid, mode='Overall', now=None):
+    '''FKDR, KDR and WLR over each of PERIODS, worked out from the
+    difference between the newest snapshot and the last one before the
+    period started. If the player has not been tracked for the whole
+    period, the oldest snapshot is used and since says when that was.
+
+    Returns a list of dicts with period, since, fkdr, kdr and wlr. Periods
+    are left out when there is less than two snapshots to compare.
+    '''
+    now = int(time.time()) if now is None else now
+    latest = snapshot_at(uuid, mode, now)
+    if latest is None:
+        return []
+
+    first = first_snapshot(uuid, mode)
+
+    result = []
+    for period, seconds in PERIODS:
+        base = snapshot_at(uuid, mode, now - seconds) or first
+        if base['taken_at'] >= latest['taken_at']:
+            continue
+
+        delta = {x: None if latest[x] is None or base[x] is None else latest[x] - base[x] for x in COLUMNS}
+        result.append({
+            'period': period,
+            'since': base['taken_at'],
+            'fkdr': ratio(delta['final_kills'], delta['final_deaths']),
+            'kdr': ratio(delta['kills'], delta['deaths']),
+            'wlr': ratio(delta['wins'], delta['losses'])
+        })
+
+    return result
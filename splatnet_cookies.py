@@ -0,0 +1,163 @@
+# Keeps each linked user's iksm_session cookie fresh. Cookies are renewed
+# in the background before they expire for users who have used the bot
+# recently, so commands rarely wait for the login chain in iksm, and
+# concurrent renewals for the same user share one chain.
+
+import asyncio
+import time
+
+import iksm
+import metrics
+
+# SplatNet cookies last about a day. Cookies older than REFRESH_AGE are
+# renewed in the background, and ones older than COOKIE_LIFETIME are
+# renewed before they are used.
+COOKIE_LIFETIME = 24 * 60 * 60
+REFRESH_AGE = 20 * 60 * 60
+
+# Users who have made a SplatNet request this recently have their cookies
+# kept fresh
+ACTIVE_WINDOW = 3 * 24 * 60 * 60
+
+# How many login chains may run at once
+REFRESH_CONCURRENCY = 2
+
+
+class CookieManager:
+    def __init__(self):
+        # uid -> the user's data from iksm.get_user, with the newest cookie
+        self.users = {}
+        # uid -> when the user last made a request
+        self.active = {}
+        # uid -> future of a renewal in progress
+        self.refreshing = {}
+
+        self.limit = None
+
+        metrics.gauge('splatnet.cookies.active', lambda: len(self.active_users()))
+        metrics.gauge('splatnet.cookies.refreshing', lambda: len(self.refreshing))
+
+    def issued(self, user):
+        # When the user's cookie was issued, or None if unknown
+        issued = user.get('cookie_time')
+        if issued is None or not issued.isdigit():
+            return None
+
+        return int(issued)
+
+    def age(self, user):
+        issued = self.issued(user)
+        return None if issued is None else time.time() - issued
+
+    def remember(self, uid, user):
+        # Keeps whichever of user and the copy already known has the newer
+        # cookie, since Firestore can be read while a renewal is saving
+        uid = str(uid)
+        known = self.users.get(uid)
+        if known is not None and (self.issued(known) or 0) >= (self.issued(user) or 0):
+            user.update(cookie=known['cookie'], cookie_time=known.get('cookie_time'))
+
+        self.users[uid] = user
+        return user
+
+    async def get_cookie(self, http, uid, user):
+        '''Returns the cookie to use for the Discord user uid, whose data
+        from iksm.get_user is user, and marks them as active. A cookie
+        that has surely expired is renewed first.
+        '''
+        uid = str(uid)
+        user = self.remember(uid, user)
+        self.active[uid] = time.time()
+
+        age = self.age(user)
+        if age is not None and age > COOKIE_LIFETIME:
+            metrics.increment('splatnet.cookies.expired')
+            return await self.refresh(http, uid, user['cookie'])
+
+        if age is not None and age > REFRESH_AGE:
+            self.refresh_in_background(http, uid)
+
+        return user['cookie']
+
+    async def refresh(self, http, uid, cookie):
+        '''Returns a new cookie for uid, replacing cookie, which SplatNet
+        turned down. If the cookie was already replaced since, the new one
+        is returned without logging in again.
+        '''
+        uid = str(uid)
+        user = self.users[uid]
+        if user['cookie'] != cookie:
+            return user['cookie']
+
+        future = self.refreshing.get(uid)
+        if future is None:
+            future = asyncio.ensure_future(self.renew(http, uid, user))
+            self.refreshing[uid] = future
+            future.add_done_callback(lambda x: self.refreshing.pop(uid, None))
+        else:
+            metrics.increment('splatnet.cookies.coalesced')
+
+        return await asyncio.shield(future)
+
+    def refresh_in_background(self, http, uid):
+        if uid in self.refreshing:
+            return
+
+        asyncio.ensure_future(self.refresh_quietly(http, uid))
+
+    async def refresh_quietly(self, http, uid):
+        try:
+            await self.refresh(http, uid, self.users[uid]['cookie'])
+        except Exception as err:
+            print(f'Could not renew the SplatNet cookie of {uid}: {err!r}')
+
+    async def renew(self, http, uid, user):
+        if self.limit is None:
+            self.limit = asyncio.Semaphore(REFRESH_CONCURRENCY)
+
+        async with self.limit:
+            start = time.monotonic()
+            try:
+                nickname, cookie = await iksm.get_cookie_async(http, user['session_token'])
+            except Exception:
+                metrics.increment('splatnet.cookies.refresh_errors')
+                raise
+
+            metrics.observe('splatnet.cookies.refresh', time.monotonic() - start)
+
+        # Firestore may have been read again while this ran, so the copy
+        # in users is updated as well
+        issued = int(time.time())
+        user.update(cookie=cookie, cookie_time=str(issued))
+        self.users[uid].update(cookie=cookie, cookie_time=str(issued))
+        metrics.increment('splatnet.cookies.refreshes')
+
+        try:
+            await iksm.save_cookie_async(http, uid, cookie, issued)
+        except Exception as err:
+            # The cookie works anyway, it is saved again next renewal
+            print(f'Could not save the SplatNet cookie of {uid}: {err!r}')
+
+        return cookie
+
+    def active_users(self):
+        cutoff = time.time() - ACTIVE_WINDOW
+        return [uid for uid, used in self.active.items() if used >= cutoff]
+
+    def refresh_due(self, http):
+        '''Starts renewing the cookies of active users that are older than
+        REFRESH_AGE, or of unknown age. At most REFRESH_CONCURRENCY run at
+        once.
+        '''
+        cutoff = time.time() - ACTIVE_WINDOW
+        for uid, used in list(self.active.items()):
+            if used < cutoff:
+                del self.active[uid]
+
+        for uid in self.active_users():
+            age = self.age(self.users[uid])
+            if age is None or age > REFRESH_AGE:
+                self.refresh_in_background(http, uid)
+
+
+COOKIES = CookieManager()
@@ -1,44 +1,104 @@
+import asyncio
 import datetime
+import difflib
+import functools
 import json
+import sys
+import time
 
+import aiohttp
 import requests
 
 import iksm
+import json_stream
+import match_history
+import metrics
+import salmon_history
+import splatnet_cookies
+import splatoon_data
+import throttle
 import tools
 
 BASE_URL = 'http://localhost:8080'
 
-with open('data/splatoon2/gamemodes.json') as file_:
-    GAMEMODES = json.loads(file_.read())
+COLORS = [0xfa5a00, 0x2851f6, 0xc800dc, 0xf93195, 0x00c8b4, 0xa0cc0a]
 
-with open('data/splatoon2/rulesets.json') as file_:
-    RULESETS = json.loads(file_.read())
+SPLATNET_URL = 'https://app.splatoon2.nintendo.net'
+
+# The Discord user whose Nintendo account is used to get the schedules
+SCHEDULE_ACCOUNT = '580157651548241940'
+
+# Limits for SplatNet requests: the time for the whole request, and how
+# many connections are kept open and for how many seconds
+SPLATNET_TIMEOUT = aiohttp.ClientTimeout(total=10)
+SPLATNET_CONNECTIONS = 8
+SPLATNET_KEEPALIVE = 60
+
+SPLATNET_SESSION = None
+
+# Seconds after a rotation ends before the schedule is fetched again, and
+# between attempts when that fails
+ROTATION_DELAY = 30
+REFRESH_RETRY = 60
+
+# How close a misspelled stage name has to be to match (see
+# difflib.get_close_matches)
+STAGE_CUTOFF = 0.6
+
+# Each ranked ruleset, and its rank's field in /api/records
+RANK_MODES = [
+    ('Splat Zones', 'udemae_zones'),
+    ('Tower Control', 'udemae_tower'),
+    ('Rainmaker', 'udemae_rainmaker'),
+    ('Clam Blitz', 'udemae_clam')
+]
+
+# The fields of SplatNet responses that are kept when they are read
+# with read_results, read_records and read_salmon_results. code is where
+# SplatNet says the cookie was turned down.
+RESULT_FIELDS = json_stream.fields('code', *[f'results.{x}' for x in match_history.BATTLE_FIELDS])
+RECORD_FIELDS = json_stream.fields('code', *[f'records.player.{key}.name' for display, key in RANK_MODES])
+SALMON_RESULT_FIELDS = json_stream.fields('code', *[f'results.{x}' for x in salmon_history.SHIFT_FIELDS])
+
+
+class Interned:
+    '''Base for reference data that is the same everywhere it shows up.
+    get returns the one object made for each id, so a stage in a
+    hundred schedules and matches is stored once.
+    '''
+    __slots__ = ()
+
+    @classmethod
+    def get(cls, data):
+        key = data.get('id', data['name'])
+        found = cls.interned.get(key)
+        if found is None:
+            found = cls.interned[key] = cls(data)
+
+        return found
 
-COLORS = [0xfa5a00, 0x2851f6, 0xc800dc, 0xf93195, 0x00c8b4, 0xa0cc0a]
 
-class Stage:
-    name = None
-    sid = None
+class Stage(Interned):
+    __slots__ = ('sid', 'name')
+    interned = {}
 
     def __init__(self, data):
-        self.name = data['name']
-        self.sid = data['id']
+        self.name = sys.intern(data['name'])
+        self.sid = sys.intern(data['id'])
 
     def __str__(self):
         return self.name
 
 
-class Weapon:
-    wid = None
-    name = None
-    image = None
-    thumbnail = None
+class Weapon(Interned):
+    __slots__ = ('wid', 'name', 'image', 'thumbnail')
+    interned = {}
 
     def __init__(self, entry):
-        self.wid = entry['id']
-        self.name = entry['name']
-        self.image = entry['image']
-        self.thumbnail = entry['thumbnail']
+        self.wid = entry.get('id')
+        self.name = sys.intern(entry['name'])
+        self.image = entry.get('image')
+        self.thumbnail = entry.get('thumbnail')
 
     def __str__(self):
         return self.name
@@ -51,19 +111,41 @@ def get_salmon_weapons(weapons):
     result = []
     for weapon in weapons:
         key = [x for x in weapon.keys() if x not in ['image', 'id', 'name', 'thumbnail']][0]
-        result.append(Weapon(weapon[key]))
+        result.append(Weapon.get(weapon[key]))
 
-    return result
+    return tuple(result)
+
+
+@functools.lru_cache(maxsize=1024)
+def get_time(stamp):
+    # One datetime for each timestamp, since every game mode's rotations
+    # start and end at the same times
+    return datetime.datetime.fromtimestamp(int(stamp))
+
+
+# Every (name, key) tuple made by get_label
+LABELS = {}
+
+
+def get_label(data):
+    # A shared (name, key) tuple for a rule or game mode from SplatNet
+    label = (data['name'], data['key'])
+    return LABELS.setdefault(label, label)
 
 
 class Match:
+    __slots__ = ('result', 'stage', 'ruleset', 'gamemode', 'weapon')
+
     def __init__(self, data):
-        self.result = data['my_team_result']['key']
-        self.stage = Stage(data['stage'])
-        self.ruleset = data['rule']['name']
-        self.gamemode = data['game_mode']['name']
-        self.symbol = 'W' if self.result == 'victory' else 'L'
-        self.weapon = data['player_result']['player']['weapon']['name']
+        self.result = sys.intern(data['my_team_result']['key'])
+        self.stage = Stage.get(data['stage'])
+        self.ruleset = sys.intern(data['rule']['name'])
+        self.gamemode = sys.intern(data['game_mode']['name'])
+        self.weapon = sys.intern(data['player_result']['player']['weapon']['name'])
+
+    @property
+    def symbol(self):
+        return 'W' if self.result == 'victory' else 'L'
 
     def __str__(self):
         return f'{self.result.capitalize()}: {self.gamemode} {self.ruleset} on {str(self.stage)}'
@@ -73,9 +155,7 @@ class Match:
 
 
 class GenericScheduleItem:
-    start = None
-    end = None
-    start_stamp = None
+    __slots__ = ('start', 'end', 'start_stamp')
 
     def time_range(self):
         time_format = '%b %-d %-I:%M%p'
@@ -95,22 +175,19 @@ class GenericScheduleItem:
             return (now - self.end, 'ago')
 
     def __init__(self, entry):
-        self.start = datetime.datetime.fromtimestamp(int(entry['start_time']))
-        self.end = datetime.datetime.fromtimestamp(int(entry['end_time']))
+        self.start = get_time(entry['start_time'])
+        self.end = get_time(entry['end_time'])
         self.start_stamp = entry['start_time']
 
 
 class ScheduleItem(GenericScheduleItem):
-    ruleset = None
-    gamemode = None
-    stages = []
+    __slots__ = ('ruleset', 'gamemode', 'stages')
 
     def __init__(self, entry):
-        self.ruleset = (entry['rule']['name'], entry['rule']['key'])
-        self.gamemode = (entry['game_mode']['name'], entry['game_mode']['key'])
-        self.stages = [Stage(x) for x in [entry['stage_a'], entry['stage_b']]]
-        self.start = datetime.datetime.fromtimestamp(int(entry['start_time']))
-        self.end = datetime.datetime.fromtimestamp(int(entry['end_time']))
+        super().__init__(entry)
+        self.ruleset = get_label(entry['rule'])
+        self.gamemode = get_label(entry['game_mode'])
+        self.stages = (Stage.get(entry['stage_a']), Stage.get(entry['stage_b']))
 
     def __str__(self):
         gamemode = self.gamemode[0]
@@ -124,13 +201,11 @@ class ScheduleItem(GenericScheduleItem):
 
 
 class SalmonScheduleItem(GenericScheduleItem):
-    weapons = None
-    stage = None
+    __slots__ = ('weapons', 'stage')
 
     def __init__(self, entry):
-        self.stage = entry['stage']['name']
-        self.start = datetime.datetime.fromtimestamp(int(entry['start_time']))
-        self.end = datetime.datetime.fromtimestamp(int(entry['end_time']))
+        super().__init__(entry)
+        self.stage = sys.intern(entry['stage']['name'])
         self.weapons = get_salmon_weapons(entry['weapons'])
 
     def __str__(self):
@@ -143,11 +218,7 @@ class SalmonScheduleItem(GenericScheduleItem):
 
 
 def combine_gamemodes(schedule):
-    all_entries = []
-    for gamemode in schedule.values():
-        all_entries += gamemode
-
-    return all_entries
+    return [entry for gamemode in schedule.values() for entry in gamemode]
 
 
 def search_schedule(focus, *args, schedule_=None):
@@ -161,8 +232,8 @@ def get_current_stages():
     schedule = get_schedule()
     current_stages = []
 
-    for gamemode in GAMEMODES:
-        current_entries = schedule[gamemode['id']]
+    for gamemode in splatoon_data.GAMEMODES.ids():
+        current_entries = schedule[gamemode]
         first = [ScheduleItem(x) for x in current_entries][0]
         current_stages.append(first)
 
@@ -171,13 +242,14 @@ def get_current_stages():
 
 def stages_notification(blocks, include_gamemode=True, include_ruleset=False,
                         include_stage=False, include_time=True, return_sentence=True):
-    with open('data/splatoon2/gamemodes.json') as file_:
-        gamemodes = json.loads(file_.read())
+    by_gamemode = {}
+    for block in blocks:
+        by_gamemode.setdefault(block.gamemode[1], []).append(block)
 
     result = []
 
-    for gamemode in gamemodes:
-        current_blocks = [x for x in blocks if gamemode['id'] == x.gamemode[1]]
+    for gamemode in splatoon_data.GAMEMODES.all():
+        current_blocks = by_gamemode.get(gamemode['id'], [])
 
         if len(current_blocks) == 0:
             continue
@@ -204,36 +276,363 @@ def stages_notification(blocks, include_gamemode=True, include_ruleset=False,
     return '. '.join(result) if return_sentence else result
 
 
-def get_schedule_objects():
-    return {key: value for key, value in [(mode, [ScheduleItem(x) for x in entries]) for mode, entries in get_schedule().items()]}
+def get_schedule_objects(schedule=None):
+    schedule = get_schedule() if schedule is None else schedule
+    return {key: value for key, value in [(mode, [ScheduleItem(x) for x in entries]) for mode, entries in schedule.items()]}
+
+
+class ScheduleIndex:
+    '''Every ScheduleItem of a schedule sorted by start time, with the
+    positions of the items for each game mode, ruleset and stage, so
+    filtered searches do not scan the whole schedule.
+    '''
+
+    def __init__(self, schedule):
+        self.items = sorted(combine_gamemodes(get_schedule_objects(schedule)), key=lambda x: x.start)
+
+        # ('gamemode', key), ('ruleset', key) or ('stage', id) -> sorted
+        # positions in items
+        self.positions = {}
+
+        # Stage id -> Stage, and lowercased stage name -> stage id, for
+        # every stage in the schedule
+        self.stages = {}
+        self.stage_ids = {}
+
+        for i, item in enumerate(self.items):
+            keys = [('gamemode', item.gamemode[1]), ('ruleset', item.ruleset[1])]
+            keys += [('stage', x.sid) for x in item.stages]
+            for key in keys:
+                self.positions.setdefault(key, []).append(i)
+
+            for stage in item.stages:
+                self.stages[stage.sid] = stage
+                self.stage_ids[stage.name.lower()] = stage.sid
+
+    def matching(self, field, keys):
+        # Positions of the items where field is any of keys
+        result = set()
+        for key in keys:
+            result.update(self.positions.get((field, key), []))
+
+        return result
+
+    def search(self, gamemodes=(), rulesets=(), stages=()):
+        '''Items in any of gamemodes, in any of rulesets and on any of
+        stages (ids), by start time. An empty filter allows everything.
+        '''
+        found = None
+        for field, keys in [('gamemode', gamemodes), ('ruleset', rulesets), ('stage', stages)]:
+            if len(keys) == 0:
+                continue
+
+            positions = self.matching(field, keys)
+            found = positions if found is None else found & positions
+
+        if found is None:
+            return list(self.items)
+
+        return [self.items[i] for i in sorted(found)]
+
+    def next_rotation(self, stage, rulesets=(), gamemodes=()):
+        '''The first item that has not ended on stage (an id), optionally
+        only in some rulesets or gamemodes, or None if it is not scheduled.
+        '''
+        now = datetime.datetime.now()
+        for item in self.search(gamemodes, rulesets, (stage,)):
+            if item.end > now:
+                return item
+
+        return None
+
+    def find_stage(self, text):
+        '''The id of the stage best matching text (an id or a full, partial
+        or misspelled name), or None. Stages in stages.json are found even
+        when they are not in the schedule.
+        '''
+        stage_ids = {x['name'].lower(): x['id'] for x in splatoon_data.STAGES.all()}
+        stage_ids.update(self.stage_ids)
+
+        text = text.lower().strip()
+        if ('stage', text) in self.positions or text in splatoon_data.STAGES:
+            return text
+
+        if text in stage_ids:
+            return stage_ids[text]
+
+        # Names with a word starting with text, then names containing it
+        names = sorted(stage_ids)
+        for found in [[x for x in names if any(y.startswith(text) for y in x.split())], [x for x in names if text in x]]:
+            if len(found) > 0:
+                return stage_ids[found[0]]
+
+        close = difflib.get_close_matches(text, names, n=1, cutoff=STAGE_CUTOFF)
+        if len(close) > 0:
+            return stage_ids[close[0]]
+
+        return None
 
 
 def call_splatoon_api(path, user):
-    url = f'https://app.splatoon2.nintendo.net{path}'
+    url = f'{SPLATNET_URL}{path}'
     cookie = user['cookie']
-    req = requests.get(url, cookies={'iksm_session': cookie})
+    data = requests.get(url, cookies={'iksm_session': cookie}).json()
 
-    if 'code' in req.json().keys():
+    if 'code' in data.keys():
         # cookie expired, get a new one
         nickname, new_cookie = iksm.get_cookie(user['session_token'])
 
-        iksm.update_users({user['uid']: {'cookie': new_cookie}})
+        iksm.save_cookie(user['uid'], new_cookie, time.time())
+
+        data = requests.get(url, cookies={'iksm_session': new_cookie}).json()
+
+    return data
+
+
+def get_splatnet_session():
+    '''Returns the aiohttp session for SplatNet, creating it the first
+    time. Its connections are kept open between requests, and it keeps
+    no cookies since each request sends its own user's iksm_session.
+    Must be called from a coroutine.
+    '''
+    global SPLATNET_SESSION
+    if SPLATNET_SESSION is None or SPLATNET_SESSION.closed:
+        connector = aiohttp.TCPConnector(limit_per_host=SPLATNET_CONNECTIONS, keepalive_timeout=SPLATNET_KEEPALIVE)
+        SPLATNET_SESSION = aiohttp.ClientSession(connector=connector, cookie_jar=aiohttp.DummyCookieJar(), timeout=SPLATNET_TIMEOUT)
+
+    return SPLATNET_SESSION
 
-        req = requests.get(url, cookies={'iksm_session': new_cookie})
 
-    return req.json()
+async def call_splatoon_api_async(path, uid, user, read=None):
+    # Async version of call_splatoon_api for the Discord user uid, whose
+    # data from iksm.get_user is user. The response is decoded once, and
+    # the cookie comes from splatnet_cookies.COOKIES. read is an optional
+    # coroutine function that reads the aiohttp response instead and
+    # returns a dict, with 'code' in it if SplatNet turned the cookie down.
+    # Raises iksm.CookieError if SplatNet turns down the renewed cookie too.
+    url = f'{SPLATNET_URL}{path}'
+    session = get_splatnet_session()
+
+    async def request(cookie):
+        async with session.get(url, headers={'Cookie': f'iksm_session={cookie}'}) as res:
+            if read is not None:
+                return await read(res)
+
+            return await res.json(content_type=None)
+
+    cookie = await splatnet_cookies.COOKIES.get_cookie(session, uid, user)
+    data = await throttle.SCHEDULER.fetch(('GET', url, str(uid), read is None), url, lambda: request(cookie))
+
+    if 'code' in data.keys():
+        # cookie expired, get a new one
+        metrics.increment('splatnet.cookies.rejected')
+        cookie = await splatnet_cookies.COOKIES.refresh(session, uid, cookie)
+        data = await request(cookie)
+
+        if 'code' in data.keys():
+            raise iksm.CookieError(f'SplatNet turned down the new cookie of {uid}: {data["code"]}')
+
+    return data
+
+
+async def fetch_for_users(path, uids, read=None):
+    '''Gets path from SplatNet for every Discord user in uids at once.
+    read is an optional coroutine function called with a uid and the
+    aiohttp response, to read it instead of decoding all of it (see
+    call_splatoon_api_async).
+
+    Returns (users, unregistered, failed): users is a list of each linked
+    user's data from iksm.get_user, with 'uid' and the 'response' (or
+    what read returned) added, in the order of uids. unregistered is a
+    list of the uids without a linked Nintendo account, and failed a dict
+    of uids to the exception that stopped their request.
+    '''
+    found = await asyncio.gather(*[iksm.get_user_async(tools.get_session(), x) for x in uids])
+
+    users = []
+    unregistered = []
+    for uid, data in zip(uids, found):
+        if data is None or data.get('cookie', None) is None:
+            unregistered.append(uid)
+        else:
+            users.append(dict(uid=uid, **data))
+
+    readers = [None if read is None else functools.partial(read, x['uid']) for x in users]
+    responses = await asyncio.gather(*[call_splatoon_api_async(path, x['uid'], x, y) for x, y in zip(users, readers)], return_exceptions=True)
+
+    linked = []
+    failed = {}
+    for user, response in zip(users, responses):
+        if isinstance(response, (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError, iksm.CookieError)):
+            failed[user['uid']] = response
+        elif isinstance(response, BaseException):
+            raise response
+        else:
+            user['response'] = response
+            linked.append(user)
+
+    return linked, unregistered, failed
+
+
+async def read_results(uid, res):
+    # /api/results with only the fields match_history keeps
+    return await json_stream.load(res, RESULT_FIELDS, arrays=['results'])
+
+
+async def read_records(uid, res):
+    # /api/records with only the fields get_ranks reads
+    return await json_stream.load(res, RECORD_FIELDS)
+
+
+async def read_salmon_results(uid, res):
+    # Reads /api/coop_results as it arrives and adds the shifts uid has
+    # played since the last time to salmon_history. Shifts come newest
+    # first, so the rest of the response is skipped once a stored one
+    # comes up.
+    newest = salmon_history.last_job(uid)
+    rows = []
+    async for key, value in json_stream.iter_object(res, arrays=['results'], fields=SALMON_RESULT_FIELDS):
+        if key == 'code':
+            return {'code': value}
+
+        if key == 'results':
+            if int(value['job_id']) <= newest:
+                break
+
+            rows.append(salmon_history.parse_shift(uid, value))
+
+    return {'added': salmon_history.add(uid, rows)}
 
 
 def get_schedule():
     path = '/api/schedules'
-    user = iksm.get_user('580157651548241940')
-    return call_splatoon_api(path, user)
+    user = iksm.get_user(SCHEDULE_ACCOUNT)
+    return call_splatoon_api(path, dict(uid=SCHEDULE_ACCOUNT, **user))
 
 
 def get_salmon_schedule():
     path = '/api/coop_schedules'
-    user = iksm.get_user('580157651548241940')
-    return call_splatoon_api(path, user)
+    user = iksm.get_user(SCHEDULE_ACCOUNT)
+    return call_splatoon_api(path, dict(uid=SCHEDULE_ACCOUNT, **user))
+
+
+async def get_schedule_async():
+    user = await iksm.get_user_async(tools.get_session(), SCHEDULE_ACCOUNT)
+    return await call_splatoon_api_async('/api/schedules', SCHEDULE_ACCOUNT, user)
+
+
+async def get_salmon_schedule_async():
+    user = await iksm.get_user_async(tools.get_session(), SCHEDULE_ACCOUNT)
+    return await call_splatoon_api_async('/api/coop_schedules', SCHEDULE_ACCOUNT, user)
+
+
+class RotationCache:
+    '''Keeps one schedule from SplatNet (a dict of lists of entries with
+    start_time and end_time), loaded by the coroutine function loader,
+    in memory until its earliest entry ends.
+
+    When a rotation ends, the finished entries are dropped from the
+    cached schedule so it is still served right away, and a new one is
+    fetched in the background ROTATION_DELAY seconds later, once SplatNet
+    has published the rotation that was added. A failed refresh is tried
+    again every REFRESH_RETRY seconds.
+    '''
+
+    def __init__(self, name, loader, build=None):
+        self.name = name
+        self.loader = loader
+
+        # Called with every new schedule, its result is kept as index
+        self.build = build
+        self.index = None
+
+        self.schedule = None
+        self.expires = 0
+        self.loading = None
+        self.refresh_task = None
+
+        metrics.gauge(f'{name}.expires_in', lambda: max(0, round(self.expires - time.time())))
+
+    def count(self, event):
+        metrics.increment(f'{self.name}.{event}')
+
+    def ready(self):
+        # True if get will answer from memory
+        return self.lookup(count=False) is not None
+
+    def lookup(self, count=True):
+        if self.schedule is None:
+            return None
+
+        now = time.time()
+        if now >= self.expires:
+            schedule = current_entries(self.schedule, now)
+            if any(len(x) == 0 for x in schedule.values()):
+                return None
+
+            self.store(schedule)
+
+        return self.schedule
+
+    def store(self, schedule):
+        self.schedule = schedule
+        self.expires = min(int(x['end_time']) for entries in schedule.values() for x in entries)
+        if self.build is not None:
+            self.index = self.build(schedule)
+
+    async def get(self):
+        '''Returns the schedule, fetching it first if nothing usable is
+        cached. Concurrent fetches share one request.
+        '''
+        schedule = self.lookup()
+        if schedule is not None:
+            self.count('hits')
+            return schedule
+
+        self.count('misses')
+        if self.loading is None:
+            self.loading = asyncio.ensure_future(self.load())
+            self.loading.add_done_callback(lambda x: setattr(self, 'loading', None))
+
+        return await asyncio.shield(self.loading)
+
+    async def get_index(self):
+        '''Returns what build made of the schedule get returns.
+        '''
+        await self.get()
+        return self.index
+
+    async def load(self):
+        self.store(await self.loader())
+        self.schedule_refresh(self.expires + ROTATION_DELAY - time.time())
+        return self.schedule
+
+    def schedule_refresh(self, delay):
+        if self.refresh_task is not None:
+            self.refresh_task.cancel()
+
+        self.refresh_task = asyncio.ensure_future(self.refresh(max(0, delay)))
+
+    async def refresh(self, delay):
+        await asyncio.sleep(delay)
+        self.refresh_task = None
+
+        try:
+            await self.load()
+            self.count('refreshes')
+        except Exception as err:
+            self.count('refresh_errors')
+            print(f'Could not refresh {self.name}: {err!r}')
+            self.schedule_refresh(REFRESH_RETRY)
+
+
+def current_entries(schedule, now):
+    # The entries of schedule that have not ended at now
+    return {key: [x for x in entries if int(x['end_time']) > now] for key, entries in schedule.items()}
+
+
+SCHEDULE_CACHE = RotationCache('splatoon.schedule', get_schedule_async, ScheduleIndex)
+SALMON_SCHEDULE_CACHE = RotationCache('splatoon.salmon_schedule', get_salmon_schedule_async)
 
 
 def get_matches(results):
@@ -257,16 +656,67 @@ def get_records(user):
 
 
 def get_ranks(records):
-    modes = [
-        ('Splat Zones', 'udemae_zones'),
-        ('Tower Control', 'udemae_tower'),
-        ('Rainmaker', 'udemae_rainmaker'),
-        ('Clam Blitz', 'udemae_clam')
-    ]
-
-    return {display: records['records']['player'][key]['name'] for display, key in modes}
+    return {display: records['records']['player'][key]['name'] for display, key in RANK_MODES}
 
 
 if __name__ == '__main__':
-    pass
+    # Benchmark: filtered searches with search_schedule and ScheduleIndex
+    # over a week of made-up rotations, and the size of a ScheduleItem
+    import random
+    import statistics
+    import tracemalloc
+
+    all_stages = splatoon_data.STAGES.all()
+
+    rand = random.Random(0)
+    rulesets = [x for x in splatoon_data.RULESETS.ids() if x != 'turf_war']
+    start = int(time.time())
+    schedule = {x: [] for x in splatoon_data.GAMEMODES.ids()}
+    for i in range(7 * 12):
+        for gamemode, entries in schedule.items():
+            ruleset = 'turf_war' if gamemode == 'regular' else rand.choice(rulesets)
+            stage_a, stage_b = rand.sample(all_stages, 2)
+            entries.append({
+                'start_time': start + i * 7200,
+                'end_time': start + (i + 1) * 7200,
+                'rule': {'name': ruleset, 'key': ruleset},
+                'game_mode': {'name': gamemode, 'key': gamemode},
+                'stage_a': stage_a,
+                'stage_b': stage_b
+            })
+
+    queries = [({rand.choice(splatoon_data.GAMEMODES.ids())}, {rand.choice(rulesets)}) for i in range(200)]
+
+    def timed(function):
+        times = []
+        for query in queries:
+            begin = time.perf_counter()
+            function(*query)
+            times.append(time.perf_counter() - begin)
+
+        return f'p50 {statistics.median(times) * 1e6:.0f}us, p99 {metrics.percentile(times, 0.99) * 1e6:.0f}us'
+
+    def linear(gamemodes, rulesets):
+        found = search_schedule(lambda x: x.gamemode[1], *gamemodes, schedule_=[ScheduleItem(x) for x in combine_gamemodes(schedule)])
+        return search_schedule(lambda x: x.ruleset[1], *rulesets, schedule_=found)
+
+    begin = time.perf_counter()
+    index = ScheduleIndex(schedule)
+    print(f'ScheduleIndex: built in {(time.perf_counter() - begin) * 1000:.1f}ms for {len(index.items)} rotations')
+
+    assert all([str(x) for x in linear(*query)] == [str(x) for x in index.search(*query)] for query in queries)
+    print(f'search_schedule: {timed(linear)}')
+    print(f'ScheduleIndex.search: {timed(index.search)}')
+    print(f'find_stage("skiper pavillion"): {index.stages[index.find_stage("skiper pavillion")]}')
+
+    entries = combine_gamemodes(json.loads(json.dumps(schedule))) * 40
+    tracemalloc.start()
+    items = [ScheduleItem(x) for x in entries]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    begin = time.perf_counter()
+    items = [ScheduleItem(x) for x in entries]
+    took = time.perf_counter() - begin
+    print(f'ScheduleItem: {size / len(entries):.0f} bytes and {took / len(entries) * 1e6:.2f}us each')
 
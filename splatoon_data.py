@@ -0,0 +1,86 @@
+# Splatoon 2 reference data: the game modes, rulesets and stages in
+# data/splatoon2. Each file is read once and looked up by id from memory,
+# and read again when it changes on disk, so it can be edited without
+# restarting the bot.
+
+import json
+import os
+import time
+
+DATA_DIR = 'data/splatoon2'
+
+# The files are checked for changes at most this often, in seconds
+CHECK_INTERVAL = 5
+
+
+class ReferenceFile:
+    '''A JSON list of objects, each identified by its key field.
+    '''
+
+    def __init__(self, filename, key):
+        self.path = os.path.join(DATA_DIR, filename)
+        self.key = key
+
+        self.items = []
+        self.by_id = {}
+        self.by_name = {}
+
+        self.mtime = None
+        self.checked = None
+
+    def refresh(self):
+        # Reloads the file if it has changed since it was last read
+        now = time.monotonic()
+        if self.checked is not None and now - self.checked < CHECK_INTERVAL:
+            return
+
+        self.checked = now
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime == self.mtime:
+            return
+
+        try:
+            with open(self.path) as file_:
+                items = json.loads(file_.read())
+        except ValueError as err:
+            # Probably caught halfway through being saved, keep what was
+            # loaded before and try again next time
+            if self.mtime is None:
+                raise
+
+            print(f'Could not reload {self.path}: {err!r}')
+            return
+
+        self.items = items
+        self.by_id = {x[self.key]: x for x in items}
+        self.by_name = {x['name'].lower(): x for x in items}
+        self.mtime = mtime
+
+    def all(self):
+        '''Every item, in the order of the file.
+        '''
+        self.refresh()
+        return self.items
+
+    def ids(self):
+        self.refresh()
+        return list(self.by_id)
+
+    def get(self, id, default=None):
+        self.refresh()
+        return self.by_id.get(id, default)
+
+    def find(self, name, default=None):
+        '''The item called name, ignoring case.
+        '''
+        self.refresh()
+        return self.by_name.get(name.lower(), default)
+
+    def __contains__(self, id):
+        self.refresh()
+        return id in self.by_id
+
+
+GAMEMODES = ReferenceFile('gamemodes.json', 'id')
+RULESETS = ReferenceFile('rulesets.json', 'key')
+STAGES = ReferenceFile('stages.json', 'id')
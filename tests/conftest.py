@@ -0,0 +1,21 @@
+# The bot's modules live at the top of the repository and read
+# credentials.json and data/ from the working directory. Tests run in a
+# temporary directory with made-up credentials, so nothing real is read
+# or written.
+
+import json
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORKDIR = tempfile.mkdtemp(prefix='chamosbot-tests-')
+os.makedirs(os.path.join(WORKDIR, 'data'))
+os.symlink(os.path.join(ROOT, 'data', 'splatoon2'), os.path.join(WORKDIR, 'data', 'splatoon2'))
+
+with open(os.path.join(WORKDIR, 'credentials.json'), 'w') as file:
+    json.dump({'apikey': 'test-key', 'discord-token': ''}, file)
+
+os.chdir(WORKDIR)
@@ -0,0 +1,26 @@
+# A local stand-in for the web services the bot talks to
+
+import contextlib
+
+from aiohttp import web
+
+
+@contextlib.asynccontextmanager
+async def serve(routes):
+    '''Serves routes, a list of (path, handler) pairs for GET requests, on
+    a free local port. Yields the base URL.
+    '''
+    app = web.Application()
+    for path, handler in routes:
+        app.router.add_get(path, handler)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, 'localhost', 0)
+    await site.start()
+
+    host, port = runner.addresses[0][:2]
+    try:
+        yield f'http://localhost:{port}'
+    finally:
+        await runner.cleanup()
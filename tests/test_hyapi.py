@@ -0,0 +1,136 @@
+import asyncio
+import time
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+import hyapi
+import metrics
+from standin import serve
+
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+def player_handler(requests, limit=None, headers=None):
+    # Answers /player like api.hypixel.net, allowing limit requests per
+    # key each second, and records the key of every request
+    used = {}
+    windows = {}
+
+    async def handler(request):
+        key = request.query['key']
+        requests.append(key)
+        if time.monotonic() - windows.get(key, 0) >= 1:
+            windows[key] = time.monotonic()
+            used[key] = 0
+
+        used[key] += 1
+
+        if limit is not None and used[key] > limit:
+            return web.json_response({'success': False, 'cause': 'Key throttle'}, status=429, headers=headers)
+
+        remaining = {} if limit is None else {'RateLimit-Remaining': str(limit - used[key]), 'RateLimit-Reset': '1'}
+        return web.json_response({'success': True, 'player': {'uuid': request.query['uuid']}}, headers=remaining)
+
+    return handler
+
+
+async def get_players(url, uuids):
+    async with aiohttp.ClientSession() as session:
+        return await asyncio.gather(*[hyapi.get_player(session, x) for x in uuids])
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    def make(keys):
+        scheduler = hyapi.KeyScheduler(keys)
+        monkeypatch.setattr(hyapi, 'SCHEDULER', scheduler)
+        return scheduler
+
+    return make
+
+
+def test_requests_are_spread_across_keys(monkeypatch, scheduler):
+    scheduler(['a', 'b'])
+    requests = []
+
+    async def main():
+        async with serve([('/player', player_handler(requests))]) as url:
+            monkeypatch.setattr(hyapi, 'API_URL', url)
+            return await get_players(url, ['u1', 'u2', 'u3', 'u4'])
+
+    players = run(main())
+    assert [x['uuid'] for x in players] == ['u1', 'u2', 'u3', 'u4']
+    assert sorted(requests) == ['a', 'a', 'b', 'b']
+
+
+def test_key_with_more_remaining_is_used_first(scheduler):
+    keys = scheduler(['a', 'b'])
+    keys.update('a', {'RateLimit-Remaining': '3', 'RateLimit-Reset': '60'}, 200)
+    keys.update('b', {'RateLimit-Remaining': '10', 'RateLimit-Reset': '60'}, 200)
+
+    assert run(keys.acquire()) == 'b'
+    assert keys.remaining['b'] == 9
+
+
+def test_429_waits_for_retry_after(monkeypatch, scheduler):
+    keys = scheduler(['a'])
+    requests = []
+    handler = player_handler(requests, limit=0, headers={'Retry-After': '1'})
+
+    async def answer(request):
+        # Throttled once, then let through
+        if len(requests) == 0:
+            return await handler(request)
+
+        requests.append(request.query['key'])
+        return web.json_response({'success': True, 'player': {'uuid': request.query['uuid']}})
+
+    async def main():
+        async with serve([('/player', answer)]) as url:
+            monkeypatch.setattr(hyapi, 'API_URL', url)
+            start = time.monotonic()
+            players = await get_players(url, ['u1'])
+            return players, time.monotonic() - start
+
+    players, took = run(main())
+    assert players == [{'uuid': 'u1'}]
+    assert requests == ['a', 'a']
+    assert 0.9 <= took < hyapi.DEFAULT_RESET
+    assert keys.remaining['a'] is None
+
+
+def test_requests_queue_when_every_key_is_used_up(monkeypatch, scheduler):
+    scheduler(['a', 'b'])
+    requests = []
+    queued = metrics.COUNTERS['hyapi.queued']
+
+    async def main():
+        async with serve([('/player', player_handler(requests, limit=1))]) as url:
+            monkeypatch.setattr(hyapi, 'API_URL', url)
+            start = time.monotonic()
+            players = await get_players(url, ['u1', 'u2', 'u3'])
+            return players, time.monotonic() - start
+
+    players, took = run(main())
+    assert [x['uuid'] for x in players] == ['u1', 'u2', 'u3']
+    assert metrics.COUNTERS['hyapi.queued'] > queued
+    assert took >= 0.9
+
+
+def test_failed_request_raises(monkeypatch, scheduler):
+    scheduler(['a'])
+
+    async def answer(request):
+        return web.json_response({'success': False, 'cause': 'Invalid API key'}, status=403)
+
+    async def main():
+        async with serve([('/player', answer)]) as url:
+            monkeypatch.setattr(hyapi, 'API_URL', url)
+            await get_players(url, ['u1'])
+
+    with pytest.raises(hyapi.HypixelAPIError, match='Invalid API key'):
+        run(main())
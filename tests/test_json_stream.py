@@ -0,0 +1,97 @@
+import json
+import random
+
+import pytest
+
+import json_stream
+
+DOCUMENT = {
+    'results': [
+        {'job_id': 1, 'danger_rate': 181.2, 'x_power': 2345.6, 'win_meter': 1.5e3, 'tiny': -2.5e-07},
+        {'job_id': 2, 'danger_rate': 60.0, 'x_power': None, 'win_meter': 0.0, 'name': 'é "q" ]}'}
+    ],
+    'summary': {'average': 12.75, 'count': 2},
+    'total': 10.125
+}
+
+
+def feed_all(stream, pieces):
+    pairs = []
+    for piece in pieces:
+        pairs += stream.feed(piece)
+
+    stream.close()
+    return pairs
+
+
+def collect(pairs, arrays):
+    result = {x: [] for x in arrays}
+    for key, value in pairs:
+        if key in arrays:
+            result[key].append(value)
+        else:
+            result[key] = value
+
+    return result
+
+
+@pytest.mark.parametrize('indent', [None, 2])
+def test_every_split_point(indent):
+    text = json.dumps(DOCUMENT, indent=indent)
+    for split in range(1, len(text)):
+        pairs = feed_all(json_stream.ObjectStream(['results']), [text[:split], text[split:]])
+        assert collect(pairs, ['results']) == DOCUMENT, split
+
+
+def test_float_split_inside_an_array():
+    pairs = feed_all(json_stream.ObjectStream(['a']), ['{"a": [1.', '5, 2], "b": 3}'])
+    assert pairs == [('a', 1.5), ('a', 2), ('b', 3)]
+
+    pairs = feed_all(json_stream.ObjectStream(['a']), ['{"a": [1.5', 'e3, 2], "b": 3}'])
+    assert pairs == [('a', 1500.0), ('a', 2), ('b', 3)]
+
+
+def test_random_chunks_with_fields():
+    rand = random.Random(0)
+    spec = json_stream.fields('results.danger_rate', 'results.name', 'total')
+    text = json.dumps(DOCUMENT)
+    expected = json_stream.select(DOCUMENT, spec)
+    for trial in range(200):
+        pieces = []
+        i = 0
+        while i < len(text):
+            size = rand.randint(1, 12)
+            pieces.append(text[i:i + size])
+            i += size
+
+        pairs = feed_all(json_stream.ObjectStream(['results'], spec), pieces)
+        assert collect(pairs, ['results']) == expected
+
+
+def test_object_that_ends_early():
+    stream = json_stream.ObjectStream()
+    stream.feed('{"a": 1.5')
+    with pytest.raises(ValueError):
+        stream.close()
+
+
+def test_large_field_is_scanned(monkeypatch):
+    # Fields longer than SCAN_AFTER are scanned for their end, past
+    # brackets and quotes inside strings
+    monkeypatch.setattr(json_stream, 'SCAN_AFTER', 16)
+    document = {'records': {'player': {'rank': 'S+', 'power': 2100.5}, 'stats': [{'name': 'x"]}[{\\', 'n': i} for i in range(30)]},
+                'code': None}
+    text = json.dumps(document)
+    spec = json_stream.fields('records.player', 'code')
+    for size in [1, 7, 64]:
+        pieces = [text[i:i + size] for i in range(0, len(text), size)]
+        pairs = feed_all(json_stream.ObjectStream((), spec), pieces)
+        assert dict(pairs) == json_stream.select(document, spec)
+
+
+def test_malformed_large_field(monkeypatch):
+    monkeypatch.setattr(json_stream, 'SCAN_AFTER', 4)
+    stream = json_stream.ObjectStream()
+    stream.feed('{"a": {"b": [1, 2')
+    with pytest.raises(ValueError):
+        stream.feed(', }]}, "c": 1}')
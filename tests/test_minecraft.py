@@ -0,0 +1,149 @@
+import asyncio
+import base64
+import json
+import os
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+import minecraft
+from standin import serve
+
+UUIDS = [f'{i:032x}' for i in range(1, 4)]
+
+RENDER = b'PNG' * 400
+
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+class StandIn:
+    # Answers like the session server (/session/<uuid>) and visage
+    # (/<kind>/<size>/<uuid>). skins maps uuids to the id of their skin
+    # texture, and every request path is recorded.
+    def __init__(self, delay=0):
+        self.skins = {x: f'skin{x[-2:]}' for x in UUIDS}
+        self.requests = []
+        self.delay = delay
+
+    def routes(self):
+        return [('/session/{uuid}', self.session), ('/{kind}/{size}/{uuid}', self.render)]
+
+    async def session(self, request):
+        uuid = request.match_info['uuid']
+        self.requests.append(request.path)
+
+        textures = {'textures': {'SKIN': {'url': f'http://textures.minecraft.net/texture/{self.skins[uuid]}'}}}
+        value = base64.b64encode(json.dumps(textures).encode()).decode()
+        return web.json_response({'id': uuid, 'name': f'player{uuid[-2:]}', 'properties': [{'name': 'textures', 'value': value}]})
+
+    async def render(self, request):
+        self.requests.append(request.path)
+        await asyncio.sleep(self.delay)
+        return web.Response(body=RENDER)
+
+    def downloads(self):
+        return [x for x in self.requests if not x.startswith('/session/')]
+
+
+@pytest.fixture
+def skins(monkeypatch, tmp_path):
+    # Runs main(cache, standin, session) against a stand-in, with an empty
+    # cache in tmp_path that holds max_size bytes
+    def start(main, max_size=minecraft.SKIN_CACHE_SIZE, delay=0):
+        cache = minecraft.SkinCache(str(tmp_path), max_size)
+        standin = StandIn(delay)
+
+        async def wrapper():
+            async with serve(standin.routes()) as url:
+                monkeypatch.setattr(minecraft, 'VISAGE_URL', url)
+                monkeypatch.setattr(minecraft, 'SESSION_URL', f'{url}/session')
+                async with aiohttp.ClientSession() as session:
+                    return await main(cache, standin, session)
+
+        return run(wrapper())
+
+    return start
+
+
+def test_fresh_render_is_served_from_disk(skins):
+    async def main(cache, standin, session):
+        first = await cache.get(session, UUIDS[0], 'full', 256)
+        standin.requests.clear()
+        second = await cache.get(session, UUIDS[0], 'full', 256)
+        return first, second, standin.requests
+
+    first, second, requests = skins(main)
+    assert first == second
+    assert os.path.basename(first) == f'{UUIDS[0]}-full-256-skin01.png'
+    assert requests == []
+
+
+def test_stale_render_with_unchanged_skin_is_kept(monkeypatch, skins):
+    async def main(cache, standin, session):
+        first = await cache.get(session, UUIDS[0], 'full', 256)
+        monkeypatch.setattr(minecraft, 'SKIN_TTL', -1)
+        standin.requests.clear()
+
+        second = await cache.get(session, UUIDS[0], 'full', 256)
+        await asyncio.sleep(0.2)
+        return first, second, standin.requests
+
+    first, second, requests = skins(main)
+    assert first == second
+    assert os.path.exists(first)
+    # Only the session server is asked again, the render is still good
+    assert requests == [f'/session/{UUIDS[0]}']
+
+
+def test_changed_skin_downloads_a_new_render(monkeypatch, skins):
+    async def main(cache, standin, session):
+        first = await cache.get(session, UUIDS[0], 'full', 256)
+        monkeypatch.setattr(minecraft, 'SKIN_TTL', -1)
+        standin.skins[UUIDS[0]] = 'newskin'
+        standin.requests.clear()
+
+        # The stale render is served while the new one downloads
+        stale = await cache.get(session, UUIDS[0], 'full', 256)
+        await asyncio.sleep(0.2)
+        fresh = await cache.get(session, UUIDS[0], 'full', 256)
+        return first, stale, fresh, standin.downloads()
+
+    first, stale, fresh, downloads = skins(main)
+    assert stale == first
+    assert os.path.basename(fresh) == f'{UUIDS[0]}-full-256-newskin.png'
+    assert not os.path.exists(first)
+    assert downloads == [f'/full/256/{UUIDS[0]}']
+
+
+def test_least_recently_used_render_is_evicted(skins):
+    async def main(cache, standin, session):
+        paths = [await cache.get(session, x, 'full', 256) for x in UUIDS[:2]]
+        # The first render is used again, so the second is the oldest
+        await cache.get(session, UUIDS[0], 'full', 256)
+        paths.append(await cache.get(session, UUIDS[2], 'full', 256))
+        return cache, paths
+
+    cache, paths = skins(main, max_size=len(RENDER) * 2)
+    assert [os.path.exists(x) for x in paths] == [True, False, True]
+    assert cache.size == len(RENDER) * 2
+    assert sorted(cache.files) == sorted(os.path.basename(x) for x in [paths[0], paths[2]])
+
+
+def test_concurrent_misses_share_one_download(skins):
+    async def main(cache, standin, session):
+        paths = await asyncio.gather(*[cache.get(session, UUIDS[0], 'skin', 512) for i in range(5)])
+        return paths, standin.requests
+
+    paths, requests = skins(main, delay=0.1)
+    assert len(set(paths)) == 1
+    assert requests == [f'/session/{UUIDS[0]}', f'/skin/512/{UUIDS[0]}']
+
+
+def test_get_skin_hash_reads_the_texture_id(skins):
+    async def main(cache, standin, session):
+        return await minecraft.get_skin_hash(session, UUIDS[1])
+
+    assert skins(main) == 'skin02'
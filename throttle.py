@@ -0,0 +1,132 @@
+# Shared scheduler for outbound requests. Every host gets a token
+# bucket, so bursts of commands queue up instead of getting 429s from
+# upstream, and concurrent async callers asking for the same thing share
+# one request.
+
+import asyncio
+import time
+from urllib.parse import urlparse
+
+import requests
+
+import metrics
+
+# Requests per second and burst size for each host
+BUCKETS = {
+    'api.mojang.com': (1, 10),
+    'sessionserver.mojang.com': (1, 10),
+    'plancke.io': (2, 8),
+    'hystats.net': (1, 10),
+    'api.chess.com': (3, 10)
+}
+
+# How long a request may wait for its host's bucket before giving up
+DEFAULT_DEADLINE = 10
+
+
+class ThrottleTimeout(Exception):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self, deadline):
+        '''Takes a token and returns how many seconds to wait before using
+        it. Raises ThrottleTimeout (and keeps the token) if that is longer
+        than deadline.
+        '''
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        delay = max(0, (1 - self.tokens) / self.rate)
+        if delay > deadline:
+            raise ThrottleTimeout(f'Waited too long for a request slot ({delay:.1f}s needed)')
+
+        self.tokens -= 1
+        return delay
+
+
+class RequestScheduler:
+    def __init__(self, buckets):
+        self.buckets = {host: TokenBucket(*limits) for host, limits in buckets.items()}
+        self.in_flight = {}
+        self.queued = 0
+
+        metrics.gauge('throttle.queued', lambda: self.queued)
+        metrics.gauge('throttle.in_flight', lambda: len(self.in_flight))
+
+    def reserve(self, url, deadline):
+        host = urlparse(url).hostname
+        bucket = self.buckets.get(host)
+        if bucket is None:
+            return 0
+
+        try:
+            delay = bucket.reserve(deadline)
+        except ThrottleTimeout:
+            metrics.increment(f'throttle.{host}.timeouts')
+            raise
+
+        if delay > 0:
+            metrics.increment(f'throttle.{host}.delayed')
+
+        return delay
+
+    def get(self, url, deadline=DEFAULT_DEADLINE, **kwargs):
+        '''requests.get, after waiting for the host's bucket.
+        '''
+        self.wait(url, deadline)
+        return requests.get(url, **kwargs)
+
+    def post(self, url, deadline=DEFAULT_DEADLINE, **kwargs):
+        '''requests.post, after waiting for the host's bucket.
+        '''
+        self.wait(url, deadline)
+        return requests.post(url, **kwargs)
+
+    def wait(self, url, deadline):
+        delay = self.reserve(url, deadline)
+        if delay > 0:
+            self.queued += 1
+            try:
+                time.sleep(delay)
+            finally:
+                self.queued -= 1
+
+    async def fetch(self, key, url, request, deadline=DEFAULT_DEADLINE):
+        '''Runs request, a coroutine function that sends a request to url,
+        once the host's bucket allows it. Callers that pass the same key
+        while it is running get the same result instead of sending their
+        own request.
+        '''
+        future = self.in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self.run(key, url, request, deadline))
+            self.in_flight[key] = future
+        else:
+            metrics.increment(f'throttle.{urlparse(url).hostname}.coalesced')
+
+        return await asyncio.shield(future)
+
+    async def run(self, key, url, request, deadline):
+        try:
+            delay = self.reserve(url, deadline)
+            if delay > 0:
+                self.queued += 1
+                try:
+                    await asyncio.sleep(delay)
+                finally:
+                    self.queued -= 1
+
+            return await request()
+        finally:
+            del self.in_flight[key]
+
+
+SCHEDULER = RequestScheduler(BUCKETS)
@@ -3,6 +3,7 @@ from difflib import SequenceMatcher
 import re
 from subprocess import check_output
 
+import aiohttp
 from bs4 import BeautifulSoup
 import pytz
 import requests
@@ -11,6 +12,27 @@ import matrix
 
 Table = matrix.Table
 
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total=15)
+SESSION = None
+
+NUMBER_PATTERN = re.compile(r'\s*[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?\s*')
+
+# One {date: 'YYYY-MM-DD', fkdr: x, kdr: y, wlr: z} entry of HyStats'
+# monthlypvpdata. Only the order of the values matters, not the keys.
+MONTHLY_VALUE = r'\s*[^\s:{},]+\s*:\s*([^\s,}]+)\s*'
+MONTHLY_PATTERN = re.compile(r'\{\s*[^\s:{},]+\s*:\s*\'?(\d{4})-(\d{2})-(\d{2})\'?\s*,' + ','.join([MONTHLY_VALUE] * 3) + r'\}')
+
+def get_session():
+    '''Returns the aiohttp session shared by the whole bot, creating it
+    the first time. Must be called from a coroutine.
+    '''
+    global SESSION
+    if SESSION is None or SESSION.closed:
+        SESSION = aiohttp.ClientSession(timeout=HTTP_TIMEOUT)
+
+    return SESSION
+
+
 def get_localized_times(datetime_):
     '''Returns a list with localized datetimes for certain timezones.
     [0]: Los Angeles
@@ -31,6 +53,19 @@ def format_number(num):
         return '{:,.2f}'.format(num)
 
 
+def parse_number(string):
+    '''Parse a number the way Python would read it as a literal.
+    Returns an int or a float, or None if string is not a number.
+    '''
+    if NUMBER_PATTERN.fullmatch(string) is None:
+        return None
+
+    try:
+        return int(string)
+    except ValueError:
+        return float(string)
+
+
 def get_stat(dataset, stat):
     data = dataset
     for key in stat.split('.'):
@@ -39,43 +74,33 @@ def get_stat(dataset, stat):
     return data.replace(',', '')
 
 
-def sort_table(table, index):
-    def key(x):
-        try:
-            return float(x[index])
-        except ValueError:
-            # This happens for the first column, which
-            # is text. To make it stay first, set it to
-            # infinity
-            return float('inf')
-
-    zipped = list(zip(*table))
-    zipped.sort(key=key, reverse=True)
-
-    result = matrix.Table(just='right')
+def parse_monthly_data(string):
+    # For HyStats. Parses the variable for monthly stats into a list of
+    # (date, fkdr, kdr, wlr) tuples, newest first, in one pass over the
+    # string
+    result = []
+    for match in MONTHLY_PATTERN.finditer(string):
+        year, month, day, fkdr, kdr, wlr = match.groups()
+        date = datetime.datetime(int(year), int(month), int(day))
+        result.append((date, float(fkdr), float(kdr), float(wlr)))
 
-    for i in range(len(zipped[0])):
-        result.append([x[i] for x in zipped])
+    result.sort(key=lambda x: x[0], reverse=True)
 
     return result
 
 
-def parse_monthly_data(string):
-    # For HyStats. Parses the variable for monthly stats
-    result = []
-    start = string.index('[')
-    data = re.sub(r'\s|\[|\]', '', string[start:-1])
-    for element in data.split(',{'):
-        element = element.strip('}{')
-        date, fkdr, kdr, wlr = map(lambda x: x.split(':')[1], element.split(','))
-        fkdr, kdr, wlr = map(float, [fkdr, kdr, wlr])
-        date = date.strip('\'')
-        date = datetime.datetime.strptime(date, '%Y-%m-%d')
-        result.append((date, fkdr, kdr, wlr))
-    
-    result.sort(key=lambda x: x[0], reverse=True)
+def split_message(text, limit=1990):
+    '''Split text on line breaks into pieces short enough for one Discord
+    message.
+    '''
+    chunks = ['']
+    for line in text.split('\n'):
+        if len(chunks[-1]) + len(line) + 1 > limit and chunks[-1] != '':
+            chunks.append('')
 
-    return result
+        chunks[-1] += line + '\n'
+
+    return [x.rstrip('\n') for x in chunks]
 
 
 def english_list(_list, andor='and'):